@@ -1,114 +1,640 @@
 import numpy as np
 import heapq
+import multiprocessing
+import os
+import queue
 from math import log2
 import sys
 sys.path.append("..")  # This adds the parent directory to the system path
 from utils import *
-from game_2048 import is_goal, reconstruct_path, move, compress_board, decompress
+from game_2048 import is_goal, reconstruct_table_path, move_packed, compress_board, as_rng
+from transposition import new_table, table_find, table_insert, table_update, table_cost, table_key, table_parent, \
+    table_bytes, HASH_MULTIPLIER, DIRECTIONS
+from bitboard import has_rank
+from external_queue import new_queue, queue_push, queue_pop, queue_len, queue_close
+from stats import new_stats, timed, note_frontier, fire, section, export_stats, merge_stats
+from position_cache import as_cache, cache_lookup, cache_store, A_STAR_HEURISTIC
 
 # Author: Caleb L'Italien
-# Last edited: 11/19/2023
+# Last edited: 10/18/2026
 
-def a_star_search(initial_board, to_reach, max_depth=10000):
+def a_star_search(initial_board, to_reach, max_depth=10000, seed=None, table_capacity=1 << 16, max_table_bytes=None,
+                  workers=None, memory_budget=None, open_list_bytes=None, canonical=False, position_cache=None,
+                  stats=None):
     '''
     Uses A* to find a near-optimal sequence of moves that reaches the goal state.
+    The seed (or generator) drives every tile spawn, so a seeded search always plays out the same way.
+    Every board seen is kept in a transposition table (see transposition.py), which holds its cost and
+    parent; the search gives up (returns None) if the table would grow past max_table_bytes.
+    With a memory_budget (in bytes) the search keeps going instead: whenever the table and open list
+    outgrow it, the worst half of the open list is dropped (see prune_search).
+    With open_list_bytes set, the open list keeps about that much in memory and spills the rest to
+    temp files (see external_queue.py). This can't be combined with memory_budget, which prunes it instead.
+    The transposition table still grows with every board seen; bound it with max_table_bytes.
+    With canonical set, rotations and reflections of a board seen before are skipped (see bitboard.canonical).
+    With more than one worker, the search is split across processes (see parallel_a_star_search). That
+    search has none of memory_budget, open_list_bytes, canonical or position_cache, so they can't be given.
+    With a position_cache (see position_cache.py, or the path of one), heuristic values are read from and
+    written to it, so they are worked out once across processes and runs.
+    Counts and timings are added to stats (see stats.py), if given.
     '''
-    open_set = []
-    came_from = {}
-    cost_so_far = {}
+    if stats is None:
+        stats = new_stats()
+    if workers is not None and workers > 1:
+        if memory_budget is not None or open_list_bytes is not None or canonical or position_cache is not None:
+            raise ValueError("memory_budget, open_list_bytes, canonical and position_cache can't be used with "
+                             "more than one worker")
+        return parallel_a_star_search(initial_board, to_reach, workers, max_depth, seed, table_capacity, max_table_bytes,
+                                      stats)
+
+    if memory_budget is not None and open_list_bytes is not None:
+        raise ValueError("memory_budget and open_list_bytes can't be used together")
+    position_cache = as_cache(position_cache)
+    with section(stats):
+        if open_list_bytes is not None:
+            open_set = new_queue(open_list_bytes)
+            try:
+                return _a_star_loop(initial_board, to_reach, max_depth, seed, table_capacity, max_table_bytes, None,
+                                    canonical, open_set, queue_push, queue_pop, queue_len, position_cache, stats)
+            finally:
+                queue_close(open_set)
+        return _a_star_loop(initial_board, to_reach, max_depth, seed, table_capacity, max_table_bytes, memory_budget,
+                            canonical, [], heapq.heappush, heapq.heappop, len, position_cache, stats)
+
+
+def _a_star_loop(initial_board, to_reach, max_depth, seed, table_capacity, max_table_bytes, memory_budget,
+                 canonical, open_set, push, pop, size, position_cache, stats):
+    '''
+    The A* search itself, over an open list used through the given push, pop and size functions.
+    '''
+    rng = as_rng(seed)
+    try:
+        table = new_table(table_capacity, max_table_bytes, canonical)
+    except MemoryError:
+        return None
     start_state = compress_board(initial_board)
-    visited_states = set()  
+    start_entry = table_insert(table, start_state, 0)
 
-    heapq.heappush(open_set, (0, start_state))
-    came_from[start_state] = None
-    cost_so_far[start_state] = 0
-    visited_states.add(start_state) 
+    push(open_set, (0, start_state, start_entry))
+    expanded = 0
 
-    while open_set:
-        _, current_state = heapq.heappop(open_set)
+    while size(open_set):
+        expanded += 1
+        note_frontier(stats, size(open_set))
+        if memory_budget is not None and expanded % BUDGET_CHECK_INTERVAL == 0 and \
+                search_bytes(table, open_set) > memory_budget:
+            try:
+                table, open_set = prune_search(table, open_set)
+            except MemoryError:
+                return None  # Even the pruned table is over max_table_bytes
+
+        _, current_state, current_entry = pop(open_set)
 
         if is_goal(current_state, to_reach, True): 
-            return reconstruct_path(came_from, start_state, current_state, True)
+            return reconstruct_table_path(table, current_entry)
 
-        if cost_so_far[current_state] >= max_depth:
+        current_cost = table_cost(table, current_entry)
+        if current_cost >= max_depth:
             continue
+        stats['expanded'] += 1
+        fire(stats, 'expand', current_state)
 
-        current_board = decompress(current_state) 
         for direction in ['up', 'down', 'left', 'right']:
-            new_board, done = move(current_board, direction)
+            new_state, done = timed(stats, 'move', move_packed, current_state, direction, rng, stats)
             if not done:
                 continue 
+            stats['generated'] += 1
+
+            if table_find(table, new_state) >= 0:
+                stats['table_hits'] += 1
+                continue
+
+            new_cost = current_cost + 1 
+            try:
+                new_entry = table_insert(table, new_state, new_cost, current_entry, direction)
+            except MemoryError:
+                return None  # Out of table memory
+            priority = new_cost + cached_heuristic(new_state, position_cache, stats)
+            push(open_set, (priority, new_state, new_entry))
+
+    return None  # No path found
+
+# Bounded-memory searches. A* keeps every board it has seen, so on high targets it grows until the
+# machine runs out of memory. These trade completeness for a fixed footprint.
+
+BUDGET_CHECK_INTERVAL = 4096  # Boards expanded between memory budget checks
+OPEN_ITEM_BYTES = 160  # A (priority, state, entry) tuple with its float and two ints
+
 
-            new_state = compress_board(new_board)
+def search_bytes(table, open_set):
+    '''
+    Estimates the memory held by an A* search: its table arrays and its open list.
+    '''
+    return table_bytes(table) + len(open_set) * OPEN_ITEM_BYTES
+
+
+def prune_search(table, open_set):
+    '''
+    Keeps the best half of the open list and rebuilds the table with only those boards and their
+    ancestors, so paths to everything left can still be reconstructed. Dropped boards may be found again later.
+    Returns the new table and open list. Raises MemoryError if the new table would be over the old one's
+    max_bytes.
+    '''
+    open_set.sort()
+    kept = open_set[:max(1, len(open_set) // 2)]
+
+    keep = np.zeros(table['count'], dtype=bool)
+    for _, _, entry in kept:
+        while entry is not None and not keep[entry]:
+            keep[entry] = True
+            entry, _ = table_parent(table, entry)
+
+    # Parents are always inserted before their children, so rebuilding in entry order keeps links valid
+    old_entries = np.flatnonzero(keep)
+    new_entries = {}
+    pruned = new_table(2 * old_entries.size, table['max_bytes'], table['canonical'])
+    for old_entry in old_entries.tolist():
+        parent, direction = table_parent(table, old_entry)
+        new_entries[old_entry] = table_insert(pruned, table_key(table, old_entry), table_cost(table, old_entry),
+                                              None if parent is None else new_entries[parent], direction)
+    open_set = [(priority, state, new_entries[entry]) for priority, state, entry in kept]
+    heapq.heapify(open_set)
+    return pruned, open_set
 
-            if new_state in visited_states:  
+
+def beam_search(initial_board, to_reach, beam_width=1000, max_depth=10000, seed=None, stats=None):
+    '''
+    Best-first search that only keeps the beam_width best boards (by the A* heuristic) at each depth,
+    so memory grows with beam_width times the path length instead of with every board seen.
+    Returns the path in the format of reconstruct_path, or None if the beam dies out.
+    '''
+    if stats is None:
+        stats = new_stats()
+    with section(stats):
+        return _beam_loop(initial_board, to_reach, beam_width, max_depth, seed, stats)
+
+
+def _beam_loop(initial_board, to_reach, beam_width, max_depth, seed, stats):
+    '''
+    The beam search itself.
+    '''
+    rng = as_rng(seed)
+    start_state = compress_board(initial_board)
+    if is_goal(start_state, to_reach, True):
+        return []
+
+    # Each layer is a list of (state, parent index in the previous layer, direction)
+    layers = [[(start_state, None, None)]]
+    for _ in range(max_depth):
+        children = {}
+        for parent, (state, _, _) in enumerate(layers[-1]):
+            stats['expanded'] += 1
+            fire(stats, 'expand', state)
+            for direction in ['up', 'down', 'left', 'right']:
+                new_state, done = timed(stats, 'move', move_packed, state, direction, rng, stats)
+                if not done:
+                    continue
+                stats['generated'] += 1
+                if new_state in children:
+                    stats['table_hits'] += 1
+                else:
+                    children[new_state] = (new_state, parent, direction)
+        if not children:
+            return None
+        note_frontier(stats, len(children))
+
+        stats['heuristic_evals'] += len(children)
+        layer = timed(stats, 'heuristic', heapq.nsmallest, beam_width, children.values(),
+                      lambda child: heuristic(child[0]))
+        layers.append(layer)
+        for index, (state, _, _) in enumerate(layer):
+            if is_goal(state, to_reach, True):
+                return _reconstruct_beam(layers, index)
+    return None
+
+
+def _reconstruct_beam(layers, index):
+    '''
+    Follows parent indices back from a board in the last beam layer.
+    '''
+    path = []
+    for layer in reversed(layers[1:]):
+        state, index, direction = layer[index]
+        path.append((state, direction))
+    path.reverse()
+    return path
+
+
+def ida_star_search(initial_board, to_reach, max_depth=10000, seed=None, max_iterations=1000, stats=None):
+    '''
+    Iterative-deepening A*: depth-first searches bounded by cost plus heuristic, raising the bound to the
+    smallest value that went over it each time. Only the current path is kept, so memory grows with the
+    path length alone. Spawns are redrawn on every pass, so passes explore different boards.
+    Returns the path in the format of reconstruct_path, or None.
+    '''
+    if stats is None:
+        stats = new_stats()
+    with section(stats):
+        rng = as_rng(seed)
+        start_state = compress_board(initial_board)
+        bound = heuristic(start_state)
+        for _ in range(max_iterations):
+            path, next_bound = _bounded_search(start_state, to_reach, bound, max_depth, rng, stats)
+            if path is not None:
+                return path
+            if next_bound == float('inf'):
+                return None
+            bound = next_bound
+        return None
+
+
+def _bounded_search(start_state, to_reach, bound, max_depth, rng, stats):
+    '''
+    One IDA* pass, as an explicit stack so deep paths don't hit the recursion limit.
+    Returns the path if the goal was reached within the bound, and the smallest cost plus heuristic above it.
+    '''
+    next_bound = float('inf')
+    path = []  # (state, direction) for each move on the current path
+    on_path = {start_state}
+    stack = [(start_state, 0, None)]  # (state, depth, direction that led to it); None pops a finished board
+    while stack:
+        item = stack.pop()
+        if item is None:
+            state, _ = path.pop()
+            on_path.discard(state)
+            continue
+        state, depth, direction = item
+        if direction is not None:
+            path.append((state, direction))
+            on_path.add(state)
+            stack.append(None)
+
+        f = depth + timed(stats, 'heuristic', heuristic, state)
+        stats['heuristic_evals'] += 1
+        if f > bound:
+            next_bound = min(next_bound, f)
+            continue
+        if is_goal(state, to_reach, True):
+            return list(path), next_bound
+        if depth >= max_depth:
+            continue
+
+        stats['expanded'] += 1
+        fire(stats, 'expand', state)
+        children = []
+        for move_direction in ['up', 'down', 'left', 'right']:
+            new_state, done = timed(stats, 'move', move_packed, state, move_direction, rng, stats)
+            if not done:
                 continue
+            stats['generated'] += 1
+            if new_state in on_path:
+                stats['table_hits'] += 1
+            else:
+                children.append((timed(stats, 'heuristic', heuristic, new_state), new_state, move_direction))
+                stats['heuristic_evals'] += 1
+        # Push the best child last so it is searched first
+        for _, new_state, move_direction in sorted(children, reverse=True):
+            stack.append((new_state, depth + 1, move_direction))
+        note_frontier(stats, len(stack))
+    return None, next_bound
 
-            new_cost = cost_so_far[current_state] + 1 
+# Hash-distributed A* (HDA*). Every board is owned by one worker process, picked by hashing it, and
+# only its owner keeps it: each worker has its own open list and transposition table. Children are
+# batched per owner and sent through the owner's queue as (board, cost, parent id, direction) rows.
+# A parent id is entry * workers + owner, so a path is traced by asking each owner in turn.
+#
+# Messages to a worker: ('states', rows), ('probe',), ('halt',) (stop searching), ('trace', entry), ('stop',).
+# Messages to the coordinator: ('idle', worker, sent, received), ('probe', worker, idle, sent, received),
+# ('goal', worker, entry), ('failed', worker), ('trace', board, parent id, direction), ('stats', exported stats).
+#
+# The search has run dry once every worker is idle and every batch sent has been received. The coordinator
+# checks this from the idle reports, then confirms it with a probe of every worker: the counts can only be
+# unchanged between the two if no batch was in flight in between.
 
-            if new_state not in cost_so_far or new_cost < cost_so_far[new_state]:
-                cost_so_far[new_state] = new_cost
-                priority = new_cost + heuristic(new_state)
-                heapq.heappush(open_set, (priority, new_state))
-                came_from[new_state] = (current_state, direction)
-                visited_states.add(new_state)  
+EXPANSIONS_PER_BATCH = 64  # Boards a worker expands before sending its batches and reading its queue
+ROOT_ID = (1 << 64) - 1
+
+
+def owner_of(state, workers):
+    '''
+    Returns the worker that owns a packed board.
+    '''
+    return (((state * HASH_MULTIPLIER) & 0xFFFFFFFFFFFFFFFF) >> 32) % workers
+
+
+def parallel_a_star_search(initial_board, to_reach, workers=None, max_depth=10000, seed=None,
+                           table_capacity=1 << 16, max_table_bytes=None, stats=None):
+    '''
+    Runs A* across worker processes (one per core by default), each owning the boards that hash to it.
+    Each worker draws spawns from its own stream of the seed, but the order boards are expanded in
+    depends on timing, so runs are not repeatable. max_table_bytes caps each worker's table.
+    The workers' counts and timings are merged into stats, if given.
+    '''
+    workers = workers or os.cpu_count()
+    start_state = compress_board(initial_board)
+    if is_goal(start_state, to_reach, True):
+        return []
+
+    rngs = as_rng(seed).spawn(workers)
+    inboxes = [multiprocessing.Queue() for _ in range(workers)]
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_hda_worker, daemon=True,
+                                         args=(worker, inboxes, results, BIT_DICT[to_reach], max_depth,
+                                               rngs[worker], table_capacity, max_table_bytes,
+                                               stats is not None and stats['timing']))
+                 for worker in range(workers)]
+    for process in processes:
+        process.start()
+
+    inboxes[owner_of(start_state, workers)].put(('states', np.array([[start_state, 0, ROOT_ID, 0]], dtype=np.uint64)))
+    goal = _hda_wait(inboxes, results, sent=1)
+
+    for inbox in inboxes:
+        inbox.put(('halt',))
+    path = None
+    if goal is not None:
+        path = _hda_trace(inboxes, results, goal)
+
+    for inbox in inboxes:
+        inbox.put(('stop',))
+    for _ in range(workers):
+        worker_stats = _hda_receive(results, 'stats')[1]
+        if stats is not None:
+            merge_stats(stats, worker_stats)
+    for process in processes:
+        process.join()
+    return path
+
+
+def _hda_receive(results, kind):
+    '''
+    Returns the next coordinator message of the given kind, dropping search messages that arrive late.
+    '''
+    while True:
+        message = results.get()
+        if message[0] == kind:
+            return message
+
+
+def _hda_wait(inboxes, results, sent):
+    '''
+    Waits for a worker to reach the goal. Returns the goal's parent id, or None if the search ran dry or failed.
+    sent is the number of batches the coordinator sent to start the search.
+    '''
+    workers = len(inboxes)
+    reports = {}
+    while True:
+        message = results.get()
+        if message[0] == 'goal':
+            return message[2] * workers + message[1]
+        if message[0] == 'failed':
+            return None
+        if message[0] != 'idle':
+            continue
+        reports[message[1]] = message[2:]
+        if len(reports) < workers or sent + sum(r[0] for r in reports.values()) != sum(r[1] for r in reports.values()):
+            continue
+
+        for inbox in inboxes:
+            inbox.put(('probe',))
+        probes = {}
+        while len(probes) < workers:
+            message = results.get()
+            if message[0] == 'goal':
+                return message[2] * workers + message[1]
+            if message[0] == 'failed':
+                return None
+            if message[0] == 'probe':
+                probes[message[1]] = message[2:]
+            elif message[0] == 'idle':
+                reports[message[1]] = message[2:]
+        if all(probe[0] and probe[1:] == reports[worker] for worker, probe in probes.items()):
+            return None
+
+
+def _hda_trace(inboxes, results, goal):
+    '''
+    Rebuilds the path to the goal by asking the owner of each board for its parent, in the format of reconstruct_path.
+    '''
+    workers = len(inboxes)
+    path = []
+    node = goal
+    while node != ROOT_ID:
+        inboxes[node % workers].put(('trace', node // workers))
+        _, state, node, direction = _hda_receive(results, 'trace')
+        if node != ROOT_ID:
+            path.append((int(state), direction))
+    path.reverse()
+    return path
+
+
+def _hda_worker(worker, inboxes, results, goal_rank, max_depth, rng, table_capacity, max_table_bytes, timing=False):
+    '''
+    Runs one HDA* worker until told to stop. Expands the boards it owns in batches, reading its queue between them.
+    '''
+    stats = new_stats(timing)
+    workers = len(inboxes)
+    inbox = inboxes[worker]
+    open_set = []
+    outgoing = [[] for _ in range(workers)]
+    sent, received = 0, 0
+    searching, idle_reported = True, False
+    try:
+        table = new_table(table_capacity, max_table_bytes)
+    except MemoryError:
+        results.put(('failed', worker))
+        searching = False
+
+    while True:
+        if searching and not open_set and not idle_reported:
+            results.put(('idle', worker, sent, received))
+            idle_reported = True
+        try:
+            message = inbox.get(block=not (searching and open_set))
+        except queue.Empty:
+            message = None
+
+        if message is not None:
+            if message[0] == 'states':
+                received += 1
+                if searching:
+                    idle_reported = False
+                    searching = _hda_add(table, open_set, message[1], worker, results, stats)
+            elif message[0] == 'probe':
+                results.put(('probe', worker, not open_set, sent, received))
+            elif message[0] == 'halt':
+                searching = False
+                open_set = []
+            elif message[0] == 'trace':
+                parent, direction = table_parent(table, message[1])
+                results.put(('trace', table_key(table, message[1]), ROOT_ID if parent is None else parent, direction))
+            elif message[0] == 'stop':
+                results.put(('stats', export_stats(stats)))
+                return
+            continue
+
+        for _ in range(EXPANSIONS_PER_BATCH):
+            if not open_set:
+                break
+            _, cost, current_state, current_entry = heapq.heappop(open_set)
+            if cost > table_cost(table, current_entry):
+                continue  # A cheaper way here was found after this was queued
+            if has_rank(current_state, goal_rank):
+                results.put(('goal', worker, current_entry))
+                searching = False
+                open_set = []
+                break
+            if cost >= max_depth:
+                continue
+            stats['expanded'] += 1
+            fire(stats, 'expand', current_state)
+            parent_id = current_entry * workers + worker
+            for direction_index, direction in enumerate(DIRECTIONS):
+                new_state, done = timed(stats, 'move', move_packed, current_state, direction, rng, stats)
+                if done:
+                    stats['generated'] += 1
+                    outgoing[owner_of(new_state, workers)].append((new_state, cost + 1, parent_id, direction_index))
+
+        for owner, rows in enumerate(outgoing):
+            if not rows:
+                continue
+            batch = np.array(rows, dtype=np.uint64)
+            rows.clear()
+            if not searching:
+                continue
+            if owner == worker:
+                searching = _hda_add(table, open_set, batch, worker, results, stats)
+            else:
+                inboxes[owner].put(('states', batch))
+                sent += 1
+
+
+def _hda_add(table, open_set, batch, worker, results, stats):
+    '''
+    Adds a batch of boards this worker owns to its table and open list, keeping the cheapest way to each.
+    Returns False (after telling the coordinator) if the table ran out of memory.
+    '''
+    for state, cost, parent_id, direction_index in batch.tolist():
+        entry = table_find(table, state)
+        parent = None if parent_id == ROOT_ID else parent_id
+        if entry >= 0:
+            if table_cost(table, entry) <= cost:
+                stats['table_hits'] += 1
+                continue
+            table_update(table, entry, cost, parent, DIRECTIONS[direction_index])
+        else:
+            try:
+                entry = table_insert(table, state, cost, parent, None if parent is None else DIRECTIONS[direction_index])
+            except MemoryError:
+                results.put(('failed', worker))
+                return False
+        heapq.heappush(open_set, (cost + timed(stats, 'heuristic', heuristic, state), cost, state, entry))
+        stats['heuristic_evals'] += 1
+    note_frontier(stats, len(open_set))
+    return True
+
+
+EMPTY_WEIGHT = 10
+MERGE_WEIGHT = 5
+MONOTONICITY_WEIGHT = 1
+SMOOTHNESS_WEIGHT = 1
+MAX_TILE_WEIGHT = 1
+
+# Column merges compare every 4 bit window (aligned or not) with the window one row below it,
+# for string offsets 0-44, i.e. windows starting at bits 16-60.
+COLUMN_WINDOW_MASK = ((1 << 61) - 1) & ~((1 << 16) - 1)
+BOARD_MASK = (1 << 64) - 1
+
+
+def _build_heuristic_tables():
+    '''
+    Precomputes, for every 16 bit row, each part of the heuristic that only depends on that row.
+    Columns are gathered into 16 bit words and reuse the same tables.
+    '''
+    line_penalty = [0.0] * 65536  # Monotonicity and smoothness, shared by rows and columns
+    row_merges = [0] * 65536
+    row_max = [0] * 65536  # Largest exponent in the row, times 4, plus its first position
+    empty_runs = [0] * (4 * 65536)  # Indexed by carry * 65536 + row; count of '0000' runs * 4 + carry out
+    for row in range(65536):
+        ranks = [(row >> 12) & 0xF, (row >> 8) & 0xF, (row >> 4) & 0xF, row & 0xF]
+        tiles = [1 << rank if rank else 0 for rank in ranks]
+
+        monotonicity = sum(abs(tiles[i] - tiles[i+1]) for i in range(3))
+        smoothness = sum(abs(log2(tiles[i]) - log2(tiles[i+1])) for i in range(3) if tiles[i] != 0 and tiles[i+1] != 0)
+        line_penalty[row] = monotonicity * MONOTONICITY_WEIGHT + smoothness * SMOOTHNESS_WEIGHT
+        row_merges[row] = sum(1 for i in range(3) if ranks[i] == ranks[i+1] and ranks[i] != 0)
+        top = max(ranks)
+        row_max[row] = top * 4 + ranks.index(top)
+
+        # Scans the bits the same way str.count('0000') does, carrying a run of zeros between rows
+        for carry in range(4):
+            count, run = 0, carry
+            for bit in range(15, -1, -1):
+                if (row >> bit) & 1:
+                    run = 0
+                else:
+                    run += 1
+                    if run == 4:
+                        count, run = count + 1, 0
+            empty_runs[carry * 65536 + row] = count * 4 + run
+    return line_penalty, row_merges, row_max, empty_runs
+
+
+LINE_PENALTY, ROW_MERGES, ROW_MAX, EMPTY_RUNS = _build_heuristic_tables()
+
+
+def cached_heuristic(state, position_cache, stats):
+    '''
+    Returns the heuristic of a board, from the position cache if it is there (or if there is no cache,
+    always working it out).
+    '''
+    if position_cache is not None:
+        stored = cache_lookup(position_cache, A_STAR_HEURISTIC, 0, state)
+        if stored is not None:
+            stats['position_hits'] += 1
+            return int(stored[0])  # The heuristic is a whole number, which a 32 bit float holds exactly
+    stats['heuristic_evals'] += 1
+    value = timed(stats, 'heuristic', heuristic, state)
+    if position_cache is not None:
+        cache_store(position_cache, A_STAR_HEURISTIC, 0, state, value)
+    return value
 
-    return None  # No path found
 
 def heuristic(compressed_board):
     '''
-    Calculates the state of the current board, and negates it (as A* wants to minimize this value). 
-    '''
-    score = 0
-    
-    board_binary = format(compressed_board, '064b')
-    
-    def get_tile_value(bits):
-        return PLACE_DICT[bits]
-    
-    empty_weight = 10
-    merge_weight = 5
-    monotonicity_weight = 1
-    smoothness_weight = 1
-    max_tile_weight = 1
-
-    empty_cells = board_binary.count('0000')
-    score += empty_cells * empty_weight
-
-    def check_monotonicity(tiles):
-        return sum(abs(tiles[i] - tiles[i+1]) for i in range(len(tiles) - 1))
-    
-    def check_smoothness(tiles):
-        return sum(abs(log2(tiles[i]) - log2(tiles[i+1])) if tiles[i] != 0 and tiles[i+1] != 0 else 0 for i in range(len(tiles) - 1))
-    
-    def max_tile_position_score(board):
-        max_tile = max(board)
-        max_index = board.index(max_tile)
-        corners = [0, 3, 12, 15]
-        return max_tile_weight if max_index in corners else -max_tile_weight
-    
-    for row_idx in range(0, 64, 16):
-        row = [get_tile_value(board_binary[i:i+4]) for i in range(row_idx, row_idx + 16, 4)]
-        score -= check_monotonicity(row) * monotonicity_weight
-        score -= check_smoothness(row) * smoothness_weight
-    
-    for col_idx in range(4):
-        col = [get_tile_value(board_binary[i:i+4]) for i in range(col_idx, 64, 16)]
-        score -= check_monotonicity(col) * monotonicity_weight
-        score -= check_smoothness(col) * smoothness_weight
-
-    for i in range(0, 64, 4):
-        if i % 16 < 12:  
-            if board_binary[i:i+4] == board_binary[i+4:i+8] and board_binary[i:i+4] != '0000':
-                score += merge_weight
-
-    for i in range(0, 48):  
-        if board_binary[i:i+4] == board_binary[i+16:i+20] and board_binary[i:i+4] != '0000':
-            score += merge_weight
-
-    board = [get_tile_value(board_binary[i:i+4]) for i in range(0, 64, 4)]
-    score += max_tile_position_score(board)
-    
-    return -score  
+    Calculates the state of the current board, and negates it (as A* wants to minimize this value).
+    Rows and columns are scored through the lookup tables above. Gives exactly the same values as
+    scoring the 64 bit string of the board (counting '0000' anywhere in it for empty cells).
+    '''
+    rows = ((compressed_board >> 48) & 0xFFFF, (compressed_board >> 32) & 0xFFFF,
+            (compressed_board >> 16) & 0xFFFF, compressed_board & 0xFFFF)
+    # The column scores read the 4 bit windows at string offsets c, c+16, c+32 and c+48 for c in 0-3,
+    # so only c=0 is a real column; the others are shifted by c bits into the first two tiles
+    cols = [(((compressed_board >> (60 - c)) & 0xF) << 12) | (((compressed_board >> (44 - c)) & 0xF) << 8) |
+            (((compressed_board >> (28 - c)) & 0xF) << 4) | ((compressed_board >> (12 - c)) & 0xF) for c in range(4)]
+
+    empty_cells = 0
+    carry = 0
+    for row in rows:
+        entry = EMPTY_RUNS[carry * 65536 + row]
+        empty_cells += entry >> 2
+        carry = entry & 3
+    score = empty_cells * EMPTY_WEIGHT
+
+    score -= LINE_PENALTY[rows[0]] + LINE_PENALTY[rows[1]] + LINE_PENALTY[rows[2]] + LINE_PENALTY[rows[3]]
+    score -= LINE_PENALTY[cols[0]] + LINE_PENALTY[cols[1]] + LINE_PENALTY[cols[2]] + LINE_PENALTY[cols[3]]
+
+    merges = ROW_MERGES[rows[0]] + ROW_MERGES[rows[1]] + ROW_MERGES[rows[2]] + ROW_MERGES[rows[3]]
+    same_below = ~(compressed_board ^ (compressed_board << 16)) & BOARD_MASK
+    same_below &= (same_below >> 1) & (same_below >> 2) & (same_below >> 3)
+    not_empty = compressed_board | (compressed_board >> 1) | (compressed_board >> 2) | (compressed_board >> 3)
+    merges += (same_below & not_empty & COLUMN_WINDOW_MASK).bit_count()
+    score += merges * MERGE_WEIGHT
 
+    # The first (row-major) largest tile has to be in a corner
+    row_maxes = [ROW_MAX[row] >> 2 for row in rows]
+    top_row = row_maxes.index(max(row_maxes))
+    top_col = ROW_MAX[rows[top_row]] & 3
+    score += MAX_TILE_WEIGHT if top_row in (0, 3) and top_col in (0, 3) else -MAX_TILE_WEIGHT
 
+    return -score
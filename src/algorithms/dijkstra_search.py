@@ -1,59 +1,162 @@
 import numpy as np
 import heapq
-from src.game_2048 import is_goal, move
+import sys
+sys.path.append("..")
+from utils import BIT_DICT
+from game_2048 import is_goal, move_packed, move_batch, compress_board, reconstruct_table_path, as_rng
+from bitboard import DIRECTIONS, has_rank_batch, canonical_batch
+from transposition import new_table, table_find, table_insert, table_cost
+from stats import new_stats, timed, note_frontier, fire, section
 
 # Author: Hope Crisafi
-# Last edited: 11/19/2023
+# Last edited: 10/18/2026
 
+FRONTIER_CHUNK = 1 << 16  # Boards expanded per move_batch call, bounding the temporary arrays
+# The most a new board costs while its layer is made: its board (8 bytes), parent (8) and direction (1)
+# in its chunk and again once the chunks are joined, plus its key, sort order, index and position
+# (8 each) while it is deduplicated
+CHILD_BYTES = 2 * 17 + 4 * 8
+MOVE_BYTES = 288  # The peak memory of move_batch per board moved (measured with tracemalloc), freed per chunk
 
-def dijkstra_search(initial_board, to_reach, max_depth=100000):
+
+def dijkstra_search(initial_board, to_reach, max_depth=100000, seed=None, table_capacity=1 << 16, max_table_bytes=None,
+                    canonical=False, stats=None):
+    if stats is None:
+        stats = new_stats()
+    with section(stats):
+        return _dijkstra_loop(initial_board, to_reach, max_depth, seed, table_capacity, max_table_bytes, canonical, stats)
+
+
+def _dijkstra_loop(initial_board, to_reach, max_depth, seed, table_capacity, max_table_bytes, canonical, stats):
+    rng = as_rng(seed)
     open_set = []
-    came_from = {}
-    cost_so_far = {}
-    start_state = tuple(map(tuple, initial_board))
-    visited_states = set()
+    try:
+        table = new_table(table_capacity, max_table_bytes, canonical)
+    except MemoryError:
+        return None  # As when the table outgrows max_table_bytes later on
+    start_state = compress_board(initial_board)
+    start_entry = table_insert(table, start_state, 0)
 
-    heapq.heappush(open_set, (0, start_state))
-    came_from[start_state] = None
-    cost_so_far[start_state] = 0
-    visited_states.add(start_state)
+    heapq.heappush(open_set, (0, start_state, start_entry))
 
     while open_set:
-        _, current_state = heapq.heappop(open_set)
-        current_board = np.array(current_state)
+        note_frontier(stats, len(open_set))
+        _, current_state, current_entry = heapq.heappop(open_set)
 
-        if is_goal(current_board, to_reach):
-            return reconstruct_path(came_from, start_state, current_state)
+        if is_goal(current_state, to_reach, True):
+            return reconstruct_table_path(table, current_entry)
 
-        if cost_so_far[current_state] >= max_depth:
+        current_cost = table_cost(table, current_entry)
+        if current_cost >= max_depth:
             continue
+        stats['expanded'] += 1
+        fire(stats, 'expand', current_state)
 
         for direction in ['up', 'down', 'left', 'right']:
-            new_board, done = move(current_board, direction)
+            new_state, done = timed(stats, 'move', move_packed, current_state, direction, rng, stats)
             if not done:
                 continue
+            stats['generated'] += 1
 
-            new_state = tuple(map(tuple, new_board))
-            if new_state in visited_states:
+            if table_find(table, new_state) >= 0:
+                stats['table_hits'] += 1
                 continue
 
-            new_cost = cost_so_far[current_state] + 1
+            new_cost = current_cost + 1
+            try:
+                new_entry = table_insert(table, new_state, new_cost, current_entry, direction)
+            except MemoryError:
+                return None
+            heapq.heappush(open_set, (new_cost, new_state, new_entry))
+
+    return None
+
+
+def dijkstra_frontier_search(initial_board, to_reach, max_depth=100000, seed=None, max_bytes=None, canonical=False,
+                             stats=None):
+    '''
+    Dijkstra's search one whole layer at a time. Every move costs 1, so this is a breadth-first search:
+    each layer is a uint64 array of compressed boards, expanded in one move_batch call, deduplicated
+    against every board seen before with sorted-array lookups, and checked for the goal all at once.
+    Returns None if the layers, and the arrays used to make the next one, would take more than max_bytes.
+    With canonical set, boards are deduplicated by their symmetry class (see bitboard.canonical).
+    '''
+    if stats is None:
+        stats = new_stats()
+    with section(stats):
+        return _frontier_loop(initial_board, to_reach, max_depth, seed, max_bytes, canonical, stats)
 
-            if new_state not in cost_so_far or new_cost < cost_so_far[new_state]:
-                cost_so_far[new_state] = new_cost
-                heapq.heappush(open_set, (new_cost, new_state))
-                came_from[new_state] = (current_state, direction)
-                visited_states.add(new_state)
 
+def _frontier_loop(initial_board, to_reach, max_depth, seed, max_bytes, canonical, stats):
+    '''
+    The layer by layer search itself.
+    '''
+    rng = as_rng(seed)
+    goal_rank = BIT_DICT[to_reach]
+    start_state = compress_board(initial_board)
+    if is_goal(start_state, to_reach, True):
+        return []
+
+    # Each layer keeps its boards, and for every board the index of its parent and the direction moved
+    layers = [(np.array([start_state], dtype=np.uint64), None, None)]
+    seen = canonical_batch(layers[0][0]) if canonical else layers[0][0]
+    for _ in range(max_depth):
+        frontier = layers[-1][0]
+        if frontier.size == 0:
+            return None
+        # The layers and seen as they are, plus the most the next layer can take while it is made: up to
+        # 4 children per board, the moves of one chunk, and a new copy of seen when the children are inserted
+        if max_bytes is not None:
+            kept = seen.nbytes + sum(array.nbytes for layer in layers for array in layer if array is not None)
+            making = 4 * (frontier.size * CHILD_BYTES + min(frontier.size, FRONTIER_CHUNK) * MOVE_BYTES)
+            if kept + seen.nbytes + making > max_bytes:
+                return None
+
+        stats['expanded'] += int(frontier.size)
+        note_frontier(stats, int(frontier.size))
+        chunks = [timed(stats, 'move', _expand_chunk, frontier, start, rng, stats)
+                  for start in range(0, frontier.size, FRONTIER_CHUNK)]
+        children = np.concatenate([chunk[0] for chunk in chunks])
+        parents = np.concatenate([chunk[1] for chunk in chunks])
+        directions = np.concatenate([chunk[2] for chunk in chunks])
+        generated = int(children.size)
+        stats['generated'] += generated
+
+        # Keep the first copy of each new board, then drop boards from earlier layers
+        keys, first = np.unique(canonical_batch(children) if canonical else children, return_index=True)
+        children, parents, directions = children[first], parents[first], directions[first]
+        positions = np.searchsorted(seen, keys)
+        new = seen[np.minimum(positions, seen.size - 1)] != keys
+        children, parents, directions = children[new], parents[new], directions[new]
+        stats['table_hits'] += generated - int(children.size)
+        layers.append((children, parents, directions))
+        seen = np.insert(seen, positions[new], keys[new])
+
+        reached = np.flatnonzero(has_rank_batch(children, goal_rank))
+        if reached.size:
+            return _reconstruct_layers(layers, int(reached[0]))
     return None
 
 
-def reconstruct_path(came_from, start, goal):
-    current = goal
+def _expand_chunk(frontier, start, rng, stats=None):
+    '''
+    Moves FRONTIER_CHUNK boards of a layer in all four directions, keeping the boards that moved
+    along with their parent index and direction.
+    '''
+    count = min(FRONTIER_CHUNK, frontier.size - start)
+    parents = np.repeat(np.arange(start, start + count), 4)
+    directions = np.tile(np.arange(4, dtype=np.int8), count)
+    children, moved, _, _ = move_batch(frontier[parents], directions, rng, stats)
+    return children[moved], parents[moved], directions[moved]
+
+
+def _reconstruct_layers(layers, index):
+    '''
+    Follows parent indices back from a board in the last layer, giving the path in the form of reconstruct_path.
+    '''
     path = []
-    while current != start:
-        prev, direction = came_from[current]
-        path.append((current, direction))
-        current = prev
+    for states, parents, directions in reversed(layers[1:]):
+        path.append((int(states[index]), DIRECTIONS[directions[index]]))
+        index = parents[index]
     path.reverse()
     return path
@@ -0,0 +1,262 @@
+import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor
+import sys
+sys.path.append("..")
+from utils import BIT_DICT
+from game_2048 import is_goal, move_packed, slide_packed, spawn_outcomes_packed, compress_board, as_rng
+from bitboard import transpose, has_rank, canonical_key
+from stats import new_stats, timed, fire, section, export_stats, merge_stats
+from position_cache import as_cache, cache_lookup, cache_store, EXPECTIMAX
+
+# Author: Caleb L'Italien
+# Last edited: 10/18/2026
+
+# Expectimax treats tile spawns as chance nodes rather than an adversary. The player moves on
+# full boards, and every move leads to an afterstate (the slid board before a tile spawns).
+# Each afterstate averages over every empty cell x {2: 0.9, 4: 0.1}.
+
+MIN_PROBABILITY = 0.0001  # Chance branches less likely than this are scored by the heuristic
+MAX_CACHE_SIZE = 1000000
+GOAL_SCORE = 1e9
+CHUNKS_PER_WORKER = 4  # Root spawn outcomes are split into this many tasks per pool worker
+
+LOST_PENALTY = 200000.0
+EMPTY_WEIGHT = 270.0
+MERGES_WEIGHT = 700.0
+MONOTONICITY_POWER = 4.0
+MONOTONICITY_WEIGHT = 47.0
+SUM_POWER = 3.5
+SUM_WEIGHT = 11.0
+
+
+def _build_heuristic_table():
+    '''
+    Precomputes the score of every possible row: empty cells, merges, monotonicity and a
+    penalty on the sum of tiles (large tiles should be few and together).
+    '''
+    table = [0.0] * 65536
+    for row in range(65536):
+        tiles = [(row >> 12) & 0xF, (row >> 8) & 0xF, (row >> 4) & 0xF, row & 0xF]
+        tile_sum = sum(tile ** SUM_POWER for tile in tiles)
+        empty = tiles.count(0)
+
+        merges = 0
+        previous, counter = 0, 0
+        for tile in tiles:
+            if tile == 0:
+                continue
+            if previous == tile:
+                counter += 1
+            elif counter > 0:
+                merges += 1 + counter
+                counter = 0
+            previous = tile
+        if counter > 0:
+            merges += 1 + counter
+
+        monotonicity_left, monotonicity_right = 0.0, 0.0
+        for i in range(3):
+            if tiles[i] > tiles[i + 1]:
+                monotonicity_left += tiles[i] ** MONOTONICITY_POWER - tiles[i + 1] ** MONOTONICITY_POWER
+            else:
+                monotonicity_right += tiles[i + 1] ** MONOTONICITY_POWER - tiles[i] ** MONOTONICITY_POWER
+
+        table[row] = LOST_PENALTY + EMPTY_WEIGHT * empty + MERGES_WEIGHT * merges - \
+            MONOTONICITY_WEIGHT * min(monotonicity_left, monotonicity_right) - SUM_WEIGHT * tile_sum
+    return table
+
+
+HEURISTIC_TABLE = _build_heuristic_table()
+
+
+def heuristic(state):
+    '''
+    Scores a compressed board by looking up each of its rows and columns. Higher is better.
+    '''
+    cols = transpose(state)
+    return HEURISTIC_TABLE[(state >> 48) & 0xFFFF] + HEURISTIC_TABLE[(state >> 32) & 0xFFFF] + \
+        HEURISTIC_TABLE[(state >> 16) & 0xFFFF] + HEURISTIC_TABLE[state & 0xFFFF] + \
+        HEURISTIC_TABLE[(cols >> 48) & 0xFFFF] + HEURISTIC_TABLE[(cols >> 32) & 0xFFFF] + \
+        HEURISTIC_TABLE[(cols >> 16) & 0xFFFF] + HEURISTIC_TABLE[cols & 0xFFFF]
+
+
+def max_node(state, depth, probability, goal_rank, cache, canonical=False, stats=None, position_cache=None):
+    '''
+    Scores a full board as the best of its afterstates. Returns the score and the move that gets it.
+    Nodes, boards made (afterstates and spawned boards, see chance_node), heuristic calls and cache hits
+    are counted in stats, if given (see stats.py).
+    '''
+    if stats is None:
+        stats = new_stats()
+    stats['expanded'] += 1
+    fire(stats, 'expand', state)
+    best_value = 0.0  # No legal moves means the game is lost
+    best_move = None
+    for direction in ['up', 'down', 'left', 'right']:
+        afterstate, moved = timed(stats, 'move', slide_packed, state, direction)
+        if not moved:
+            continue
+        stats['boards'] += 1
+        stats['generated'] += 1
+        if has_rank(afterstate, goal_rank):
+            return GOAL_SCORE, direction
+        value = chance_node(afterstate, depth, probability, goal_rank, cache, canonical, stats, position_cache)
+        if value > best_value or best_move is None:
+            best_value = value
+            best_move = direction
+    return best_value, best_move
+
+
+def chance_node(afterstate, depth, probability, goal_rank, cache, canonical=False, stats=None, position_cache=None):
+    '''
+    Scores an afterstate as the expected value over every tile that could spawn on it.
+    Results are stored in a transposition table keyed by the board, remaining depth and goal (a board
+    holding the goal scores GOAL_SCORE, so one cache can serve searches for different goals). The score is
+    the same for every rotation and reflection of a board, so with canonical set they share one key.
+    With a position_cache (see position_cache.py), results are also kept there, and a result found
+    there at this depth or deeper is used instead of searching.
+    '''
+    if stats is None:
+        stats = new_stats()
+    if depth <= 1 or probability < MIN_PROBABILITY:
+        stats['heuristic_evals'] += 1
+        return timed(stats, 'heuristic', heuristic, afterstate)
+
+    key = (canonical_key(afterstate) if canonical else afterstate, depth, goal_rank)
+    if key in cache:
+        stats['cache_hits'] += 1
+        return cache[key]
+
+    if position_cache is not None:
+        stored = cache_lookup(position_cache, EXPECTIMAX, goal_rank, afterstate)
+        if stored is not None and stored[1] >= depth:
+            stats['position_hits'] += 1
+            return stored[0]
+
+    value = 0.0
+    outcomes = timed(stats, 'move', list, spawn_outcomes_packed(afterstate))
+    stats['boards'] += len(outcomes)
+    for child, child_probability in outcomes:
+        child_value, _ = max_node(child, depth - 1, probability * child_probability, goal_rank, cache, canonical,
+                                  stats, position_cache)
+        value += child_probability * child_value
+
+    if len(cache) >= MAX_CACHE_SIZE:
+        cache.clear()
+    cache[key] = value
+    if position_cache is not None:
+        cache_store(position_cache, EXPECTIMAX, goal_rank, afterstate, value, depth)
+    return value
+
+
+# Root-parallel search: the spawn outcomes of every root move are split into chunks, each scored by a
+# worker of a long-lived process pool. Every worker keeps its own cache between tasks, and empties it
+# when it gets a task for a different goal.
+
+_WORKER_CACHE = {}
+_WORKER_GOAL = None  # The goal rank the worker's cache was filled for
+
+
+def search_outcomes(outcomes, depth, goal_rank, canonical=False, timing=False, position_cache=None):
+    '''
+    Runs in a worker: scores each (board, probability) spawn outcome of a root move, looking depth - 1
+    moves ahead. Returns the scores and the stats of the search (see stats.export_stats).
+    position_cache is the path of a position cache to share, if any.
+    '''
+    global _WORKER_GOAL
+    if _WORKER_GOAL != goal_rank:
+        _WORKER_CACHE.clear()
+        _WORKER_GOAL = goal_rank
+    stats = new_stats(timing)
+    position_cache = as_cache(position_cache)
+    values = [max_node(child, depth - 1, probability, goal_rank, _WORKER_CACHE, canonical, stats, position_cache)[0]
+              for child, probability in outcomes]
+    return values, export_stats(stats)
+
+
+def parallel_max_node(state, depth, goal_rank, pool, workers, canonical=False, stats=None, position_cache=None):
+    '''
+    Picks the best move for a full board like max_node, with the spawn outcomes of every move scored in
+    the pool's workers (workers of them). Stats from the workers are merged into stats, if given. The workers share the
+    position cache, if given, by mapping its file.
+    '''
+    if stats is None:
+        stats = new_stats()
+    stats['expanded'] += 1
+    values = {}
+    tasks = []
+    for direction in ['up', 'down', 'left', 'right']:
+        afterstate, moved = timed(stats, 'move', slide_packed, state, direction)
+        if not moved:
+            continue
+        stats['boards'] += 1
+        stats['generated'] += 1
+        if has_rank(afterstate, goal_rank):
+            return direction
+        if depth <= 1:
+            stats['heuristic_evals'] += 1
+            values[direction] = timed(stats, 'heuristic', heuristic, afterstate)
+        else:
+            values[direction] = 0.0
+            outcomes = timed(stats, 'move', list, spawn_outcomes_packed(afterstate))
+            stats['boards'] += len(outcomes)
+            tasks.extend((direction, child, probability) for child, probability in outcomes)
+
+    chunks = [chunk for chunk in np.array_split(np.arange(len(tasks)), workers * CHUNKS_PER_WORKER)
+              if chunk.size]
+    cache_path = None if position_cache is None else position_cache['path']
+    futures = [pool.submit(search_outcomes, [tasks[i][1:] for i in chunk], depth, goal_rank, canonical,
+                           stats['timing'], cache_path)
+               for chunk in chunks]
+    for chunk, future in zip(chunks, futures):
+        chunk_values, worker_stats = future.result()
+        merge_stats(stats, worker_stats)
+        for i, value in zip(chunk, chunk_values):
+            direction, _, probability = tasks[i]
+            values[direction] += probability * value
+
+    best_move = None
+    for direction, value in values.items():
+        if best_move is None or value > values[best_move]:
+            best_move = direction
+    return best_move
+
+
+def expectimax_search(initial_board, to_reach, max_depth=2, max_moves=100000, seed=None, canonical=False,
+                      workers=None, pool=None, position_cache=None, stats=None):
+    '''
+    Plays the game by picking the move with the best expected score, looking max_depth moves ahead.
+    Returns the path taken (in the form of game_2048.reconstruct_path), or None if the game was lost before
+    reaching the goal.
+    With canonical set, symmetric afterstates share cache entries (see bitboard.canonical).
+    With a process pool of workers processes (by default one per core), or workers to make one for this
+    search, each move's spawn outcomes are scored in parallel (see parallel_max_node).
+    With a position_cache (see position_cache.py, or the path of one), afterstate scores are shared with
+    other processes and later runs.
+    '''
+    if pool is None and workers:
+        with ProcessPoolExecutor(max_workers=workers) as search_pool:
+            return expectimax_search(initial_board, to_reach, max_depth, max_moves, seed, canonical, workers,
+                                     search_pool, position_cache, stats)
+
+    if stats is None:
+        stats = new_stats()
+    workers = workers or os.cpu_count()
+    with section(stats):
+        rng = as_rng(seed)
+        position_cache = as_cache(position_cache)
+        path = []
+        cache = {}
+        goal_rank = BIT_DICT[to_reach]
+        state = compress_board(initial_board)
+        while not is_goal(state, to_reach, True) and len(path) < max_moves:
+            if pool is not None:
+                best_move = parallel_max_node(state, max_depth, goal_rank, pool, workers, canonical, stats, position_cache)
+            else:
+                _, best_move = max_node(state, max_depth, 1.0, goal_rank, cache, canonical, stats, position_cache)
+            if best_move is None:
+                return None
+            state, _ = timed(stats, 'move', move_packed, state, best_move, rng, stats)
+            path.append((state, best_move))
+        return path if is_goal(state, to_reach, True) else None
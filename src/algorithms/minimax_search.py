@@ -1,80 +1,477 @@
 # minimax_search.py
 import numpy as np
-import src.game_2048 as game
+import time
+import multiprocessing
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+import sys
+sys.path.append("..")
+import game_2048 as game
+from bitboard import transpose, transpose_batch, as_packed
+from stats import new_stats, timed, fire, section, export_stats, merge_stats
+from utils import BIT_DICT
+from position_cache import as_cache, cache_lookup, cache_store, MINIMAX_MAX, MINIMAX_MIN
 
 # Author: Hope Crisafi
-# Last edited: 11/19/2023
+# Last edited: 10/18/2026
 
 
-def minimax(board, depth, is_maximizing_player, alpha, beta, to_reach):
-    if game.is_goal(board, to_reach) or depth == 0:
-        return heuristic(board), None
+# A search is a dict shared by every node of one move's search (see new_search). It holds the node count,
+# the deadline and whether it passed, the stats dict counting its work (see stats.py), and the tables kept
+# between iterations and moves:
+#   table:      (board, depth, is_maximizing_player, to_reach) -> (value, bound, best move); the goal is in
+#               the key since reaching it ends the search, so one search can serve games with different goals
+#   best_moves: board -> the best move found for it at any depth, tried first next time
+#   killers:    depth -> the last two moves that caused a cutoff at that depth
+#   history:    (depth, move) -> how much cutting off with that move has saved so far
+# A search can also have a position cache (see position_cache.py), which backs the table on disk: it is
+# shared with other processes and later runs, and its entries are used from any depth at least as deep.
+# With ordering on, deeper children are searched best first (by those tables and the heuristic),
+# so alpha-beta cuts off sooner.
+EXACT, LOWER, UPPER = 0, 1, 2
+MAX_TABLE_SIZE = 1000000
+DEADLINE_CHECK_INTERVAL = 64  # Nodes searched between looks at the clock
+MAX_SEARCH_DEPTH = 64
+
+
+def new_search(deadline=None, ordering=True, stats=None, position_cache=None):
+    '''
+    Makes the shared state for a search. deadline is a time.perf_counter() value, or None for no limit.
+    position_cache is a position cache or the path of one, if any.
+    '''
+    return {'deadline': deadline, 'timed_out': False, 'nodes': 0, 'table': {}, 'best_moves': {},
+            'ordering': ordering, 'killers': {}, 'history': {}, 'stats': stats if stats is not None else new_stats(),
+            'position_cache': as_cache(position_cache)}
+
+
+def minimax(board, depth, is_maximizing_player, alpha, beta, to_reach, rng=None, search=None):
+    if search is None:
+        search = new_search()
+    search['nodes'] += 1
+    if search['deadline'] is not None and search['nodes'] % DEADLINE_CHECK_INTERVAL == 0 and \
+            time.perf_counter() > search['deadline']:
+        search['timed_out'] = True
+    if search['timed_out']:
+        return 0.0, None  # Thrown away by the caller
+
+    stats = search['stats']
+    if game.is_goal(board, to_reach, True) or depth == 0:
+        stats['heuristic_evals'] += 1
+        return timed(stats, 'heuristic', heuristic, board), None
+
+    key = (board, depth, is_maximizing_player, to_reach)
+    stored = search['table'].get(key)
+    if stored is not None:
+        value, bound, move = stored
+        if bound == EXACT or (bound == LOWER and value >= beta) or (bound == UPPER and value <= alpha):
+            stats['table_hits'] += 1
+            return value, move
+    if search['position_cache'] is not None:
+        stored = cache_lookup(search['position_cache'], MINIMAX_MAX if is_maximizing_player else MINIMAX_MIN,
+                              BIT_DICT[to_reach], board)
+        if stored is not None and stored[1] >= depth:
+            value, _, move, bound = stored
+            if bound == EXACT or (bound == LOWER and value >= beta) or (bound == UPPER and value <= alpha):
+                stats['position_hits'] += 1
+                return value, move
+    alpha_in, beta_in = alpha, beta
+    stats['expanded'] += 1
+    fire(stats, 'expand', board)
 
     if is_maximizing_player:
         best_value = float('-inf')
         best_move = None
-        for direction in ['up', 'down', 'left', 'right']:
-            new_board, done = game.move(board, direction)
+        children = []
+        for direction in _ordered_directions(search['best_moves'].get(board)):
+            new_board, done = timed(stats, 'move', game.move_packed, board, direction, rng, stats)
             if done:
-                value, _ = minimax(new_board, depth-1, False, alpha, beta, to_reach)
-                if value > best_value:
-                    best_value = value
-                    best_move = direction
-                alpha = max(alpha, value)
-                if beta <= alpha:
-                    break
-        return best_value, best_move
+                children.append((direction, new_board))
+        stats['generated'] += len(children)
+        # The children of the last layer are all leaves, so they are scored in one batch
+        leaf_values = _leaf_values([new_board for _, new_board in children], stats) if depth == 1 else None
+        if leaf_values is None and search['ordering'] and len(children) > 1:
+            children = _order_moves(children, board, depth, search)
+        for i, (direction, new_board) in enumerate(children):
+            if leaf_values is not None:
+                value = float(leaf_values[i])
+            else:
+                value, _ = minimax(new_board, depth-1, False, alpha, beta, to_reach, rng, search)
+                if search['timed_out']:
+                    return best_value, best_move
+            if value > best_value:
+                best_value = value
+                best_move = direction
+            alpha = max(alpha, value)
+            if beta <= alpha:
+                if leaf_values is None:
+                    _record_cutoff(search, depth, direction)
+                break
+        if best_move is not None:
+            search['best_moves'][board] = best_move
     else:
         best_value = float('inf')
-        possible_boards = game.get_possible_moves(board)
-        for new_board in possible_boards:
-            value, _ = minimax(new_board, depth-1, True, alpha, beta, to_reach)
+        best_move = None
+        possible_boards = timed(stats, 'move', game.get_possible_moves_packed, board, rng, stats)
+        stats['generated'] += len(possible_boards)
+        leaf_values = _leaf_values(possible_boards, stats) if depth == 1 else None
+        if leaf_values is None and search['ordering'] and len(possible_boards) > 1:
+            # The worst boards for the maximizing player are the likeliest to cut off
+            scores = _scores(possible_boards, stats)
+            possible_boards = [possible_boards[i] for i in sorted(range(len(possible_boards)), key=scores.__getitem__)]
+        for i, new_board in enumerate(possible_boards):
+            if leaf_values is not None:
+                value = float(leaf_values[i])
+            else:
+                value, _ = minimax(new_board, depth-1, True, alpha, beta, to_reach, rng, search)
+                if search['timed_out']:
+                    return best_value, None
             best_value = min(best_value, value)
             beta = min(beta, value)
             if beta <= alpha:
                 break
-        return best_value, None
 
+    _store(search, key, best_value, alpha_in, beta_in, best_move, to_reach)
+    return best_value, best_move
+
+
+def _leaf_values(boards, stats):
+    '''
+    Scores the children of a node one move from the search depth in one batch, or returns None if there are none.
+    '''
+    if not boards:
+        return None
+    stats['heuristic_evals'] += len(boards)
+    return timed(stats, 'heuristic', heuristic_batch, boards)
+
+
+def _ordered_directions(first):
+    '''
+    Returns the four directions, starting with first (the best move found before) if there is one.
+    '''
+    directions = ['up', 'down', 'left', 'right']
+    if first is not None:
+        directions.remove(first)
+        directions.insert(0, first)
+    return directions
+
+
+def _order_moves(children, board, depth, search):
+    '''
+    Sorts (direction, board) children best first: the best move found before, then killer moves,
+    then by history, then by the heuristic.
+    '''
+    first = search['best_moves'].get(board)
+    killers = search['killers'].get(depth, ())
+    history = search['history']
+    scores = _scores([new_board for _, new_board in children], search['stats'])
+    order = sorted(range(len(children)), reverse=True,
+                   key=lambda i: (children[i][0] == first, children[i][0] in killers,
+                                  history.get((depth, children[i][0]), 0), scores[i]))
+    return [children[i] for i in order]
+
+
+def _scores(boards, stats):
+    '''
+    Scores boards with the heuristic for ordering them, counting and timing the calls like leaf evaluations.
+    (A few boards are quicker one at a time than through heuristic_batch.)
+    '''
+    stats['heuristic_evals'] += len(boards)
+    return [timed(stats, 'heuristic', heuristic, new_board) for new_board in boards]
+
+
+def _record_cutoff(search, depth, direction):
+    '''
+    Remembers a move that cut off the search at this depth.
+    '''
+    killers = search['killers'].setdefault(depth, [])
+    if direction not in killers:
+        killers.insert(0, direction)
+        del killers[2:]
+    search['history'][(depth, direction)] = search['history'].get((depth, direction), 0) + depth * depth
+
+
+def _store(search, key, value, alpha, beta, move, to_reach):
+    '''
+    Saves a node's value in the transposition table (and the position cache, if the search has one), with
+    whether it is exact or only a bound (a cutoff means the true value is at least, or at most, what was found).
+    '''
+    table = search['table']
+    if len(table) >= MAX_TABLE_SIZE:
+        table.clear()
+    if value <= alpha:
+        bound = UPPER
+    elif value >= beta:
+        bound = LOWER
+    else:
+        bound = EXACT
+    table[key] = (value, bound, move)
+    if search['position_cache'] is not None:
+        board, depth, is_maximizing_player, _ = key
+        cache_store(search['position_cache'], MINIMAX_MAX if is_maximizing_player else MINIMAX_MIN, BIT_DICT[to_reach],
+                    board, value, depth, move, bound)
+
+
+def iterative_deepening(board, to_reach, time_limit, max_search_depth=MAX_SEARCH_DEPTH, rng=None, search=None,
+                        aspiration=None):
+    '''
+    Searches one move at depth 1, 2, 3, ... until time_limit seconds have passed, and returns the best move
+    of the deepest search that finished. Depth 1 always finishes, so there is a move whenever one is legal.
+    The search's tables carry over from each depth to the next, so the best line so far is searched first.
+    With aspiration set, each depth first searches a window that wide around the last depth's value,
+    searching again with a full window only if the value falls outside it.
+    '''
+    if search is None:
+        search = new_search()
+    deadline = time.perf_counter() + time_limit
+    best_move = None
+    value = None
+    for depth in range(1, max_search_depth + 1):
+        search['deadline'] = None if depth == 1 else deadline
+        search['timed_out'] = False
+        if aspiration is not None and value is not None:
+            alpha, beta = value - aspiration, value + aspiration
+            value, move = minimax(board, depth, True, alpha, beta, to_reach, rng, search)
+            if not search['timed_out'] and (value <= alpha or value >= beta):
+                value, move = minimax(board, depth, True, float('-inf'), float('inf'), to_reach, rng, search)
+        else:
+            value, move = minimax(board, depth, True, float('-inf'), float('inf'), to_reach, rng, search)
+        if search['timed_out']:
+            break
+        best_move = move
+        if move is None or time.perf_counter() > deadline:
+            break
+    search['deadline'] = None
+    search['timed_out'] = False
+    return best_move
 
-def heuristic(board):
-    score = 0
 
-    empty_cells = np.count_nonzero(board == 0)
-    score += empty_cells * 10
+# Root-parallel search. Each legal move at the root is searched by its own worker of a long-lived process
+# pool (see make_search_pool), which keeps its own search tables between tasks. A pool made here also
+# shares the best root value found so far at each depth, so workers that start later cut off sooner.
 
-    for row in board:
-        if np.any(np.diff(row) < 0):
-            score -= 1
+POOL_ALPHAS = weakref.WeakKeyDictionary()  # Pool -> its shared array of best root values, one per depth
+_SHARED_ALPHAS = None  # In a worker, the same array
+_WORKER_SEARCH = None  # In a worker, its search tables
+_WORKER_GOAL = None  # In a worker, the goal its search tables were built for
 
-    for col in board.T:
-        if np.any(np.diff(col) < 0):
-            score -= 1
 
-    merge_opportunities = 0
-    for row in range(board.shape[0]):
-        for col in range(board.shape[1]):
-            if row < board.shape[0] - 1 and board[row][col] == board[row + 1][col]:
-                merge_opportunities += 1
-            if col < board.shape[1] - 1 and board[row][col] == board[row][col + 1]:
-                merge_opportunities += 1
-    score += merge_opportunities * 5
+def make_search_pool(workers=None):
+    '''
+    Makes a long-lived process pool for root-parallel minimax (or expectimax). Create it once and pass it
+    to every search, so the workers keep their tables warm. A worker starts its tables afresh when it
+    gets a search for a different goal, so nothing found for one game's goal carries over to another's.
+    '''
+    alphas = multiprocessing.Array('d', MAX_SEARCH_DEPTH + 1)
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(alphas,))
+    POOL_ALPHAS[pool] = alphas
+    return pool
 
+
+def _init_worker(alphas):
+    '''
+    Sets up a pool worker with the shared root values and its own search tables.
+    '''
+    global _SHARED_ALPHAS, _WORKER_SEARCH
+    _SHARED_ALPHAS = alphas
+    _WORKER_SEARCH = new_search()
+
+
+def search_subtree(board, depths, deadline, to_reach, seed, timing=False, position_cache=None):
+    '''
+    Runs in a worker: searches the board after one root move at each root depth in depths, stopping at
+    deadline (a time.time() value, so every worker stops at the same moment however long the task
+    waited for one; the first depth always finishes).
+    Returns (value, exact) for each depth finished, where exact is False if the value is only an upper
+    bound because it could not beat the best root value shared by other workers, plus the number of
+    nodes searched and the stats of the search (see stats.export_stats).
+    position_cache is the path of a position cache to share, if any.
+    '''
+    global _WORKER_SEARCH, _WORKER_GOAL
+    if _WORKER_SEARCH is not None and _WORKER_GOAL != to_reach:
+        _WORKER_SEARCH, _WORKER_GOAL = new_search(), to_reach
+    search = _WORKER_SEARCH if _WORKER_SEARCH is not None else new_search()
+    search['stats'] = new_stats(timing)
+    search['position_cache'] = as_cache(position_cache)
+    nodes_before = search['nodes']
+    rng = game.as_rng(seed)
+    if deadline is not None:
+        deadline = time.perf_counter() + (deadline - time.time())
+    values = []
+    for i, depth in enumerate(depths):
+        search['deadline'] = None if i == 0 else deadline
+        search['timed_out'] = False
+        shared = _SHARED_ALPHAS is not None and depth < len(_SHARED_ALPHAS)
+        alpha = _SHARED_ALPHAS[depth] if shared else float('-inf')
+        value, _ = minimax(board, depth - 1, False, alpha, float('inf'), to_reach, rng, search)
+        if search['timed_out']:
+            break
+        values.append((value, value > alpha))
+        if shared:
+            with _SHARED_ALPHAS.get_lock():
+                if value > _SHARED_ALPHAS[depth]:
+                    _SHARED_ALPHAS[depth] = value
+        if deadline is not None and time.perf_counter() > deadline:
+            break
+    search['deadline'] = None
+    search['timed_out'] = False
+    return values, search['nodes'] - nodes_before, export_stats(search['stats'])
+
+
+def parallel_root_search(board, to_reach, depth, rng, pool, time_limit=None, search=None):
+    '''
+    Picks a move by searching every legal root move in its own pool worker, at the given depth or, with
+    time_limit, at every depth up to it for about that long. Moves are compared at the deepest depth all
+    of them finished. Node counts and stats from the workers are added to search. The workers share the
+    search's position cache, if it has one, by mapping its file.
+    '''
+    if search is None:
+        search = new_search()
+    stats = search['stats']
+    children = []
+    for direction in ['up', 'down', 'left', 'right']:
+        new_board, done = timed(stats, 'move', game.move_packed, board, direction, rng, stats)
+        if done:
+            children.append((direction, new_board))
+    if not children:
+        return None
+    stats['expanded'] += 1
+    stats['generated'] += len(children)
+
+    alphas = POOL_ALPHAS.get(pool)
+    if alphas is not None:
+        with alphas.get_lock():
+            alphas[:] = [float('-inf')] * len(alphas)
+    depths = [depth] if time_limit is None else list(range(1, depth + 1))
+    # One deadline for every root move, so moves that wait for a worker do not get time_limit of their own
+    deadline = None if time_limit is None else time.time() + time_limit
+    cache_path = None if search['position_cache'] is None else search['position_cache']['path']
+    futures = [pool.submit(search_subtree, new_board, depths, deadline, to_reach, child_rng, stats['timing'],
+                           cache_path)
+               for (_, new_board), child_rng in zip(children, game.spawn_rngs(rng, len(children)))]
+
+    results = []
+    for future in futures:
+        values, nodes, worker_stats = future.result()
+        results.append(values)
+        search['nodes'] += nodes
+        merge_stats(stats, worker_stats)
+    finished = min(len(values) for values in results)
+    best = max(range(len(children)), key=lambda i: results[i][finished - 1])
+    return children[best][0]
+
+
+def _row_scores(row):
+    '''
+    Scores one 16 bit row (or column) of a compressed board: whether it ever decreases,
+    and how many neighbouring tiles are equal.
+    '''
+    tiles = [(row >> 12) & 0xF, (row >> 8) & 0xF, (row >> 4) & 0xF, row & 0xF]
+    decreasing = any(tiles[i + 1] < tiles[i] for i in range(3))
+    merges = sum(1 for i in range(3) if tiles[i] == tiles[i + 1])
+    return tiles.count(0), decreasing, merges
+
+
+def _build_heuristic_tables():
+    '''
+    Precomputes the heuristic contribution of every possible row and column.
+    '''
+    row_table = [0] * 65536
+    col_table = [0] * 65536
+    for row in range(65536):
+        empty, decreasing, merges = _row_scores(row)
+        col_table[row] = merges * 5 - (1 if decreasing else 0)
+        row_table[row] = empty * 10 + col_table[row]
+    return row_table, col_table
+
+
+ROW_SCORES, COL_SCORES = _build_heuristic_tables()
+ROW_SCORES_ARRAY = np.array(ROW_SCORES, dtype=np.float64)
+COL_SCORES_ARRAY = np.array(COL_SCORES, dtype=np.float64)
+LINE_SHIFTS = np.array([48, 32, 16, 0], dtype=np.uint64)
+
+
+def heuristic(state):
+    '''
+    Scores a compressed board on its empty cells, monotonicity and merge opportunities.
+    Rows and columns are looked up in precomputed tables.
+    '''
+    cols = transpose(state)
+    score = ROW_SCORES[(state >> 48) & 0xFFFF] + ROW_SCORES[(state >> 32) & 0xFFFF] + \
+            ROW_SCORES[(state >> 16) & 0xFFFF] + ROW_SCORES[state & 0xFFFF] + \
+            COL_SCORES[(cols >> 48) & 0xFFFF] + COL_SCORES[(cols >> 32) & 0xFFFF] + \
+            COL_SCORES[(cols >> 16) & 0xFFFF] + COL_SCORES[cols & 0xFFFF]
     return -score
 
 
-def minimax_search(initial_board, to_reach, max_depth=1000):
+def heuristic_batch(boards):
+    '''
+    Scores many boards at once, given as an (N,) uint64 array of compressed boards or an (N, 4, 4) array.
+    Returns an (N,) float array with the same values as heuristic.
+    '''
+    states = as_packed(boards)
+    rows = ((states[:, None] >> LINE_SHIFTS) & np.uint64(0xFFFF)).astype(np.intp)
+    cols = ((transpose_batch(states)[:, None] >> LINE_SHIFTS) & np.uint64(0xFFFF)).astype(np.intp)
+    return -(ROW_SCORES_ARRAY[rows].sum(axis=1) + COL_SCORES_ARRAY[cols].sum(axis=1))
+
+
+def minimax_search(initial_board, to_reach, max_depth=1000, seed=None, search_depth=None, time_limit=None,
+                   aspiration=None, search=None, workers=None, pool=None, position_cache=None, stats=None):
+    '''
+    Plays up to max_depth moves, picking each with minimax. By default each move is searched as deep as the
+    moves left; search_depth sets a fixed depth instead. With time_limit, each move is searched by iterative
+    deepening (up to search_depth, or MAX_SEARCH_DEPTH) and always returns within about time_limit seconds.
+    aspiration (see iterative_deepening) needs time_limit, and can't be used with a pool or workers.
+    Returns the moves made, in the form of game_2048.reconstruct_path, even if the goal was not reached.
+    Pass a search (see new_search) to read its node count afterwards, or stats to count the work done.
+    With a pool (see make_search_pool), or workers to make one for this search, the root moves are searched
+    in parallel (see parallel_root_search).
+    With a position_cache (see position_cache.py, or the path of one), searched values are shared with
+    other processes and later runs.
+    '''
+    if aspiration is not None and (time_limit is None or pool is not None or workers):
+        raise ValueError("aspiration is only used by iterative deepening in one process, so it needs time_limit "
+                         "and no pool or workers")
+    if pool is None and workers:
+        with make_search_pool(workers) as search_pool:
+            return minimax_search(initial_board, to_reach, max_depth, seed, search_depth, time_limit, aspiration,
+                                  search, pool=search_pool, position_cache=position_cache, stats=stats)
+
+    if search is None:
+        search = new_search(stats=stats, position_cache=position_cache)
+    else:
+        if stats is not None:
+            search['stats'] = stats
+        if position_cache is not None:
+            search['position_cache'] = as_cache(position_cache)
+    with section(search['stats']):
+        return _minimax_loop(initial_board, to_reach, max_depth, seed, search_depth, time_limit, aspiration, search,
+                             pool)
+
+
+def _minimax_loop(initial_board, to_reach, max_depth, seed, search_depth, time_limit, aspiration, search, pool):
+    '''
+    Plays the game for minimax_search, one searched move at a time.
+    '''
+    rng = game.as_rng(seed)
+    stats = search['stats']
     path = []
-    board = initial_board
-    while not game.is_goal(board, to_reach) and max_depth > 0:
-        score, best_move = minimax(board, max_depth, True, float('-inf'), float('inf'), to_reach)
+    board = game.compress_board(initial_board)
+    while not game.is_goal(board, to_reach, True) and max_depth > 0:
+        if pool is not None:
+            depth = search_depth or (MAX_SEARCH_DEPTH if time_limit is not None else max_depth)
+            best_move = parallel_root_search(board, to_reach, depth, rng, pool, time_limit, search)
+        elif time_limit is not None:
+            best_move = iterative_deepening(board, to_reach, time_limit, search_depth or MAX_SEARCH_DEPTH, rng, search,
+                                            aspiration)
+        else:
+            score, best_move = minimax(board, search_depth or max_depth, True, float('-inf'), float('inf'),
+                                       to_reach, rng, search)
         if best_move is None:
             break
-        new_board, done = game.move(board, best_move)
+        new_board, done = timed(stats, 'move', game.move_packed, board, best_move, rng, stats)
         if not done:
             break
-        path.append((np.array2string(board, separator=' '), best_move))
+        path.append((new_board, best_move))
         board = new_board
         max_depth -= 1
     return path
-
-
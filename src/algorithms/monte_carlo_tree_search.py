@@ -1,88 +1,397 @@
 import numpy as np
-from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 import sys
 sys.path.append("..")
 
-from game_2048 import is_goal, reconstruct_path, move, get_possible_moves
+from utils import BIT_DICT
+from game_2048 import is_goal, reconstruct_path, move_packed, move_batch, slide_packed, spawn_random_packed, \
+    compress_board, as_rng, spawn_rngs
+from bitboard import empty_cells, max_rank, has_rank, has_rank_batch, nibbles_batch, as_packed
+from stats import new_stats, timed, note_frontier, fire, section, export_stats, merge_stats
+from position_cache import as_cache, cache_lookup, cache_store, MONTE_CARLO
 
 # Author: Caleb L'Italien
-# Last edited: 11/19/2023
+# Last edited: 10/18/2026
 
-PARALLELIZE = False
-def monte_carlo_tree_search(initial_board, to_reach, max_iters=1000):
+# UCT over the 2048 game tree. Decision nodes hold full boards and have one chance node per legal
+# move; chance nodes hold afterstates (the slid board before a tile spawns) and have one decision
+# node per spawn seen so far, found by sampling the spawn. Node statistics live in flat NumPy arrays
+# inside a dict (see new_tree), so a tree costs a few dozen bytes per node.
+
+EXPLORATION = 1.4
+ROLLOUT_DEPTH = 20
+LEAVES_PER_BATCH = 16  # Leaves selected (with virtual loss) before their rollouts are run together
+INITIAL_CAPACITY = 1024
+
+NOT_TERMINAL, WON, LOST = 0, 1, 2
+
+
+def monte_carlo_tree_search(initial_board, to_reach, max_iters=1000, seed=None, time_limit=None,
+                            workers=None, pool=None, position_cache=None, stats=None):
     '''
     Uses MCTS to find the best possible move until no moves are left or the goal is reached.
+    Each move runs max_iters UCT iterations, stopping early if time_limit seconds pass. The subtree
+    under the move actually played is kept for the next move.
+    The seed (or generator) drives every spawn, in the game and in the rollouts.
+    Rollouts run in worker processes if given a pool (see make_rollout_pool) of workers processes (by
+    default one per core), or if workers is set, in which case a pool is made for this search only.
+    With a position_cache (see position_cache.py, or the path of one), the move picked on each board is
+    kept there, and a board already searched with at least as many iterations is not searched again.
+    The work done is counted in stats, if given (see stats.py); the peak frontier is the largest tree held.
+    '''
+    if pool is None and workers:
+        with make_rollout_pool(workers) as search_pool:
+            return monte_carlo_tree_search(initial_board, to_reach, max_iters, seed, time_limit, workers,
+                                           search_pool, position_cache, stats)
+
+    if stats is None:
+        stats = new_stats()
+    workers = 1 if pool is None else workers or os.cpu_count()
+    with section(stats):
+        return _mcts_loop(initial_board, to_reach, max_iters, seed, time_limit, pool, workers, as_cache(position_cache),
+                          stats)
+
+
+def _mcts_loop(initial_board, to_reach, max_iters, seed, time_limit, pool, workers, position_cache, stats):
     '''
-    def rollout(board):
-        '''
-        Repeatedly makes the best found move.
-        '''
-        moves = get_possible_moves(board, PARALLELIZE)
-        while moves:
-            moves = sorted(moves, key=heuristic, reverse=True)
-            board = moves[0]
-            if is_goal(board, to_reach):
-                return True
-            moves = get_possible_moves(board, PARALLELIZE)
-        return False
-
-    def find_best_move(board, max_iters=1000):
-        '''
-        Tries to select the best possible move.
-        '''
-        move_scores = {move: 0 for move in ['up', 'left', 'down', 'right']}
-
-        def rollout_score(possible_move):
-            new_board, done = move(board, possible_move)
-            if not done:
-                return possible_move, 0
-            rollout_success = rollout(np.copy(new_board))
-            final_heuristic = heuristic(new_board) if rollout_success else 0
-            return possible_move, final_heuristic
-
-        with ThreadPoolExecutor() as executor:
-            futures = [executor.submit(rollout_score, move) for move in move_scores]
-            for future in futures:
-                possible_move, score = future.result()
-                move_scores[possible_move] += score
-
-        best_move, best_score = max(move_scores.items(), key=lambda item: item[1])
-        return best_move if best_score > 0 else None
+    Plays the game for monte_carlo_tree_search, one searched move at a time.
+    '''
+    rng = as_rng(seed)
+    goal_rank = BIT_DICT[to_reach]
 
     came_from = {}
-    current_state = tuple(map(tuple, initial_board))
+    start_state = compress_board(initial_board)
+    current_state = start_state
     came_from[current_state] = None
+    tree = new_tree(current_state)
 
-    while not is_goal(np.array(current_state), to_reach):
-        move_direction = find_best_move(np.array(current_state), max_iters)
+    while not is_goal(current_state, to_reach, True):
+        move_direction = find_best_move(tree, goal_rank, rng, max_iters, time_limit, pool, workers, stats,
+                                        position_cache)
+        note_frontier(stats, tree['size'])
         if move_direction is None:
             return None
-        new_board, _ = move(np.array(current_state), move_direction)
-        new_state = tuple(map(tuple, new_board))
+        new_state, _ = timed(stats, 'move', move_packed, current_state, move_direction, rng, stats)
         came_from[new_state] = (current_state, move_direction)
+        tree = advance_tree(tree, move_direction, new_state)
         current_state = new_state
 
-    return reconstruct_path(came_from, tuple(map(tuple, initial_board)), current_state)
+    return reconstruct_path(came_from, start_state, current_state)
+
+
+def new_tree(root_state, capacity=INITIAL_CAPACITY):
+    '''
+    Makes a tree holding only a root decision node. Node i's statistics are entry i of each array.
+    '''
+    tree = {
+        'state': np.zeros(capacity, dtype=np.uint64),
+        'parent': np.full(capacity, -1, dtype=np.int64),
+        'visits': np.zeros(capacity, dtype=np.int64),
+        'value': np.zeros(capacity, dtype=np.float64),
+        'children': np.full((capacity, 4), -1, dtype=np.int64),  # Chance node per direction (decision nodes)
+        'is_chance': np.zeros(capacity, dtype=bool),
+        'expanded': np.zeros(capacity, dtype=bool),
+        'terminal': np.zeros(capacity, dtype=np.int8),
+        'outcomes': {},  # Chance node -> {spawned state: decision node}
+        'size': 0,
+    }
+    add_node(tree, root_state, -1, False)
+    return tree
+
+
+def add_node(tree, state, parent, is_chance):
+    '''
+    Appends a node to the tree, doubling the arrays when they are full. Returns its index.
+    '''
+    index = tree['size']
+    if index == tree['state'].shape[0]:
+        for key in ['state', 'parent', 'visits', 'value', 'children', 'is_chance', 'expanded', 'terminal']:
+            array = tree[key]
+            grown = np.empty((array.shape[0] * 2,) + array.shape[1:], dtype=array.dtype)
+            grown[:index] = array
+            grown[index:] = -1 if key in ('parent', 'children') else 0
+            tree[key] = grown
+    tree['state'][index] = state
+    tree['parent'][index] = parent
+    tree['is_chance'][index] = is_chance
+    tree['size'] = index + 1
+    return index
+
+
+def expand(tree, node, goal_rank, stats=None):
+    '''
+    Adds a chance node for every legal move of a decision node, and marks the node as won or lost if it is.
+    '''
+    if stats is None:
+        stats = new_stats()
+    tree['expanded'][node] = True
+    state = int(tree['state'][node])
+    if has_rank(state, goal_rank):
+        tree['terminal'][node] = WON
+        return
+    stats['expanded'] += 1
+    fire(stats, 'expand', state)
+    for i, direction in enumerate(['up', 'down', 'left', 'right']):
+        afterstate, moved = timed(stats, 'move', slide_packed, state, direction)
+        if moved:
+            stats['generated'] += 1
+            tree['children'][node, i] = add_node(tree, afterstate, node, True)
+    if (tree['children'][node] < 0).all():
+        tree['terminal'][node] = LOST
+
+
+def select(tree, root, goal_rank, rng, stats=None):
+    '''
+    Walks down from the root with UCT at decision nodes and sampled spawns at chance nodes, until it
+    reaches a new or terminal node. Every node on the way is visited now (a virtual loss, so the next
+    selection in the same batch spreads out); the reward is added in backpropagate.
+    Returns the path of nodes taken.
+    '''
+    node = root
+    path = [node]
+    tree['visits'][node] += 1
+    while True:
+        if tree['is_chance'][node]:
+            spawned = spawn_random_packed(int(tree['state'][node]), rng)
+            outcomes = tree['outcomes'].setdefault(node, {})
+            child = outcomes.get(spawned)
+            if child is None:
+                if stats is not None:
+                    stats['generated'] += 1
+                child = add_node(tree, spawned, node, False)
+                outcomes[spawned] = child
+                path.append(child)
+                tree['visits'][child] += 1
+                return path
+            node = child
+        else:
+            if not tree['expanded'][node]:
+                expand(tree, node, goal_rank, stats)
+            if tree['terminal'][node]:
+                return path
+            children = tree['children'][node]
+            legal = children[children >= 0]
+            child_visits = tree['visits'][legal]
+            if (child_visits == 0).any():
+                node = legal[np.argmax(child_visits == 0)]
+            else:
+                ucb = tree['value'][legal] / child_visits + \
+                    EXPLORATION * np.sqrt(np.log(tree['visits'][node]) / child_visits)
+                node = legal[np.argmax(ucb)]
+        path.append(node)
+        tree['visits'][node] += 1
+
+
+def backpropagate(tree, path, reward):
+    '''
+    Adds the reward of a rollout to every node on its path (the visits were counted in select).
+    '''
+    tree['value'][path] += reward
+
+
+def rollout(states, goal_rank, rng, max_depth=ROLLOUT_DEPTH, stats=None):
+    '''
+    Repeatedly makes the best found move from every board at once, stepping all of the
+    rollouts together through move_batch. Returns a reward per board: 1 if the rollout
+    reached the goal, otherwise how close its largest tile got (a fraction of the goal's exponent).
+    '''
+    if stats is None:
+        stats = new_stats()
+    states = np.array(states, dtype=np.uint64)
+    alive = np.ones(states.shape[0], dtype=bool)
+    success = np.zeros(states.shape[0], dtype=bool)
+    for _ in range(max_depth):
+        if not alive.any():
+            break
+        live = np.flatnonzero(alive)
+        children, moved, _, _ = timed(stats, 'move', move_batch, np.repeat(states[live], 4),
+                                      np.tile(np.arange(4), live.size), rng, stats)
+        stats['heuristic_evals'] += int(children.size)
+        scores = timed(stats, 'heuristic', heuristic_batch, children)
+        scores[~moved] = -np.inf
+        scores = scores.reshape(-1, 4)
+        has_move = moved.reshape(-1, 4).any(axis=1)
+        best = children.reshape(-1, 4)[np.arange(live.size), np.argmax(scores, axis=1)]
+
+        states[live[has_move]] = best[has_move]
+        reached = has_move & has_rank_batch(best, goal_rank)
+        success[live[reached]] = True
+        alive[live[reached | ~has_move]] = False
+    progress = nibbles_batch(states).max(axis=1) / goal_rank
+    return np.where(success, 1.0, progress)
+
+
+def make_rollout_pool(workers=None):
+    '''
+    Makes a long-lived process pool for rollouts. Create it once per search or benchmark session and pass
+    it to monte_carlo_tree_search, along with workers; each worker builds the move tables once, when it starts.
+    '''
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+def rollout_chunk(states, goal_rank, seed, max_depth=ROLLOUT_DEPTH, timing=False):
+    '''
+    Runs one chunk of rollouts in a worker process, with its own generator (see rollout_leaves). Boards
+    are passed and rewards returned as plain Python values, so only a few bytes per board cross the
+    process boundary.
+    Returns the rewards and the stats of the worker's rollouts (see stats.export_stats).
+    '''
+    stats = new_stats(timing)
+    rewards = rollout(np.array(states, dtype=np.uint64), goal_rank, as_rng(seed), max_depth, stats)
+    return rewards.tolist(), export_stats(stats)
+
+
+def rollout_leaves(states, goal_rank, rng, pool=None, workers=1, stats=None):
+    '''
+    Runs a rollout from every leaf state, in this process or split into one chunk per worker of the pool
+    (which has workers processes).
+    Each chunk gets its own stream spawned from rng (see game_2048.spawn_rngs), so a seeded search is
+    still reproducible.
+    '''
+    if stats is None:
+        stats = new_stats()
+    if pool is None:
+        return rollout(states, goal_rank, rng, stats=stats)
+    chunks = np.array_split(np.asarray(states, dtype=np.uint64), workers)
+    chunks = [chunk for chunk in chunks if chunk.size]
+    futures = [pool.submit(rollout_chunk, [int(state) for state in chunk], goal_rank, chunk_rng, ROLLOUT_DEPTH,
+                           stats['timing'])
+               for chunk, chunk_rng in zip(chunks, spawn_rngs(rng, len(chunks)))]
+    rewards = []
+    for future in futures:
+        chunk_rewards, worker_stats = future.result()
+        rewards.extend(chunk_rewards)
+        merge_stats(stats, worker_stats)
+    return np.array(rewards)
+
+
+def run_iterations(tree, goal_rank, rng, max_iters, time_limit=None, pool=None, workers=1, stats=None):
+    '''
+    Runs up to max_iters UCT iterations from the root (node 0), stopping early once time_limit seconds pass.
+    Leaves are selected LEAVES_PER_BATCH at a time (per worker, with a pool of workers processes) and their
+    rollouts run as one batch.
+    '''
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+    batch_size = LEAVES_PER_BATCH * workers
+    done = 0
+    while done < max_iters and (deadline is None or time.perf_counter() < deadline):
+        paths = [select(tree, 0, goal_rank, rng, stats) for _ in range(min(batch_size, max_iters - done))]
+        done += len(paths)
+
+        leaves = np.array([path[-1] for path in paths])
+        terminal = tree['terminal'][leaves]
+        rewards = np.where(terminal == WON, 1.0, 0.0)
+        to_roll = np.flatnonzero(terminal == NOT_TERMINAL)
+        if to_roll.size:
+            rewards[to_roll] = rollout_leaves(tree['state'][leaves[to_roll]], goal_rank, rng, pool, workers, stats)
+        for path, reward in zip(paths, rewards):
+            backpropagate(tree, path, reward)
+
+
+def find_best_move(tree, goal_rank, rng, max_iters=1000, time_limit=None, pool=None, workers=1, stats=None,
+                   position_cache=None):
+    '''
+    Searches from the root of the tree and returns the most visited move, or None if there are no moves.
+    With a position cache, the root's move is read from it if an earlier search of the root had at least
+    as many visits (to the nearest power of two) as this one asks for, and stored in it otherwise.
+    '''
+    if not tree['expanded'][0]:
+        expand(tree, 0, goal_rank, stats)
+    if tree['terminal'][0] == LOST:
+        return None
+    if position_cache is not None:
+        stored = cache_lookup(position_cache, MONTE_CARLO, goal_rank, tree['state'][0])
+        if stored is not None and stored[1] >= max_iters.bit_length():
+            if stats is not None:
+                stats['position_hits'] += 1
+            return stored[2]
+    run_iterations(tree, goal_rank, rng, max_iters, time_limit, pool, workers, stats)
+
+    children = tree['children'][0]
+    visits = np.where(children >= 0, tree['visits'][children], -1)
+    best = int(np.argmax(visits))
+    if position_cache is not None:
+        chance = children[best]
+        cache_store(position_cache, MONTE_CARLO, goal_rank, tree['state'][0],
+                    tree['value'][chance] / max(tree['visits'][chance], 1), int(tree['visits'][0]).bit_length(),
+                    ['up', 'down', 'left', 'right'][best])
+    return ['up', 'down', 'left', 'right'][best]
 
 
-def heuristic(board):
+def advance_tree(tree, direction, new_state):
     '''
-    Scores the given board based on where the maximum tile is, the number of empty 
-    tiles, and the maximum tile's value. 
+    Moves the root to the board reached by playing direction and spawning new_state. The subtree under it
+    is copied into a fresh, compact tree; if the spawn was never explored, a new tree is started.
+    '''
+    chance = int(tree['children'][0, ['up', 'down', 'left', 'right'].index(direction)])
+    child = tree['outcomes'].get(chance, {}).get(new_state)
+    if child is None:
+        return new_tree(new_state)
+
+    # Breadth-first copy, so parents always come before their children
+    order = [child]
+    for node in order:
+        if tree['is_chance'][node]:
+            order.extend(tree['outcomes'].get(node, {}).values())
+        else:
+            order.extend(int(c) for c in tree['children'][node] if c >= 0)
+    old = np.array(order, dtype=np.int64)
+    remap = {node: i for i, node in enumerate(order)}
+
+    subtree = new_tree(new_state, capacity=max(INITIAL_CAPACITY, 2 * old.size))
+    for key in ['state', 'visits', 'value', 'is_chance', 'expanded', 'terminal']:
+        subtree[key][:old.size] = tree[key][old]
+    subtree['parent'][:old.size] = [remap.get(int(p), -1) for p in tree['parent'][old]]
+    subtree['children'][:old.size] = [[remap[int(c)] if c >= 0 else -1 for c in row] for row in tree['children'][old]]
+    subtree['outcomes'] = {remap[node]: {state: remap[c] for state, c in outcomes.items()}
+                           for node, outcomes in tree['outcomes'].items() if node in remap}
+    subtree['size'] = old.size
+    return subtree
+
+
+def heuristic(state):
+    '''
+    Scores the given compressed board based on where the maximum tile is, the number of empty
+    tiles, and the maximum tile's value.
     '''
     empty_weight = 2.7
     max_tile_weight = 1.0
     corner_weight = 10.0
-    empty_count = len(board[board == 0])
-    max_tile = np.max(board)
+    empty_count = len(empty_cells(state))
+    top_rank = max_rank(state)
+    max_tile = 1 << top_rank if top_rank else 0
 
     max_tile_in_corner_bonus = 0
-    if (board[0, 0] == max_tile or board[0, -1] == max_tile or
-        board[-1, 0] == max_tile or board[-1, -1] == max_tile):
+    if (state >> 60 == top_rank or (state >> 48) & 0xF == top_rank or
+        (state >> 12) & 0xF == top_rank or state & 0xF == top_rank):
         max_tile_in_corner_bonus = corner_weight
 
     score = (empty_weight * empty_count) + \
             (max_tile_weight * max_tile) + \
             max_tile_in_corner_bonus
-    return score
\ No newline at end of file
+    return score
+
+
+def heuristic_batch(boards):
+    '''
+    Scores many boards at once, given as an (N,) uint64 array of compressed boards or an (N, 4, 4) array.
+    Returns an (N,) float array with the same values as heuristic.
+    '''
+    empty_weight = 2.7
+    max_tile_weight = 1.0
+    corner_weight = 10.0
+    ranks = nibbles_batch(as_packed(boards))
+    empty_count = (ranks == 0).sum(axis=1)
+    top_rank = ranks.max(axis=1)
+    max_tile = np.where(top_rank > 0, np.left_shift(1, top_rank), 0)
+
+    max_tile_in_corner = (ranks[:, [0, 3, 12, 15]] == top_rank[:, None]).any(axis=1)
+    max_tile_in_corner_bonus = np.where(max_tile_in_corner, corner_weight, 0)
+
+    score = (empty_weight * empty_count) + \
+            (max_tile_weight * max_tile) + \
+            max_tile_in_corner_bonus
+    return score
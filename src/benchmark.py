@@ -0,0 +1,356 @@
+import argparse
+import csv
+import json
+import os
+import re
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from algorithms.a_star_search import a_star_search, beam_search, ida_star_search
+from algorithms.monte_carlo_tree_search import monte_carlo_tree_search
+from algorithms.minimax_search import minimax_search
+from algorithms.dijkstra_search import dijkstra_search, dijkstra_frontier_search
+from algorithms.expectimax_search import expectimax_search
+from game_2048 import generate_new_board, make_rng, is_goal
+from stats import new_stats
+from position_cache import open_cache, start_generation, close_cache
+
+# Author: Caleb L'Italien
+# Last edited: 10/18/2026
+
+# Benchmarks: every algorithm plays the same seeded games for every target tile, one game per task of a
+# process pool. Each game gives a row (see run_game) with its wall time, boards made, nodes per second,
+# the peak memory of the game, moves and whether it was solved. Rows are grouped by algorithm and
+# target and summarized with their mean, median and 95th percentile (see summarize), and can be compared
+# to a baseline such as the Rust solver's figures in RustStatistics (see load_rust_baseline and
+# compare_to_baseline).
+# Games can share a position cache (see position_cache.py), which also carries over from one benchmark
+# to the next, to measure how much a warm cache saves.
+
+SEED = 2048  # Game i for a target is seeded from (SEED, target, i), so every algorithm plays the same boards
+GAMES_PER_TARGET = 10
+TO_REACH_VALUES = [8, 16, 32, 64, 128, 256, 512, 1024, 2048]
+
+ALGORITHMS = {
+    'a_star_search': a_star_search,
+    'beam_search': beam_search,
+    'ida_star_search': ida_star_search,
+    'monte_carlo_tree_search': monte_carlo_tree_search,
+    'minimax_search': minimax_search,
+    'dijkstra_search': dijkstra_search,
+    'dijkstra_frontier_search': dijkstra_frontier_search,
+    'expectimax_search': expectimax_search,
+}
+POSITION_CACHE_ALGORITHMS = ['a_star_search', 'monte_carlo_tree_search', 'minimax_search', 'expectimax_search']
+# Options every game of an algorithm gets unless run_benchmark is given others. Minimax would otherwise search
+# each move as deep as the moves left, so it gets a per-move time limit.
+DEFAULT_OPTIONS = {'minimax_search': {'time_limit': 0.1}}
+
+SUMMARY_METRICS = ['seconds', 'boards', 'moves', 'nodes_per_second', 'peak_rss_mb']
+BASELINE_METRICS = ['seconds', 'boards', 'moves']
+BASELINE_PATH = os.path.join("..", "RustStatistics")
+WARM_UP_TARGET = 8  # Each worker first plays a game this short with every algorithm, so timed games start warm
+CLEAR_REFS_PATH = "/proc/self/clear_refs"  # Linux only: writing 5 to it starts a new peak memory (VmHWM)
+STATUS_PATH = "/proc/self/status"
+
+
+def game_seed(seed, target, game):
+    '''
+    Returns the seed of one game, the same for every algorithm.
+    '''
+    return int(np.random.SeedSequence([seed, target, game]).generate_state(1, np.uint64)[0])
+
+
+def reset_peak_rss():
+    '''
+    Starts a new peak for peak_rss_mb, where the system allows it (Linux). Returns whether it did.
+    '''
+    try:
+        with open(CLEAR_REFS_PATH, 'w') as file:
+            file.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    '''
+    Returns the most memory this process has held since reset_peak_rss (or since it started, where the peak
+    can't be reset), in megabytes.
+    '''
+    try:
+        with open(STATUS_PATH) as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024  # In kilobytes
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024  # Bytes on macOS, kilobytes on Linux
+
+
+def run_game(algorithm, target, game, seed, options=None):
+    '''
+    Plays one seeded game with the named algorithm (options are passed on as keyword arguments).
+    Returns its row. A search that raises is recorded as unsolved, with the error.
+    '''
+    rng = make_rng(seed)
+    board = generate_new_board(rng)
+    stats = new_stats()
+    error = ''
+    reset_peak_rss()
+    started = time.perf_counter()
+    try:
+        path = ALGORITHMS[algorithm](board, target, seed=rng, stats=stats, **(options or {}))
+    except Exception as e:
+        path = None
+        error = f"{type(e).__name__}: {e}"
+    seconds = time.perf_counter() - started
+    # Some searches (minimax_search) return the moves they made even when they gave up, so every path is checked
+    solved = path is not None and _path_reaches(path, board, target)
+    return {
+        'algorithm': algorithm,
+        'target': target,
+        'game': game,
+        'seed': seed,
+        'solved': solved,
+        'moves': len(path) if solved else None,
+        'seconds': seconds,
+        'boards': stats['boards'],
+        'expanded': stats['expanded'],
+        'nodes_per_second': stats['expanded'] / seconds if seconds > 0 else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+        'error': error,
+    }
+
+
+def warm_up(algorithms):
+    '''
+    Runs in each worker as it starts: plays a short game (seed 0) with every algorithm, so the tables and
+    imports they build on first use are ready before any timed game.
+    '''
+    for algorithm in algorithms:
+        run_game(algorithm, WARM_UP_TARGET, 0, 0)
+
+
+def _path_reaches(path, board, target):
+    '''
+    Checks whether a path reached the target: its last board (or the starting board, for an empty path) holds it.
+    '''
+    return is_goal(path[-1][0], target, True) if path else is_goal(board, target)
+
+
+def run_benchmark(algorithms, targets=TO_REACH_VALUES, games=GAMES_PER_TARGET, workers=None, seed=SEED,
+                  options=None, progress=False, position_cache=None):
+    '''
+    Plays games seeded games for every algorithm and target on a process pool of workers processes.
+    options maps an algorithm's name to keyword arguments for it, added to (or replacing) its DEFAULT_OPTIONS.
+    Returns the rows, in a fixed order.
+    Each worker is warmed up first (see warm_up), so no game pays for building tables. Workers are reused
+    from game to game where each game's peak memory can be measured on its own (see reset_peak_rss);
+    elsewhere each worker plays one game and is replaced.
+    With position_cache (the path of a position cache, made if it doesn't exist), every game of the
+    algorithms that can use one reads and adds to it.
+    '''
+    options = {algorithm: dict(DEFAULT_OPTIONS.get(algorithm, {}), **((options or {}).get(algorithm) or {}))
+               for algorithm in algorithms}
+    if position_cache is not None:
+        cache = open_cache(position_cache)  # Made here, before any worker maps it
+        start_generation(cache)
+        close_cache(cache)
+        for algorithm in algorithms:
+            if algorithm in POSITION_CACHE_ALGORITHMS:
+                options[algorithm]['position_cache'] = position_cache
+    tasks = [(algorithm, target, game, game_seed(seed, target, game), options.get(algorithm))
+             for algorithm in algorithms for target in targets for game in range(games)]
+    rows = []
+    tasks_per_worker = None if os.path.exists(CLEAR_REFS_PATH) else 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=warm_up, initargs=(list(algorithms),),
+                             max_tasks_per_child=tasks_per_worker) as pool:
+        futures = [pool.submit(run_game, *task) for task in tasks]
+        for future in as_completed(futures):
+            row = future.result()
+            rows.append(row)
+            if progress:
+                print(f"{row['algorithm']} target {row['target']} game {row['game']}: "
+                      f"{'solved in ' + str(row['moves']) + ' moves' if row['solved'] else 'not solved'}, "
+                      f"{row['seconds']:.2f} seconds")
+    rows.sort(key=lambda row: (algorithms.index(row['algorithm']), row['target'], row['game']))
+    return rows
+
+
+def _describe(values):
+    '''
+    Returns the mean, median and 95th percentile of some values, or None for each if there are none.
+    '''
+    if not values:
+        return {'mean': None, 'median': None, 'p95': None}
+    values = np.asarray(values, dtype=np.float64)
+    return {'mean': float(values.mean()), 'median': float(np.median(values)), 'p95': float(np.percentile(values, 95))}
+
+
+def summarize(rows):
+    '''
+    Groups rows by algorithm and target. Returns a summary per group: the number of games, the solve rate,
+    and the mean, median and p95 of each metric. Moves are over solved games only.
+    '''
+    groups = {}
+    for row in rows:
+        groups.setdefault((row['algorithm'], row['target']), []).append(row)
+    summaries = []
+    for (algorithm, target), group in groups.items():
+        summary = {'algorithm': algorithm, 'target': target, 'games': len(group),
+                   'solve_rate': sum(row['solved'] for row in group) / len(group)}
+        for metric in SUMMARY_METRICS:
+            values = [row[metric] for row in group if row[metric] is not None]
+            for statistic, value in _describe(values).items():
+                summary[f"{metric}_{statistic}"] = value
+        summaries.append(summary)
+    return summaries
+
+
+def load_rust_baseline(path=BASELINE_PATH):
+    '''
+    Reads the Rust solver's averages (RustStatistics) as {target: {'seconds', 'boards', 'moves'}}.
+    '''
+    baseline = {}
+    target = None
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            header = re.fullmatch(r'---(\d+)---', line)
+            if header:
+                target = int(header.group(1))
+                baseline[target] = {}
+                continue
+            if target is None or ':' not in line:
+                continue
+            name, value = line.split(':', 1)
+            value = float(value.replace(',', ''))
+            if name.startswith('Average boards'):
+                baseline[target]['boards'] = value
+            elif name.startswith('Average time'):
+                baseline[target]['seconds'] = value / 1000  # Stored in milliseconds
+            elif name.startswith('Average moves'):
+                baseline[target]['moves'] = value
+    return baseline
+
+
+def load_baseline(path):
+    '''
+    Reads a baseline: a summary JSON written by write_json (keyed by algorithm and target), or RustStatistics.
+    Returns {target: {metric: mean}} for RustStatistics, or {(algorithm, target): {metric: mean}}.
+    '''
+    if not path.endswith('.json'):
+        return load_rust_baseline(path)
+    with open(path) as file:
+        summaries = json.load(file)['summary']
+    return {(summary['algorithm'], summary['target']): {metric: summary[f"{metric}_mean"] for metric in BASELINE_METRICS}
+            for summary in summaries}
+
+
+def compare_to_baseline(summaries, baseline):
+    '''
+    Compares each group's means with the baseline's, by target (or by algorithm and target, for a baseline
+    of earlier benchmark results). Returns a row per group found in both, with each mean, the baseline's,
+    and their ratio (above 1 is slower, bigger or longer than the baseline).
+    '''
+    comparisons = []
+    for summary in summaries:
+        expected = baseline.get((summary['algorithm'], summary['target']), baseline.get(summary['target']))
+        if expected is None:
+            continue
+        comparison = {'algorithm': summary['algorithm'], 'target': summary['target']}
+        for metric in BASELINE_METRICS:
+            ours, theirs = summary[f"{metric}_mean"], expected.get(metric)
+            comparison[metric] = ours
+            comparison[f"baseline_{metric}"] = theirs
+            comparison[f"{metric}_ratio"] = ours / theirs if ours is not None and theirs else None
+        comparisons.append(comparison)
+    return comparisons
+
+
+def write_csv(records, path):
+    '''
+    Writes a list of dicts (rows, summaries or comparisons) as a CSV file with a header.
+    '''
+    if not records:
+        return
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=list(records[0]))
+        writer.writeheader()
+        writer.writerows(records)
+
+
+def write_json(path, rows, summaries, comparisons=None):
+    '''
+    Writes the rows, the summaries and any baseline comparison as one JSON file.
+    '''
+    with open(path, 'w') as file:
+        json.dump({'rows': rows, 'summary': summaries, 'baseline': comparisons or []}, file, indent=2)
+
+
+def save_results(prefix, rows, summaries, comparisons=None):
+    '''
+    Writes prefix_games.csv, prefix_summary.csv, prefix_baseline.csv (if comparing) and prefix.json.
+    '''
+    write_csv(rows, f"{prefix}_games.csv")
+    write_csv(summaries, f"{prefix}_summary.csv")
+    if comparisons:
+        write_csv(comparisons, f"{prefix}_baseline.csv")
+    write_json(f"{prefix}.json", rows, summaries, comparisons)
+
+
+def format_summary(summaries, comparisons=None):
+    '''
+    Returns the summaries (and baseline ratios) as printable lines.
+    '''
+    ratios = {(comparison['algorithm'], comparison['target']): comparison for comparison in comparisons or []}
+    lines = []
+    for summary in summaries:
+        line = (f"{summary['algorithm']} {summary['target']}: solved {summary['solve_rate']:.0%} of "
+                f"{summary['games']}, {summary['seconds_mean']:.3f} s mean, {summary['seconds_p95']:.3f} s p95, "
+                f"{summary['boards_mean']:.0f} boards, {summary['nodes_per_second_mean']:.0f} nodes/s, "
+                f"{summary['peak_rss_mb_mean']:.0f} MB")
+        comparison = ratios.get((summary['algorithm'], summary['target']))
+        if comparison is not None and comparison['seconds_ratio'] is not None:
+            line += f" ({comparison['seconds_ratio']:.1f}x the baseline's time)"
+        lines.append(line)
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark search algorithms on seeded games.")
+    parser.add_argument('algorithms', nargs='+', choices=list(ALGORITHMS))
+    parser.add_argument('--targets', type=int, nargs='+', default=TO_REACH_VALUES)
+    parser.add_argument('--games', type=int, default=GAMES_PER_TARGET)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--output', default=os.path.join("..", "metrics", "benchmark"),
+                        help="prefix of the CSV and JSON files written")
+    parser.add_argument('--baseline', default=None,
+                        help=f"RustStatistics ({BASELINE_PATH}) or an earlier benchmark's JSON to compare against")
+    parser.add_argument('--position-cache', default=None,
+                        help="position cache file shared by every game and kept for later runs (made if missing)")
+    parser.add_argument('--time-limit', type=float, default=None,
+                        help="minimax_search's seconds per move "
+                             f"(default {DEFAULT_OPTIONS['minimax_search']['time_limit']})")
+    parser.add_argument('--depth', type=int, default=None, help="minimax_search's moves looked ahead")
+    args = parser.parse_args()
+
+    minimax_options = {}
+    if args.time_limit is not None:
+        minimax_options['time_limit'] = args.time_limit
+    if args.depth is not None:
+        minimax_options['search_depth'] = args.depth
+        if args.time_limit is None:
+            minimax_options['time_limit'] = None  # A fixed depth instead of the default time limit
+    rows = run_benchmark(args.algorithms, args.targets, args.games, args.workers, args.seed,
+                         {'minimax_search': minimax_options}, progress=True, position_cache=args.position_cache)
+    summaries = summarize(rows)
+    comparisons = compare_to_baseline(summaries, load_baseline(args.baseline)) if args.baseline else None
+    save_results(args.output, rows, summaries, comparisons)
+    for line in format_summary(summaries, comparisons):
+        print(line)
@@ -0,0 +1,443 @@
+# Author: Caleb L'Italien
+# Last edited: 10/18/2026
+
+# Table-driven move engine for the 64 bit board representation made by compress_board.
+# Each row (or column) of the board is a 16 bit word, so every possible row can be slid
+# ahead of time. A move is then four table lookups instead of a NumPy copy and Python loops.
+#
+# Layout (same as compress_board): the top left tile is the highest nibble, rows are
+# 16 bits each, and a nibble holds the power of two of the tile (0 for empty).
+
+import numpy as np
+
+ROW_MASK = 0xFFFF
+NIBBLE_MASK = 0xF
+NIBBLE_ONES = 0x1111111111111111  # 1 in every nibble
+NIBBLE_HIGHS = 0x8888888888888888  # The top bit of every nibble
+
+
+def _slide_row_left(tiles):
+    '''
+    Slides a single row of exponents to the left. Mirrors compress and merge in game_2048.move
+    (three merge passes, compressing after each), so the tables give exactly the same boards.
+    Returns the new row and the score gained from merges.
+    '''
+    def compress(row):
+        packed = [tile for tile in row if tile != 0]
+        return packed + [0] * (4 - len(packed))
+
+    row = compress(tiles)
+    score = 0
+    for _ in range(3):
+        for col in range(3):
+            # A 32768 tile can't be doubled inside a nibble, so it is left alone
+            if row[col] == row[col + 1] and row[col] != 0 and row[col] < NIBBLE_MASK:
+                row[col] += 1
+                row[col + 1] = 0
+                score += 1 << row[col]
+        row = compress(row)
+    return row, score
+
+
+def _reverse_row(row):
+    '''
+    Reverses the four nibbles of a 16 bit row.
+    '''
+    return ((row & 0xF) << 12) | ((row & 0xF0) << 4) | ((row >> 4) & 0xF0) | (row >> 12)
+
+
+def _unpack_col(row):
+    '''
+    Spreads a 16 bit row into the first column of a 64 bit board.
+    '''
+    return (((row >> 12) & 0xF) << 60) | (((row >> 8) & 0xF) << 44) | \
+           (((row >> 4) & 0xF) << 28) | ((row & 0xF) << 12)
+
+
+def _build_tables():
+    '''
+    Precomputes the result and score of sliding every possible row in each direction.
+    '''
+    row_left = [0] * 65536
+    row_right = [0] * 65536
+    col_up = [0] * 65536
+    col_down = [0] * 65536
+    score_left = [0] * 65536
+    score_right = [0] * 65536
+    for row in range(65536):
+        tiles = [(row >> 12) & 0xF, (row >> 8) & 0xF, (row >> 4) & 0xF, row & 0xF]
+        result, score = _slide_row_left(tiles)
+        result_row = (result[0] << 12) | (result[1] << 8) | (result[2] << 4) | result[3]
+        reversed_row = _reverse_row(row)
+        reversed_result = _reverse_row(result_row)
+
+        row_left[row] = result_row
+        col_up[row] = _unpack_col(result_row)
+        score_left[row] = score
+        row_right[reversed_row] = reversed_result
+        col_down[reversed_row] = _unpack_col(reversed_result)
+        score_right[reversed_row] = score
+    return row_left, row_right, col_up, col_down, score_left, score_right
+
+
+ROW_LEFT, ROW_RIGHT, COL_UP, COL_DOWN, SCORE_LEFT, SCORE_RIGHT = _build_tables()
+
+
+def transpose(state):
+    '''
+    Transposes a packed board, so columns become rows.
+    '''
+    a1 = state & 0xF0F00F0FF0F00F0F
+    a2 = state & 0x0000F0F00000F0F0
+    a3 = state & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+
+def _slide_rows(state, row_table, score_table):
+    '''
+    Slides all four rows of a packed board through a row table.
+    '''
+    r0, r1, r2, r3 = (state >> 48) & ROW_MASK, (state >> 32) & ROW_MASK, (state >> 16) & ROW_MASK, state & ROW_MASK
+    new_state = (row_table[r0] << 48) | (row_table[r1] << 32) | (row_table[r2] << 16) | row_table[r3]
+    return new_state, score_table[r0] + score_table[r1] + score_table[r2] + score_table[r3]
+
+
+def _slide_cols(state, col_table, score_table):
+    '''
+    Slides all four columns of a packed board through a column table.
+    '''
+    t = transpose(state)
+    c0, c1, c2, c3 = (t >> 48) & ROW_MASK, (t >> 32) & ROW_MASK, (t >> 16) & ROW_MASK, t & ROW_MASK
+    new_state = col_table[c0] | (col_table[c1] >> 4) | (col_table[c2] >> 8) | (col_table[c3] >> 12)
+    return new_state, score_table[c0] + score_table[c1] + score_table[c2] + score_table[c3]
+
+
+def move_state(state, direction):
+    '''
+    Slides a packed board in one of the four directions. Does not spawn a new tile.
+    Returns the new packed board, a boolean indicating if any tile moved, and the score gained.
+    '''
+    if direction == 'left':
+        new_state, score = _slide_rows(state, ROW_LEFT, SCORE_LEFT)
+    elif direction == 'right':
+        new_state, score = _slide_rows(state, ROW_RIGHT, SCORE_RIGHT)
+    elif direction == 'up':
+        new_state, score = _slide_cols(state, COL_UP, SCORE_LEFT)
+    elif direction == 'down':
+        new_state, score = _slide_cols(state, COL_DOWN, SCORE_RIGHT)
+    else:
+        raise ValueError(f"Unknown direction: {direction}")
+    return new_state, new_state != state, score
+
+
+# The 8 symmetries of the board (rotations and reflections). Transform t transposes the board if t & 4,
+# then mirrors each row if t & 1, then reverses the row order if t & 2. The game plays the same on
+# every symmetric copy of a board, as long as moves are mapped along with it (see transform_direction).
+
+def mirror_rows(state):
+    '''
+    Mirrors a packed board left to right.
+    '''
+    return ((state & 0xF000F000F000F000) >> 12) | ((state & 0x0F000F000F000F00) >> 4) | \
+           ((state & 0x00F000F000F000F0) << 4) | ((state & 0x000F000F000F000F) << 12)
+
+
+def reverse_rows(state):
+    '''
+    Mirrors a packed board top to bottom.
+    '''
+    return (state >> 48) | ((state >> 16) & 0xFFFF0000) | ((state & 0xFFFF0000) << 16) | ((state & 0xFFFF) << 48)
+
+
+def transform(state, t):
+    '''
+    Applies symmetry t (0-7) to a packed board.
+    '''
+    if t & 4:
+        state = transpose(state)
+    if t & 1:
+        state = mirror_rows(state)
+    if t & 2:
+        state = reverse_rows(state)
+    return state
+
+
+def untransform(state, t):
+    '''
+    Undoes symmetry t on a packed board.
+    '''
+    if t & 2:
+        state = reverse_rows(state)
+    if t & 1:
+        state = mirror_rows(state)
+    if t & 4:
+        state = transpose(state)
+    return state
+
+
+def canonical(state):
+    '''
+    Returns the canonical key of a packed board (the smallest of its 8 symmetric copies) and the
+    symmetry that turns the board into it.
+    '''
+    t = transpose(state)
+    m, tm = mirror_rows(state), mirror_rows(t)
+    return min((state, 0), (m, 1), (reverse_rows(state), 2), (reverse_rows(m), 3),
+               (t, 4), (tm, 5), (reverse_rows(t), 6), (reverse_rows(tm), 7))
+
+
+def canonical_key(state):
+    '''
+    Returns just the canonical key of a packed board.
+    '''
+    t = transpose(state)
+    m, tm = mirror_rows(state), mirror_rows(t)
+    return min(state, m, reverse_rows(state), reverse_rows(m), t, tm, reverse_rows(t), reverse_rows(tm))
+
+
+_TRANSPOSED = {'up': 'left', 'left': 'up', 'down': 'right', 'right': 'down'}
+_MIRRORED = {'up': 'up', 'down': 'down', 'left': 'right', 'right': 'left'}
+_REVERSED = {'up': 'down', 'down': 'up', 'left': 'left', 'right': 'right'}
+
+
+def transform_direction(direction, t):
+    '''
+    Maps a move on a board to the same move on the board after symmetry t.
+    '''
+    if t & 4:
+        direction = _TRANSPOSED[direction]
+    if t & 1:
+        direction = _MIRRORED[direction]
+    if t & 2:
+        direction = _REVERSED[direction]
+    return direction
+
+
+def untransform_direction(direction, t):
+    '''
+    Maps a move on the board after symmetry t back to the same move on the original board.
+    '''
+    if t & 2:
+        direction = _REVERSED[direction]
+    if t & 1:
+        direction = _MIRRORED[direction]
+    if t & 4:
+        direction = _TRANSPOSED[direction]
+    return direction
+
+
+def empty_cells(state):
+    '''
+    Returns the shifts of every empty nibble on a packed board, in row-major order (60 is the top left).
+    '''
+    return [shift for shift in range(60, -1, -4) if not (state >> shift) & NIBBLE_MASK]
+
+
+def max_rank(state):
+    '''
+    Returns the largest exponent on a packed board (11 for a 2048 tile).
+    '''
+    best = 0
+    while state:
+        nibble = state & NIBBLE_MASK
+        if nibble > best:
+            best = nibble
+        state >>= 4
+    return best
+
+
+def has_rank(state, rank):
+    '''
+    Checks if any nibble of a packed board holds the given exponent.
+    '''
+    # XOR turns the matching nibbles to 0, and subtracting 1 from every nibble borrows into the top bit
+    # of only the nibbles that were 0 (the first one exactly, so any match is found)
+    matches = state ^ (rank * NIBBLE_ONES)
+    return ((matches - NIBBLE_ONES) & ~matches & NIBBLE_HIGHS) != 0
+
+
+def unpack_state(state):
+    '''
+    Reconstructs the 4x4 array of tile values of one packed board.
+    '''
+    return TILE_VALUES[[(state >> shift) & NIBBLE_MASK for shift in range(60, -1, -4)]].reshape(4, 4)
+
+
+# Batched versions of the tables above. These advance whole arrays of packed boards at once.
+
+DIRECTIONS = ['up', 'down', 'left', 'right']
+DIRECTION_INDEX = {direction: i for i, direction in enumerate(DIRECTIONS)}
+TILE_VALUES = np.array([0] + [1 << rank for rank in range(1, 16)], dtype=np.int64)
+CELL_SHIFTS = np.arange(60, -1, -4, dtype=np.uint64)  # Row-major cell order, top left first
+
+ROW_LEFT_ARRAY = np.array(ROW_LEFT, dtype=np.uint64)
+ROW_RIGHT_ARRAY = np.array(ROW_RIGHT, dtype=np.uint64)
+COL_UP_ARRAY = np.array(COL_UP, dtype=np.uint64)
+COL_DOWN_ARRAY = np.array(COL_DOWN, dtype=np.uint64)
+SCORE_LEFT_ARRAY = np.array(SCORE_LEFT, dtype=np.int64)
+SCORE_RIGHT_ARRAY = np.array(SCORE_RIGHT, dtype=np.int64)
+
+_ROW_SHIFTS = np.array([48, 32, 16, 0], dtype=np.uint64)
+_COL_SHIFTS = np.array([0, 4, 8, 12], dtype=np.uint64)
+
+
+def as_packed(boards):
+    '''
+    Returns boards as an (N,) uint64 array, packing them first if they are an (N, 4, 4) array.
+    '''
+    boards = np.asarray(boards)
+    if boards.ndim == 3:
+        return pack_boards(boards)
+    return boards.astype(np.uint64).reshape(-1)
+
+
+def nibbles_batch(states):
+    '''
+    Splits packed boards into an (N, 16) array of exponents in row-major order.
+    '''
+    return ((np.asarray(states, dtype=np.uint64)[:, None] >> CELL_SHIFTS) & np.uint64(NIBBLE_MASK)).astype(np.intp)
+
+
+def pack_boards(boards):
+    '''
+    Compresses an (N, 4, 4) array of tile values into an (N,) uint64 array of packed boards.
+    Raises ValueError if a tile is not 0 or a power of two from 2 to 32768, which a nibble can't hold.
+    '''
+    # Tiles are powers of two, so a tile's exponent is in the exponent bits of its float64 (1023 + rank, or 0
+    # for an empty cell). The low nibble of that plus 1 is the rank, masked to 0 where the cell is empty.
+    bits = np.asarray(boards).reshape(-1, 16).astype(np.float64).view(np.uint64)
+    exponents = bits >> np.uint64(52)
+    # A valid tile has no fraction bits and is empty (exponent 0) or of rank 1 to 15 (exponent 1024 to 1038)
+    valid = ((bits & np.uint64((1 << 52) - 1)) == 0) & ((exponents == 0) | (exponents - np.uint64(1024) < 15))
+    if not valid.all():
+        raise ValueError(f"Tiles can't be packed: {np.unique(np.asarray(boards).reshape(-1, 16)[~valid]).tolist()}")
+    ranks = ((exponents + np.uint64(1)) & np.uint64(NIBBLE_MASK)) & (np.uint64(0) - (exponents >> np.uint64(10)))
+    return np.bitwise_or.reduce(ranks << CELL_SHIFTS, axis=1)
+
+
+def unpack_boards(states):
+    '''
+    Reconstructs an (N, 4, 4) array of tile values from an (N,) array of packed boards.
+    '''
+    ranks = nibbles_batch(states)
+    return (np.left_shift(1, ranks) >> (ranks == 0)).reshape(-1, 4, 4)  # 1 << 0 shifted back to 0 for empty cells
+
+
+def transpose_batch(states):
+    '''
+    Transposes every packed board in an array.
+    '''
+    a1 = states & np.uint64(0xF0F00F0FF0F00F0F)
+    a2 = states & np.uint64(0x0000F0F00000F0F0)
+    a3 = states & np.uint64(0x0F0F00000F0F0000)
+    a = a1 | (a2 << np.uint64(12)) | (a3 >> np.uint64(12))
+    b1 = a & np.uint64(0xFF00FF0000FF00FF)
+    b2 = a & np.uint64(0x00FF00FF00000000)
+    b3 = a & np.uint64(0x00000000FF00FF00)
+    return b1 | (b2 >> np.uint64(24)) | (b3 << np.uint64(24))
+
+
+def _rows_of(states):
+    '''
+    Splits packed boards into an (N, 4) array of 16 bit row indices.
+    '''
+    return ((states[:, None] >> _ROW_SHIFTS) & np.uint64(ROW_MASK)).astype(np.intp)
+
+
+def slide_batch(states, directions):
+    '''
+    Slides every packed board in its own direction (0-3, in DIRECTIONS order). Does not spawn.
+    Returns the new boards, a mask of the boards that moved, and the score gained by each.
+    '''
+    states = np.asarray(states, dtype=np.uint64)
+    directions = np.broadcast_to(np.asarray(directions), states.shape)
+    new_states = states.copy()
+    scores = np.zeros(states.shape, dtype=np.int64)
+
+    for code, (table, score_table, on_cols) in enumerate([(COL_UP_ARRAY, SCORE_LEFT_ARRAY, True),
+                                                           (COL_DOWN_ARRAY, SCORE_RIGHT_ARRAY, True),
+                                                           (ROW_LEFT_ARRAY, SCORE_LEFT_ARRAY, False),
+                                                           (ROW_RIGHT_ARRAY, SCORE_RIGHT_ARRAY, False)]):
+        selected = np.flatnonzero(directions == code)
+        if selected.size == 0:
+            continue
+        subset = states[selected]
+        if on_cols:
+            rows = _rows_of(transpose_batch(subset))
+            new_states[selected] = np.bitwise_or.reduce(table[rows] >> _COL_SHIFTS, axis=1)
+        else:
+            rows = _rows_of(subset)
+            new_states[selected] = np.bitwise_or.reduce(table[rows] << _ROW_SHIFTS, axis=1)
+        scores[selected] = score_table[rows].sum(axis=1)
+    return new_states, new_states != states, scores
+
+
+def spawn_batch(states, rng):
+    '''
+    Spawns one tile on every packed board that has an empty cell (10% chance of a 4, 90% for a 2),
+    drawing from the given NumPy generator.
+    Returns the new boards and an (N, 2) array of the spawned cell (row-major index) and tile value,
+    with -1 and 0 for boards that were full.
+    '''
+    states = np.asarray(states, dtype=np.uint64)
+    empty = nibbles_batch(states) == 0
+    counts = empty.sum(axis=1)
+    picks = (rng.random(states.shape[0]) * counts).astype(np.int64)
+    cells = np.argmax(np.cumsum(empty, axis=1) > picks[:, None], axis=1)
+    ranks = np.where(rng.random(states.shape[0]) < 0.1, 2, 1).astype(np.uint64)
+
+    has_room = counts > 0
+    new_states = np.where(has_room, states | (ranks << CELL_SHIFTS[cells]), states)
+    spawned = np.stack([np.where(has_room, cells, -1),
+                        np.where(has_room, TILE_VALUES[ranks.astype(np.intp)], 0)], axis=1)
+    return new_states, spawned
+
+
+def mirror_rows_batch(states):
+    '''
+    Mirrors every packed board in an array left to right.
+    '''
+    return ((states & np.uint64(0xF000F000F000F000)) >> np.uint64(12)) | \
+           ((states & np.uint64(0x0F000F000F000F00)) >> np.uint64(4)) | \
+           ((states & np.uint64(0x00F000F000F000F0)) << np.uint64(4)) | \
+           ((states & np.uint64(0x000F000F000F000F)) << np.uint64(12))
+
+
+def reverse_rows_batch(states):
+    '''
+    Mirrors every packed board in an array top to bottom.
+    '''
+    return (states >> np.uint64(48)) | ((states >> np.uint64(16)) & np.uint64(0xFFFF0000)) | \
+           ((states & np.uint64(0xFFFF0000)) << np.uint64(16)) | (states << np.uint64(48))
+
+
+def canonical_batch(states):
+    '''
+    Returns the canonical key (see canonical) of every packed board in an array.
+    '''
+    states = np.asarray(states, dtype=np.uint64)
+    t = transpose_batch(states)
+    m, tm = mirror_rows_batch(states), mirror_rows_batch(t)
+    return np.minimum.reduce([states, m, reverse_rows_batch(states), reverse_rows_batch(m),
+                              t, tm, reverse_rows_batch(t), reverse_rows_batch(tm)])
+
+
+def has_rank_batch(states, rank):
+    '''
+    Checks which packed boards hold a tile with the given exponent (see has_rank).
+    '''
+    matches = np.asarray(states, dtype=np.uint64) ^ np.uint64(rank * NIBBLE_ONES)
+    return ((matches - np.uint64(NIBBLE_ONES)) & ~matches & np.uint64(NIBBLE_HIGHS)) != 0
+
+
+def max_rank_batch(states):
+    '''
+    Returns the largest exponent on each packed board (see max_rank).
+    '''
+    # Each byte of a board holds two nibbles, so the max is over the high and low halves of its 8 bytes
+    cells = np.ascontiguousarray(states, dtype=np.uint64).view(np.uint8).reshape(-1, 8)
+    return np.maximum(cells >> 4, cells & NIBBLE_MASK).max(axis=1)
@@ -0,0 +1,269 @@
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from bitboard import DIRECTIONS, transform, transform_direction, move_state, nibbles_batch
+from game_2048 import make_rng, generate_new_board, compress_board, move_packed
+from position_cache import open_cache, as_cache, close_cache, start_generation, cache_lookup, cache_store, \
+    _first_word, A_STAR_HEURISTIC, EXPECTIMAX
+from game_trace import encode_game, decode_steps, open_trace, trace_append, trace_close, load_trace, trace_games, \
+    trace_game, game_directions
+
+# Author: Caleb L'Italien
+# Last edited: 10/18/2026
+
+# Checks of the on-disk formats: the position cache (position_cache.py) and game traces (game_trace.py).
+# Run it from src (python check_formats.py); it prints each check and exits with 1 if any failed.
+# Every entry stored in the cache checks is a function of its board (see expected_entry), so any entry
+# read back can be checked, whichever process wrote it and whatever was replaced since.
+
+GOAL_RANK = 11
+STRESS_PROCESSES = 4
+STRESS_BOARDS = 2000  # Boards shared by the writers, so they race on the same buckets
+STRESS_OPERATIONS = 20000  # Stores and lookups per writer
+STRESS_BUCKET_BITS = 6  # 256 slots, far fewer than the boards, so entries are replaced all the time
+TRACE_GAMES = 5
+
+
+def expected_entry(state):
+    '''
+    Returns the (value, depth, move, bound) the checks store for a board.
+    '''
+    return float(state % 1000003), state % 8 + 1, DIRECTIONS[state % 4], state % 3
+
+
+def _store_expected(cache, kind, state):
+    '''
+    Stores a board's expected entry.
+    '''
+    value, depth, move, bound = expected_entry(state)
+    cache_store(cache, kind, GOAL_RANK, state, value, depth, move, bound)
+
+
+def _stress_boards(seed):
+    '''
+    Returns the boards the writers share, as Python ints.
+    '''
+    return [int(state) for state in make_rng(seed).integers(1, 1 << 63, STRESS_BOARDS, dtype=np.uint64)]
+
+
+def stress_worker(path, seed, worker):
+    '''
+    Runs in a writer process: stores and looks up shared boards in a random order. Returns the number of
+    lookups that found an entry and the number that found a wrong one.
+    '''
+    cache = as_cache(path)
+    boards = _stress_boards(seed)
+    rng = make_rng([seed, worker])
+    hits, wrong = 0, 0
+    for i, store in zip(rng.integers(0, len(boards), STRESS_OPERATIONS), rng.random(STRESS_OPERATIONS) < 0.5):
+        state = boards[i]
+        if store:
+            _store_expected(cache, A_STAR_HEURISTIC, state)
+            continue
+        entry = cache_lookup(cache, A_STAR_HEURISTIC, GOAL_RANK, state)
+        if entry is not None:
+            hits += 1
+            wrong += entry != expected_entry(state)
+    close_cache(cache)
+    return hits, wrong
+
+
+def check_concurrent_writers(directory, seed=0):
+    '''
+    Several processes write to one small cache at once; no lookup may read back a wrong entry.
+    '''
+    path = os.path.join(directory, "stress.cache")
+    close_cache(open_cache(path, STRESS_BUCKET_BITS))
+    with ProcessPoolExecutor(max_workers=STRESS_PROCESSES) as pool:
+        results = list(pool.map(stress_worker, [path] * STRESS_PROCESSES, [seed] * STRESS_PROCESSES,
+                                range(STRESS_PROCESSES)))
+    hits, wrong = sum(result[0] for result in results), sum(result[1] for result in results)
+    # Read every board once more, after all the writers are done
+    cache = open_cache(path, readonly=True)
+    for state in _stress_boards(seed):
+        entry = cache_lookup(cache, A_STAR_HEURISTIC, GOAL_RANK, state)
+        if entry is not None:
+            hits += 1
+            wrong += entry != expected_entry(state)
+    close_cache(cache)
+    return wrong == 0 and hits > 0, f"{hits} entries read back, {wrong} wrong"
+
+
+def _same_bucket(cache, kind, count, seed=0):
+    '''
+    Returns count boards that all fall in one bucket of the cache.
+    '''
+    tag = kind << 4 | GOAL_RANK
+    boards = {}
+    for state in make_rng(seed).integers(1, 1 << 63, 1000, dtype=np.uint64):
+        bucket = boards.setdefault(_first_word(cache, int(state), tag), [])
+        bucket.append(int(state))
+        if len(bucket) == count:
+            return bucket
+    raise RuntimeError("no bucket got enough boards")
+
+
+def check_torn_slot(directory):
+    '''
+    A slot whose two words come from different entries (as a half finished write leaves it) reads as a
+    miss for both boards, never as the wrong entry.
+    '''
+    cache = open_cache(os.path.join(directory, "torn.cache"), bucket_bits=1)
+    first, second = _same_bucket(cache, A_STAR_HEURISTIC, 2)
+    _store_expected(cache, A_STAR_HEURISTIC, first)
+    _store_expected(cache, A_STAR_HEURISTIC, second)
+    view = cache['view']
+    word = _first_word(cache, first, A_STAR_HEURISTIC << 4 | GOAL_RANK)
+    view[word + 1] = view[word + 3]  # The first slot keeps the first board's check but gets the second's data
+    misses = [cache_lookup(cache, A_STAR_HEURISTIC, GOAL_RANK, state) for state in (first, second)]
+    close_cache(cache)
+    # The second board is still found in its own slot; the torn slot must not answer for either board
+    return misses[0] is None and misses[1] == expected_entry(second), f"lookups gave {misses}"
+
+
+def check_replacement(directory):
+    '''
+    A full bucket replaces its shallowest entry, counting each generation of age as AGE_WEIGHT levels
+    less deep, and a board is only replaced by a result at least as deep.
+    '''
+    cache = open_cache(os.path.join(directory, "replacement.cache"), bucket_bits=1)
+    boards = _same_bucket(cache, A_STAR_HEURISTIC, 6)
+
+    def stored(state):
+        return cache_lookup(cache, A_STAR_HEURISTIC, GOAL_RANK, state)
+
+    failures = []
+    # One generation: the shallowest entry goes first
+    for state, depth in zip(boards[:4], [9, 4, 9, 9]):
+        cache_store(cache, A_STAR_HEURISTIC, GOAL_RANK, state, 1.0, depth)
+    cache_store(cache, A_STAR_HEURISTIC, GOAL_RANK, boards[4], 1.0, 2)
+    if stored(boards[1]) is not None or stored(boards[4]) is None:
+        failures.append("the shallowest entry of a generation was not the one replaced")
+
+    # Two generations later, with the depth 2 entry stored again, the old depth 9 entries are worth less
+    start_generation(cache)
+    start_generation(cache)
+    cache_store(cache, A_STAR_HEURISTIC, GOAL_RANK, boards[4], 1.0, 2)
+    cache_store(cache, A_STAR_HEURISTIC, GOAL_RANK, boards[5], 1.0, 2)
+    if stored(boards[0]) is not None or stored(boards[4]) is None or stored(boards[5]) is None:
+        failures.append("an old deep entry was kept over a newer, more valuable one")
+
+    # A shallower result never replaces a deeper one for the same board, and a deeper one always does
+    cache_store(cache, A_STAR_HEURISTIC, GOAL_RANK, boards[2], 2.0, 3)
+    if (stored(boards[2]) or ())[:2] != (1.0, 9):
+        failures.append("a shallower result replaced a deeper one")
+    cache_store(cache, A_STAR_HEURISTIC, GOAL_RANK, boards[2], 3.0, 10)
+    if (stored(boards[2]) or ())[:2] != (3.0, 10):
+        failures.append("a deeper result did not replace the stored one")
+    close_cache(cache)
+    return not failures, "; ".join(failures) or "eviction order and depth checks held"
+
+
+def check_canonical_moves(directory, games=20, seed=0):
+    '''
+    In a canonical cache, a move stored for a board, read back on any rotation or reflection of it, is the
+    same move turned with the board: it slides that board to the same turned afterstate.
+    '''
+    cache = open_cache(os.path.join(directory, "canonical.cache"), bucket_bits=10, canonical=True)
+    rng = make_rng(seed)
+    checked, wrong = 0, 0
+    for state in _random_boards(rng, games):
+        for direction in DIRECTIONS:
+            afterstate, moved, _ = move_state(state, direction)
+            if not moved:
+                continue
+            cache_store(cache, EXPECTIMAX, GOAL_RANK, state, 1.0, 1, direction)  # Replaces the last direction
+            for t in range(8):
+                entry = cache_lookup(cache, EXPECTIMAX, GOAL_RANK, transform(state, t))
+                checked += 1
+                wrong += entry is None or entry[2] != transform_direction(direction, t) or \
+                    move_state(transform(state, t), entry[2])[0] != transform(afterstate, t)
+    close_cache(cache)
+    return wrong == 0 and checked > 0, f"{checked} turned moves read back, {wrong} wrong"
+
+
+def _random_boards(rng, count):
+    '''
+    Returns count boards reached by a few random moves from new games.
+    '''
+    boards = []
+    for _ in range(count):
+        state = compress_board(generate_new_board(rng))
+        for _ in range(int(rng.integers(1, 30))):
+            state, _ = move_packed(state, DIRECTIONS[int(rng.integers(4))], rng)
+        boards.append(state)
+    return boards
+
+
+def play_random_game(rng):
+    '''
+    Plays random legal moves until the game is lost. Returns the boards it went through and the moves made.
+    '''
+    states = [compress_board(generate_new_board(rng))]
+    directions = []
+    while True:
+        legal = [direction for direction in DIRECTIONS if move_state(states[-1], direction)[1]]
+        if not legal:
+            return states, directions
+        direction = legal[int(rng.integers(len(legal)))]
+        state, _ = move_packed(states[-1], direction, rng)
+        states.append(state)
+        directions.append(direction)
+
+
+def _game_matches(game, states, directions):
+    '''
+    Checks a decoded game against the boards and moves it was encoded from, including that each spawn it
+    records turns the board's afterstate into the next board.
+    '''
+    if not (np.array_equal(game['states'], np.array(states, dtype=np.uint64)) and
+            game_directions(game) == directions and game['game_end'][-1] and not game['game_end'][:-1].any()):
+        return False
+    for i, direction in enumerate(directions):
+        afterstate, _, _ = move_state(states[i], direction)
+        rank = {0: 0, 2: 1, 4: 2}[int(game['spawn_tiles'][i])]
+        if afterstate | rank << (60 - 4 * int(game['spawn_cells'][i])) != states[i + 1]:
+            return False
+    return True
+
+
+def check_trace_round_trip(directory, seed=0):
+    '''
+    Random games encoded and decoded, in memory and through a trace file appended to twice, come back as
+    they were played.
+    '''
+    rng = make_rng(seed)
+    games = [play_random_game(rng) for _ in range(TRACE_GAMES)]
+    failures = [i for i, (states, directions) in enumerate(games)
+                if not _game_matches(decode_steps(encode_game(states, directions)), states, directions)]
+
+    path = os.path.join(directory, "games.trace")
+    for part in (games[:2], games[2:]):  # The second open appends to the file the first one made
+        trace = open_trace(path)
+        for states, directions in part:
+            trace_append(trace, states, directions)
+        trace_close(trace)
+    trace = load_trace(path)
+    if trace_games(trace) != len(games):
+        failures.append('file')
+    failures += [f"file {i}" for i, (states, directions) in enumerate(games)
+                 if i < trace_games(trace) and not _game_matches(trace_game(trace, i), states, directions)]
+
+    fours = int((nibbles_batch(np.concatenate([np.array(states, dtype=np.uint64) for states, _ in games])) == 2).sum())
+    moves = sum(len(directions) for _, directions in games)
+    return not failures and fours > 0, f"{len(games)} games of {moves} moves, failed: {failures or 'none'}"
+
+
+CHECKS = [check_concurrent_writers, check_torn_slot, check_replacement, check_canonical_moves, check_trace_round_trip]
+
+
+if __name__ == "__main__":
+    failed = 0
+    with tempfile.TemporaryDirectory(prefix='check_formats_') as directory:
+        for check in CHECKS:
+            passed, details = check(directory)
+            failed += not passed
+            print(f"{'ok  ' if passed else 'FAIL'} {check.__name__}: {details}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,165 @@
+import heapq
+import os
+import shutil
+import tempfile
+from itertools import chain
+import numpy as np
+
+# Author: Caleb L'Italien
+# Last edited: 10/18/2026
+
+# An open list for searches too long to keep every queued board in memory. Items are
+# (priority, state, entry) tuples, as in the A* heap. The best items stay in an in-memory heap;
+# when it fills up, its worse half is sorted and written to a temp file as packed records (a run).
+# Runs are read back a small block at a time and merged lazily: the next item popped is the
+# smaller of the heap's top and the smallest head of all the runs.
+# A queue is a dict (see new_queue), used through queue_push, queue_pop, queue_len and queue_close.
+# Its memory budget covers the heap and the read buffers of the runs, not the search's other tables.
+
+RECORD = np.dtype([('priority', '<f8'), ('state', '<u8'), ('entry', '<u8')])
+HEAP_ITEM_BYTES = 160  # A (priority, state, entry) tuple with its float and two ints
+RUN_BUFFER = 1024  # Most records read from a run at a time
+MAX_RUNS = 64  # Past this many runs, they are merged into one so their buffers stay bounded
+
+
+def new_queue(max_bytes=1 << 28, directory=None):
+    '''
+    Makes an empty queue that keeps about max_bytes of items in memory, spilling the rest to a
+    temp directory (inside directory, or the system default). The budget covers the heap and the
+    blocks read back from the runs.
+    '''
+    # Up to half the budget for the read buffers: MAX_RUNS + 1 runs, each holding up to two blocks
+    # while they are merged (see _merge_runs). The rest is for the heap.
+    run_buffer = max(1, min(RUN_BUFFER, max_bytes // 2 // (2 * (MAX_RUNS + 1) * HEAP_ITEM_BYTES)))
+    buffer_bytes = 2 * (MAX_RUNS + 1) * run_buffer * HEAP_ITEM_BYTES
+    memory_items = max(2, (max_bytes - buffer_bytes) // HEAP_ITEM_BYTES)
+    return {
+        'heap': [],
+        'heads': [],  # (priority, state, entry, run id) for the next item of every run
+        'runs': {},
+        'next_run': 0,
+        'memory_items': memory_items,
+        'run_buffer': run_buffer,
+        'directory': tempfile.mkdtemp(prefix='open_list_', dir=directory),
+        'size': 0,
+    }
+
+
+def queue_len(queue):
+    '''
+    Returns the number of items in the queue, in memory and on disk.
+    '''
+    return queue['size']
+
+
+def queue_push(queue, item):
+    '''
+    Adds a (priority, state, entry) item to the queue.
+    '''
+    heapq.heappush(queue['heap'], item)
+    queue['size'] += 1
+    if len(queue['heap']) > queue['memory_items']:
+        _spill(queue)
+
+
+def queue_pop(queue):
+    '''
+    Removes and returns the item with the lowest priority.
+    '''
+    heap, heads = queue['heap'], queue['heads']
+    queue['size'] -= 1
+    if heads and (not heap or heads[0][:3] < heap[0]):
+        priority, state, entry, run_id = heapq.heappop(heads)
+        _advance(queue, run_id)
+        return priority, state, entry
+    return heapq.heappop(heap)
+
+
+def queue_close(queue):
+    '''
+    Deletes the queue's temp files.
+    '''
+    shutil.rmtree(queue['directory'], ignore_errors=True)
+    queue['heap'], queue['heads'], queue['runs'], queue['size'] = [], [], {}, 0
+
+
+def _spill(queue):
+    '''
+    Writes the worse half of the in-memory heap to a new run.
+    '''
+    items = sorted(queue['heap'])
+    keep = len(items) // 2
+    queue['heap'] = items[:keep]  # A sorted list is already a heap
+    _write_run(queue, np.array(items[keep:], dtype=RECORD))
+    if len(queue['runs']) > MAX_RUNS:
+        _merge_runs(queue)
+
+
+def _write_run(queue, records):
+    '''
+    Saves sorted records as a run and queues its first item.
+    '''
+    run_id = queue['next_run']
+    queue['next_run'] += 1
+    path = os.path.join(queue['directory'], f"run_{run_id}.bin")
+    records.tofile(path)
+    queue['runs'][run_id] = {'path': path, 'length': len(records), 'offset': 0, 'buffer': [], 'position': 0}
+    _advance(queue, run_id)
+
+
+def _advance(queue, run_id):
+    '''
+    Queues the next item of a run, reading its next block if needed. Deletes the run once it is used up.
+    '''
+    run = queue['runs'][run_id]
+    if run['position'] == len(run['buffer']):
+        if run['offset'] >= run['length']:
+            os.remove(run['path'])
+            del queue['runs'][run_id]
+            return
+        run['buffer'] = np.fromfile(run['path'], dtype=RECORD, count=queue['run_buffer'],
+                                    offset=run['offset'] * RECORD.itemsize).tolist()
+        run['offset'] += len(run['buffer'])
+        run['position'] = 0
+    heapq.heappush(queue['heads'], run['buffer'][run['position']] + (run_id,))
+    run['position'] += 1
+
+
+def _run_items(run, run_buffer):
+    '''
+    Yields the items of a run not yet queued, run_buffer records at a time.
+    '''
+    yield from run['buffer'][run['position']:]
+    while run['offset'] < run['length']:
+        block = np.fromfile(run['path'], dtype=RECORD, count=run_buffer, offset=run['offset'] * RECORD.itemsize)
+        run['offset'] += len(block)
+        yield from block.tolist()
+
+
+def _merge_runs(queue):
+    '''
+    Merges every run into one, streaming through them so only a block of each is in memory.
+    '''
+    runs = [chain([head[:3]], _run_items(queue['runs'][head[3]], queue['run_buffer'])) for head in queue['heads']]
+    run_id = queue['next_run']
+    queue['next_run'] += 1
+    path = os.path.join(queue['directory'], f"run_{run_id}.bin")
+
+    length = 0
+    block = []
+    with open(path, 'wb') as file:
+        for item in heapq.merge(*runs):
+            block.append(item)
+            if len(block) == queue['run_buffer']:
+                np.array(block, dtype=RECORD).tofile(file)
+                length += len(block)
+                block = []
+        if block:
+            np.array(block, dtype=RECORD).tofile(file)
+            length += len(block)
+
+    for run in queue['runs'].values():
+        os.remove(run['path'])
+    queue['heads'] = []
+    queue['runs'] = {run_id: {'path': path, 'length': length, 'offset': 0, 'buffer': [], 'position': 0}}
+    _advance(queue, run_id)
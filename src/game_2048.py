@@ -1,78 +1,161 @@
 import numpy as np
-import random
-sys_random = random.SystemRandom() # This is to ensure thread safety
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from utils import *
+import bitboard
+import transposition
 # Author: Caleb L'Italien
-# Last edited: 11/19/2023
+# Last edited: 10/18/2026
 
 # Basic utilities for playing 2048
+# Boards made are counted in the stats dict passed to the move functions (see stats.py), if any.
 
-BOARD_COUNTER = 0
-def reconstruct_path(came_from, start, goal, decompress_boards=False):
+SPAWN_PROBABILITIES = ((2, 0.9), (4, 0.1))
+
+def make_rng(seed=None):
+    '''
+    Makes a fast, seedable random number generator (PCG64). A seed of None draws one from the OS.
+    '''
+    return np.random.Generator(np.random.PCG64(seed))
+
+def spawn_rngs(seed, count):
     '''
-    Reconstructs the solution path, and formats it nicely. To see how boards are stored in a compression algorithm,
-    Set decompress_boards to False but use the compression anyways.
+    Makes count independent generators from one seed, one per worker thread or process.
+    Each gets its own stream through SeedSequence.spawn, so workers never share draws. The seed can
+    also be a generator, which the streams are spawned from (so a seeded search stays reproducible).
+    '''
+    if hasattr(seed, 'spawn'):
+        return seed.spawn(count)
+    return [np.random.Generator(np.random.PCG64(child)) for child in np.random.SeedSequence(seed).spawn(count)]
+
+def as_rng(seed=None):
+    '''
+    Returns the generator to use for a seed: generators (anything with random()) are passed through,
+    None uses the shared module generator, and anything else (an int or a SeedSequence) seeds a new one.
+    '''
+    if seed is None:
+        return default_rng
+    if hasattr(seed, 'random'):
+        return seed
+    return make_rng(seed)
+
+default_rng = make_rng()
+def reconstruct_path(came_from, start, goal):
+    '''
+    Reconstructs the solution path as a list of (state, direction) pairs, where each state is the board
+    its move led to. Boards are left as they are stored (compressed, in every search), and are only
+    formatted when printed (see format_path).
     '''
     path = []
     current_state = goal
     while current_state != start:
         previous_state, direction = came_from[current_state]
-        
-        if decompress_boards:
-            current_state_decompressed = decompress(current_state)
-            state_str = np.array2string(current_state_decompressed, separator=' ')
-        else:
-            state_str = np.array2string(np.array(current_state), separator=' ')
-        
-        path.append((state_str, direction))
+        path.append((current_state, direction))
         current_state = previous_state
     path.reverse()
     return path
 
 
-def get_possible_moves(state, parallelize=False):
+def reconstruct_table_path(table, goal_entry):
+    '''
+    Reconstructs the solution path from a transposition table (see transposition.py) by following
+    parent links back from the goal entry. In the same form as reconstruct_path.
+    '''
+    path = []
+    entry = goal_entry
+    parent, direction = transposition.table_parent(table, entry)
+    while parent is not None:
+        path.append((transposition.table_key(table, entry), direction))
+        entry = parent
+        parent, direction = transposition.table_parent(table, entry)
+    path.reverse()
+    return path
+
+
+def format_state(state):
+    '''
+    Formats a compressed board for printing.
+    '''
+    return np.array2string(decompress(state), separator=' ')
+
+
+def format_path(path):
+    '''
+    Yields each (state, direction) of a path with its board formatted for printing, one at a time.
+    '''
+    for state, direction in path:
+        yield format_state(state), direction
+
+
+def path_states(start, path):
+    '''
+    Returns every board a path goes through, starting with the compressed start board, as a uint64 array.
+    '''
+    return np.array([start] + [state for state, _ in path], dtype=np.uint64)
+
+
+def get_possible_moves(state, parallelize=False, rng=None, stats=None):
     '''
     Finds the next possible moves from a given state.
     '''
     if parallelize:
         with ThreadPoolExecutor() as executor:
-            futures = {executor.submit(move, state, direction): direction for direction in ['up', 'down', 'left', 'right']}
+            futures = {executor.submit(move, state, direction, rng): direction for direction in ['up', 'down', 'left', 'right']}
             moves = []
             for future in as_completed(futures):
                 new_board, done = future.result()
                 if done:
                     moves.append(new_board)
+        # Counted here rather than in the threads, so the count never races
+        if stats is not None:
+            stats['boards'] += len(moves)
         return moves
     else:
         moves = []
         for direction in ['up', 'down', 'left', 'right']:
-            new_board, done = move(state, direction)
+            new_board, done = move(state, direction, rng, stats)
             if done:
                 moves.append(new_board)
         return moves
 
+def get_possible_moves_packed(state, rng=None, stats=None):
+    '''
+    Finds the next possible moves from a given compressed state.
+    '''
+    moves = []
+    for direction in ['up', 'down', 'left', 'right']:
+        new_state, done = move_packed(state, direction, rng, stats)
+        if done:
+            moves.append(new_state)
+    return moves
+
 def is_goal(state, to_reach, decompress_state=False):
     '''
     Checks if the current state is the goal state.
     '''
     if decompress_state: 
         # Check every block of 4 bits to see if that representation is the goal state
-        to_reach_binary = format(BIT_DICT[to_reach], '04b')
-        state_binary = format(state, '064b')
-        for i in range(0, 64, 4):
-            if state_binary[i:i+4] == to_reach_binary:
-                return True  
-        return False  
+        return bitboard.has_rank(state, BIT_DICT[to_reach])
     return np.max(state) == to_reach
 
 
-def move(state, direction):
+def move(state, direction, rng=None, stats=None):
     '''
-    Perform a move in one of the four directions. Checks for merges exactly three times per move.
+    Perform a move in one of the four directions, then spawns a new tile if anything moved.
     Returns the new state and a boolean indicating if any tile was moved.
     '''
-    global BOARD_COUNTER
+    board, moved = slide(state, direction)
+    if moved:
+        if stats is not None:
+            stats['boards'] += 1
+        board = spawn_random(board, rng)
+    return board, moved
+
+def slide(state, direction):
+    '''
+    Slides the board in one of the four directions without spawning a tile, so the same state
+    and direction always give the same afterstate. Checks for merges exactly three times per move.
+    Returns the afterstate and a boolean indicating if any tile was moved.
+    '''
     def compress(board):
         ''' 
         Push all non-zero tiles to the front of the board (relative to the move direction).
@@ -142,70 +225,123 @@ def move(state, direction):
         board = reverse(board)
         board = transpose(board)
         moved = compressed or merged
-    if moved:
-        BOARD_COUNTER += 1
-        spawn_new_tile(board)
     return board, moved
 
-def spawn_new_tile(board):
+def move_packed(state, direction, rng=None, stats=None):
+    '''
+    Perform a move on a compressed board, then spawns a new tile if anything moved.
+    Returns the new compressed state and a boolean indicating if any tile was moved.
+    '''
+    new_state, moved = slide_packed(state, direction)
+    if moved:
+        if stats is not None:
+            stats['boards'] += 1
+        new_state = spawn_random_packed(new_state, rng)
+    return new_state, moved
+
+def slide_packed(state, direction):
+    '''
+    Slides a compressed board using the lookup tables in bitboard.py, without spawning a tile.
+    Returns the afterstate and a boolean indicating if any tile was moved.
+    '''
+    new_state, moved, _ = bitboard.move_state(state, direction)
+    return new_state, moved
+
+def move_batch(boards, directions, rng=None, stats=None):
     '''
-    Spawns a new tile onto the board
+    Perform a move on many boards at once. Takes an (N,) uint64 array of compressed boards or an
+    (N, 4, 4) array, plus a direction per board (a name, or an index into bitboard.DIRECTIONS).
+    Returns the new boards (in the same form as given), a mask of which boards moved,
+    the score gained by each board, and the spawned tiles (see bitboard.spawn_batch).
     '''
+    unpacked = np.ndim(boards) == 3
+    states = bitboard.as_packed(boards)
+    directions = np.asarray(directions)
+    if directions.dtype.kind in 'US':
+        directions = np.vectorize(bitboard.DIRECTION_INDEX.get, otypes=[np.intp])(directions)
+
+    new_states, moved, scores = bitboard.slide_batch(states, directions)
+    spawned = np.zeros((states.shape[0], 2), dtype=np.int64)
+    spawned[:, 0] = -1
+    moved_idx = np.flatnonzero(moved)
+    if moved_idx.size:
+        if stats is not None:
+            stats['boards'] += int(moved_idx.size)
+        new_states[moved_idx], spawned[moved_idx] = bitboard.spawn_batch(new_states[moved_idx], as_rng(rng))
+
+    if unpacked:
+        return bitboard.unpack_boards(new_states), moved, scores, spawned
+    return new_states, moved, scores, spawned
+
+def spawn_new_tile(board, rng=None):
+    '''
+    Spawns a new tile onto the board, in place (see spawn_random for how the tile is picked).
+    '''
+    board[...] = spawn_random(board, rng)
+    return board
+
+def spawn_outcomes(afterstate):
+    '''
+    Yields every board that can follow the afterstate, with its probability.
+    '''
+    empty_cells = [(x, y) for x in range(afterstate.shape[0]) for y in range(afterstate.shape[1]) if afterstate[x][y] == 0]
+    for x, y in empty_cells:
+        for tile, probability in SPAWN_PROBABILITIES:
+            board = np.copy(afterstate)
+            board[x][y] = tile
+            yield board, probability / len(empty_cells)
+
+def spawn_random(afterstate, rng=None):
+    '''
+    Picks one of the spawn outcomes of the afterstate, using the given RNG or seed (see as_rng).
+    Returns a new board; the afterstate is left untouched.
+    '''
+    rng = as_rng(rng)
+    board = np.copy(afterstate)
     empty_cells = [(x, y) for x in range(board.shape[0]) for y in range(board.shape[1]) if board[x][y] == 0]
     if empty_cells:
-        x, y = sys_random.choice(empty_cells)
-        board[x][y] = 4 if sys_random.random() < 0.1 else 2  # 10% chance to spawn a 4, 90% for a 2
+        x, y = empty_cells[int(rng.random() * len(empty_cells))]
+        board[x][y] = 4 if rng.random() < 0.1 else 2  # 10% chance to spawn a 4, 90% for a 2
     return board
 
-def get_board_count():
+def spawn_outcomes_packed(afterstate):
     '''
-    Returns the total number of boards made in this run.
+    Yields every compressed board that can follow the compressed afterstate, with its probability.
     '''
-    global BOARD_COUNTER
-    return BOARD_COUNTER
+    empty_cells = bitboard.empty_cells(afterstate)
+    for shift in empty_cells:
+        for tile, probability in SPAWN_PROBABILITIES:
+            yield afterstate | (BIT_DICT[tile] << shift), probability / len(empty_cells)
 
-def reset_board_count():
+def spawn_random_packed(afterstate, rng=None):
     '''
-    Resets the number of boards made in this run. 
+    Picks one of the spawn outcomes of a compressed afterstate, using the given RNG or seed (see as_rng).
     '''
-    global BOARD_COUNTER
-    BOARD_COUNTER = 0
+    rng = as_rng(rng)
+    empty_cells = bitboard.empty_cells(afterstate)
+    if empty_cells:
+        shift = empty_cells[int(rng.random() * len(empty_cells))]
+        afterstate |= (2 if rng.random() < 0.1 else 1) << shift  # 10% chance to spawn a 4, 90% for a 2
+    return afterstate
 
-def generate_new_board():
+def generate_new_board(seed=None):
     '''
-    Generates a new board with two randomly placed tiles.
+    Generates a new board with two randomly placed tiles. Pass a seed (or generator) to get the same board every time.
     '''
+    rng = as_rng(seed)
     board = np.zeros((4, 4), dtype=int)  
-    board = spawn_new_tile(board)  
-    board = spawn_new_tile(board)
+    board = spawn_new_tile(board, rng)  
+    board = spawn_new_tile(board, rng)
     return board
 
 def compress_board(board):
     '''
-    Compresses the board into a 64 bit word representation. See utils.py or reconstruct_path to see how this works.
+    Compresses the board into a 64 bit word representation. See utils.py or bitboard.py to see how this works.
     '''
-    bit_rep = 0
-    for row in board:
-        for place in row:
-            bit_rep = (bit_rep << 4) | BIT_DICT[place]
-    return bit_rep
+    return int(bitboard.pack_boards(board)[0])
 
 def decompress(bit_string_byte):
     '''
     Takes a compressed board and reconstructs the representation
     '''
-    board = np.zeros((4, 4), dtype=int)
-    i = 0
-    j = 0
-    k = 0
-    bit_string = format(bit_string_byte, '064b')
-    while i < 64:
-        place = bit_string[i: i+4]
-        place_val = PLACE_DICT[place]
-        board[j][k] = place_val
-        i += 4
-        k += 1
-        if k == 4:
-            k = 0
-            j += 1
-    return board
+    return bitboard.unpack_state(int(bit_string_byte))
@@ -0,0 +1,157 @@
+import os
+import numpy as np
+from bitboard import DIRECTIONS, DIRECTION_INDEX, nibbles_batch, slide_batch
+
+# Author: Caleb L'Italien
+# Last edited: 10/18/2026
+
+# A compact binary file of played games, for recording many games and analysing them without replaying.
+# The file is a header (see HEADER) followed by one fixed-size record per board (see STEP): the packed
+# board, then a 16 bit field saying what happened next:
+#   bits 0-1: the move made, as an index into bitboard.DIRECTIONS
+#   bits 2-5: the cell the next tile spawned in (0 is the top left, row-major)
+#   bit 6:    the spawned tile was a 4 (otherwise a 2)
+#   bit 7:    a tile spawned
+#   bit 8:    the game ended on this board, so no move was made
+# Games are stored one after another, each ending with a GAME_END record. Files are only ever appended
+# to (see open_trace), and are read back as a memory map (see load_trace), so a trace can be far larger
+# than memory.
+
+TRACE_MAGIC = b'2048TRAC'
+TRACE_VERSION = 1
+HEADER = np.dtype([('magic', 'S8'), ('version', '<u2'), ('record_size', '<u2'), ('reserved', '<u4')])
+STEP = np.dtype([('state', '<u8'), ('step', '<u2')])
+
+MOVE_MASK = 0x3
+SPAWN_SHIFT = 2
+SPAWN_CELL_MASK = 0xF
+SPAWN_FOUR = 1 << 6
+SPAWNED = 1 << 7
+GAME_END = 1 << 8
+
+
+def encode_game(states, directions):
+    '''
+    Packs a game into STEP records. states are the packed boards the game went through, from the first
+    to the last, and directions the moves made (names or indices), one fewer than the boards.
+    The spawns are found by comparing each board with the one its move slid to.
+    '''
+    states = np.asarray(states, dtype=np.uint64)
+    directions = np.asarray(directions)
+    if directions.dtype.kind in 'US':
+        directions = np.array([DIRECTION_INDEX[direction] for direction in directions], dtype=np.intp)
+    directions = directions.astype(np.intp).reshape(-1)
+    if states.size != directions.size + 1:
+        raise ValueError("a game needs one more board than moves")
+
+    afterstates, _, _ = slide_batch(states[:-1], directions)
+    spawns = nibbles_batch(states[1:] ^ afterstates)  # Only the spawned cell differs
+    spawned = spawns.any(axis=1)
+    if ((spawns != 0).sum(axis=1) > 1).any() or (spawns > 2).any():
+        raise ValueError("the boards do not follow from the moves")
+
+    steps = np.empty(states.size, dtype=np.uint16)
+    steps[:-1] = directions | (np.argmax(spawns != 0, axis=1) << SPAWN_SHIFT) | \
+        np.where(spawns.max(axis=1) == 2, SPAWN_FOUR, 0) | np.where(spawned, SPAWNED, 0)
+    steps[-1] = GAME_END
+    records = np.empty(states.size, dtype=STEP)
+    records['state'] = states
+    records['step'] = steps
+    return records
+
+
+def decode_steps(records):
+    '''
+    Unpacks STEP records into a dict of arrays: the boards, the moves (as indices into bitboard.DIRECTIONS),
+    the spawned cells and tiles (0 where nothing spawned), and which records end a game.
+    '''
+    steps = np.asarray(records['step'])
+    spawned = (steps & SPAWNED) != 0
+    return {
+        'states': np.asarray(records['state']),
+        'directions': (steps & MOVE_MASK).astype(np.int8),
+        'spawn_cells': np.where(spawned, (steps >> SPAWN_SHIFT) & SPAWN_CELL_MASK, 0).astype(np.int8),
+        'spawn_tiles': np.where(spawned, np.where(steps & SPAWN_FOUR, 4, 2), 0).astype(np.int8),
+        'game_end': (steps & GAME_END) != 0,
+    }
+
+
+def _read_header(path):
+    '''
+    Reads and checks the header of a trace file.
+    '''
+    header = np.fromfile(path, dtype=HEADER, count=1)
+    if header.size == 0 or header['magic'][0] != TRACE_MAGIC:
+        raise ValueError(f"{path} is not a game trace")
+    if header['version'][0] != TRACE_VERSION or header['record_size'][0] != STEP.itemsize:
+        raise ValueError(f"{path} is trace version {header['version'][0]}, not {TRACE_VERSION}")
+    return header[0]
+
+
+def open_trace(path):
+    '''
+    Opens a trace file for appending games, writing its header first if the file is new or empty.
+    '''
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        _read_header(path)
+        if (os.path.getsize(path) - HEADER.itemsize) % STEP.itemsize:
+            raise ValueError(f"{path} ends partway through a record")
+        file = open(path, 'ab')
+    else:
+        file = open(path, 'wb')
+        header = np.zeros(1, dtype=HEADER)
+        header['magic'], header['version'], header['record_size'] = TRACE_MAGIC, TRACE_VERSION, STEP.itemsize
+        header.tofile(file)
+    return {'path': path, 'file': file, 'games': 0}
+
+
+def trace_append(trace, states, directions):
+    '''
+    Appends one game (see encode_game) to an open trace.
+    '''
+    encode_game(states, directions).tofile(trace['file'])
+    trace['games'] += 1
+
+
+def trace_close(trace):
+    '''
+    Flushes and closes a trace opened by open_trace.
+    '''
+    trace['file'].close()
+
+
+def load_trace(path):
+    '''
+    Maps a trace file into memory for reading. Returns a dict with the records and the index of the
+    record each game ends on.
+    '''
+    _read_header(path)
+    count = (os.path.getsize(path) - HEADER.itemsize) // STEP.itemsize
+    if count == 0:
+        records = np.zeros(0, dtype=STEP)
+    else:
+        records = np.memmap(path, dtype=STEP, mode='r', offset=HEADER.itemsize, shape=(count,))
+    ends = np.flatnonzero(records['step'] & GAME_END)
+    return {'path': path, 'records': records, 'ends': ends}
+
+
+def trace_games(trace):
+    '''
+    Returns the number of whole games in a loaded trace.
+    '''
+    return trace['ends'].size
+
+
+def trace_game(trace, index):
+    '''
+    Returns one game of a loaded trace, decoded (see decode_steps).
+    '''
+    start = 0 if index == 0 else trace['ends'][index - 1] + 1
+    return decode_steps(trace['records'][start:trace['ends'][index] + 1])
+
+
+def game_directions(game):
+    '''
+    Returns the moves of a decoded game as direction names.
+    '''
+    return [DIRECTIONS[direction] for direction in game['directions'][:-1]]
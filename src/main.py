@@ -2,92 +2,310 @@ import traceback
 import numpy as np
 import sys
 import os
-from algorithms.a_star_search import a_star_search
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from algorithms.a_star_search import a_star_search, beam_search, ida_star_search
 from algorithms.monte_carlo_tree_search import monte_carlo_tree_search
 from algorithms.minimax_search import minimax_search
-from algorithms.dijkstra_search import dijkstra_search
-from game_2048 import get_board_count, generate_new_board, reset_board_count
+from algorithms.dijkstra_search import dijkstra_search, dijkstra_frontier_search
+from algorithms.expectimax_search import expectimax_search
+from game_2048 import generate_new_board, make_rng, compress_board, is_goal, format_path
+from stats import COUNTERS, new_stats, format_stats, profiled
+from sinks import open_sink, sink_write, sink_close
+from position_cache import open_cache, start_generation, close_cache
 import time
 
 # Author: Caleb L'Italien
-# Last edited: 11/19/2023
+# Last edited: 10/18/2026
 
-def main(search_algorithm, to_reach, starting_board):
+ALGORITHMS = {
+    'a_star_search': a_star_search,
+    'beam_search': beam_search,
+    'ida_star_search': ida_star_search,
+    'monte_carlo_tree_search': monte_carlo_tree_search,
+    'minimax_search': minimax_search,
+    'dijkstra_search': dijkstra_search,
+    'dijkstra_frontier_search': dijkstra_frontier_search,
+    'expectimax_search': expectimax_search,
+}
+WORKER_ALGORITHMS = ('a_star_search', 'monte_carlo_tree_search', 'minimax_search', 'expectimax_search')
+POSITION_CACHE_ALGORITHMS = ('a_star_search', 'monte_carlo_tree_search', 'minimax_search', 'expectimax_search')
+TIME_LIMIT_ALGORITHMS = ('minimax_search', 'monte_carlo_tree_search')  # Take --time-limit, in seconds per move
+DEPTH_ALGORITHMS = ('minimax_search',)  # Take --depth, the moves looked ahead
+GAMES_IN_FLIGHT = 2  # Games queued per pool process in a batch, so the queue never grows with the number of games
+USAGE = ("Usage: python main.py <algorithm> <number_of_runs> <to_reach> [seed] [--workers N] [--processes N] "
+         "[--timing] [--profile] [--quiet] [--jsonl FILE] [--csv FILE] [--trace FILE] [--cache FILE] "
+         "[--time-limit SECONDS] [--depth N]")
+
+def run_record(algorithm_name, to_reach, start, path, seconds, stats):
+    '''
+    Returns the plain result of a run, as written to sinks (see sinks.py), and whether it reached the goal.
     '''
-    Runs the algorithm on the starting board, aiming for to_reach. Prints metrics on the run
+    solved = path is not None and is_goal(path[-1][0] if path else start, to_reach, True)
+    record = {'algorithm': algorithm_name, 'goal': to_reach, 'start': start, 'solved': solved,
+              'moves': len(path) if path is not None else None, 'seconds': seconds}
+    record.update({name: stats[name] for name in COUNTERS})
+    record['peak_frontier'] = stats['peak_frontier']
+    return record, solved
+
+def main(search_algorithm, to_reach, starting_board, seed=None, workers=None, timing=False, profile=False,
+         quiet=False, sinks=(), position_cache=None, options=None):
+    '''
+    Runs the algorithm on the starting board, aiming for to_reach. Prints metrics on the run.
+    The seed (or generator) is passed on to the search so the run can be replayed.
+    workers, if given, is the number of processes the search may use.
+    With timing set, the time spent moving boards, in the heuristic and in bookkeeping is printed too;
+    with profile set, so are the functions the search spent the most time in.
+    With quiet set nothing is printed, and boards are never formatted. The run (and its path) is also written
+    to every sink given (see sinks.py).
+    position_cache, if given, is the path of a position cache for the search to share (see position_cache.py).
+    options are more keyword arguments for the search (such as minimax_search's time_limit), if any.
     '''
     algorithm_name = str(search_algorithm).split()[1].split('_at_')[0]
     results_filename = os.path.join("..", "metrics", f"{algorithm_name}_results.txt") 
-    reset_board_count()
+    stats = new_stats(timing)
 
     try:
         with open(results_filename, 'a') as file:
-            print("----------------------------")
-            print("Goal:", to_reach)
-            print("Starting board:")
-            print(np.array2string(starting_board, separator=' '), "\n")
+            if not quiet:
+                print("----------------------------")
+                print("Goal:", to_reach)
+                print("Starting board:")
+                print(np.array2string(starting_board, separator=' '), "\n")
 
             start_time = time.time()
-            path = search_algorithm(starting_board, to_reach)
-            end_time = time.time()
-
-            if isinstance(path, list):
-                print("Path to solution:")
-                for state_str, direction in path:
-                    print(f"Move: {direction}")
-                    print(state_str, "\n")
-                print("Total moves: ", len(path))
-            elif path is not None:
-                print("Best move: ", path)
+            kwargs = dict(options or {}, seed=seed, stats=stats)
+            if workers is not None:
+                kwargs['workers'] = workers
+            if position_cache is not None:
+                kwargs['position_cache'] = position_cache
+            if profile:
+                with profiled(stats):
+                    path = search_algorithm(starting_board, to_reach, **kwargs)
             else:
-                print("No solution found.")
+                path = search_algorithm(starting_board, to_reach, **kwargs)
+            end_time = time.time()
 
-            if path:
-                print("Path to solution:")
-                print(path)
-                for state_str, direction in path:
-                    print(f"Move: {direction}")
-                    print(state_str, "\n")
-                print("Total moves: ", len(path))
+            start = compress_board(starting_board)
+            record, solved = run_record(algorithm_name, to_reach, start, path, end_time - start_time, stats)
+            if not quiet:
+                if path:
+                    print("Path to solution:" if solved else "Moves made:")
+                    for state_str, direction in format_path(path):
+                        print(f"Move: {direction}")
+                        print(state_str, "\n")
+                    print("Total moves: ", len(path))
+                if not solved:
+                    print("No solution found.")
 
-                file.write(f"Goal: {to_reach}\n")
+            file.write(f"Goal: {to_reach}\n")
+            if solved:
                 file.write(f"Total moves: {len(path)}\n")
                 file.write(f"Time to solve: {end_time - start_time:.2f} seconds\n")
-                file.write(f"Number of boards made: {get_board_count()}\n\n")
+                file.write(f"Number of boards made: {stats['boards']}\n\n")
             else:
-                print("Number of boards made:", get_board_count())
-                print("No solution found.")
-
-                file.write(f"Goal: {to_reach}\n")
                 file.write("No solution found.\n\n")
 
-            print("Time to solve: {:.2f} seconds".format(end_time - start_time))
-            print("Number of boards made:", get_board_count())
-            print("----------------------------")
+            for sink in sinks:
+                sink_write(sink, record, path)
+
+            if not quiet:
+                print("Time to solve: {:.2f} seconds".format(end_time - start_time))
+                for line in format_stats(stats):
+                    print(line)
+                if stats['profile'] is not None:
+                    print(stats['profile'])
+                print("----------------------------")
 
     except Exception as e:
         print("An error occurred:")
         traceback.print_exc()
 
 
-if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        print("Usage: python main.py <algorithm> <number_of_runs> <to_reach>")
+def game_rng(entropy, game):
+    '''
+    Returns the generator for one game of a batch: every game gets its own stream of the batch's seed.
+    '''
+    return make_rng(np.random.SeedSequence(entropy, spawn_key=(game,)))
+
+
+def play_game(algorithm_name, to_reach, entropy, game, workers=None, position_cache=None, options=None):
+    '''
+    Runs in a pool process: plays one game of a batch. Returns its result (see run_record) and its path.
+    A search that raises counts as unsolved, with the error in the result. options are as in main.
+    '''
+    rng = game_rng(entropy, game)
+    starting_board = generate_new_board(rng)
+    stats = new_stats()
+    kwargs = dict(options or {}, seed=rng, stats=stats)
+    if workers is not None:
+        kwargs['workers'] = workers
+    if position_cache is not None:
+        kwargs['position_cache'] = position_cache
+    error = None
+    start_time = time.time()
+    try:
+        path = ALGORITHMS[algorithm_name](starting_board, to_reach, **kwargs)
+    except Exception as e:
+        path = None
+        error = f"{type(e).__name__}: {e}"
+    record, _ = run_record(algorithm_name, to_reach, compress_board(starting_board), path, time.time() - start_time,
+                           stats)
+    record['game'] = game
+    record['error'] = error
+    return record, path
+
+
+def batch(algorithm_name, to_reach, runs, seed=None, processes=None, workers=None, quiet=False, sinks=(),
+          position_cache=None, options=None):
+    '''
+    Plays runs games, each on its own seeded board, on a pool of processes (one per CPU by default).
+    Each game's result is printed and written to the sinks as soon as it finishes; only running totals are
+    kept, so memory does not grow with the number of games. Prints and saves the totals at the end.
+    Every game shares the position cache at the path position_cache, if given, and gets the options, as in main.
+    '''
+    entropy = np.random.SeedSequence(seed).entropy
+    processes = processes or os.cpu_count()
+    results_filename = os.path.join("..", "metrics", f"{algorithm_name}_results.txt")
+    totals = {'games': 0, 'solved': 0, 'moves': 0, 'seconds': 0.0, 'boards': 0, 'errors': 0}
+
+    start_time = time.time()
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        pending = set()
+        next_game = 0
+        while next_game < runs or pending:
+            while next_game < runs and len(pending) < GAMES_IN_FLIGHT * processes:
+                pending.add(pool.submit(play_game, algorithm_name, to_reach, entropy, next_game, workers,
+                                        position_cache, options))
+                next_game += 1
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                record, path = future.result()
+                totals['games'] += 1
+                totals['seconds'] += record['seconds']
+                totals['boards'] += record['boards']
+                if record['solved']:
+                    totals['solved'] += 1
+                    totals['moves'] += record['moves']
+                if record['error'] is not None:
+                    totals['errors'] += 1
+                for sink in sinks:
+                    sink_write(sink, record, path)
+                if not quiet:
+                    outcome = f"solved in {record['moves']} moves" if record['solved'] else \
+                        record['error'] or "no solution found"
+                    print(f"Game {record['game']}: {outcome}, {record['seconds']:.2f} seconds, "
+                          f"{record['boards']} boards made")
+    wall_time = time.time() - start_time
+
+    lines = batch_summary(totals, to_reach, wall_time)
+    lines.append(f"Seed entropy: {entropy}")
+    if not quiet:
+        print("----------------------------")
+        for line in lines:
+            print(line)
+        print("----------------------------")
+    with open(results_filename, 'a') as file:
+        file.write("\n".join(lines) + "\n\n")
+    return totals
+
+
+def batch_summary(totals, to_reach, wall_time):
+    '''
+    Returns the totals of a batch as printable lines: the per-target averages and the throughput.
+    '''
+    games, solved = totals['games'], totals['solved']
+    lines = [f"Goal: {to_reach}",
+             f"Games: {games}, solved: {solved} ({solved / games:.0%})",
+             f"Average boards made: {totals['boards'] / games:.2f}",
+             f"Average time taken (seconds): {totals['seconds'] / games:.4f}"]
+    if solved:
+        lines.append(f"Average moves to solution: {totals['moves'] / solved:.2f}")
+    if totals['errors']:
+        lines.append(f"Games that raised an error: {totals['errors']}")
+    lines.append(f"Games per second: {games / wall_time:.2f}")
+    lines.append(f"Boards per second: {totals['boards'] / wall_time:.0f}")
+    return lines
+
+
+def pop_option(argv, flag):
+    '''
+    Removes a "--flag value" pair from the arguments, returning the value (or None if the flag is not there).
+    Prints the usage and exits if the flag has no value.
+    '''
+    if flag not in argv:
+        return None
+    index = argv.index(flag)
+    if index + 1 == len(argv):
+        print(f"{flag} needs a value.")
+        print(USAGE)
         sys.exit(1)
+    value = argv[index + 1]
+    del argv[index:index + 2]
+    return value
 
+
+if __name__ == "__main__":
+    timing = '--timing' in sys.argv
+    profile = '--profile' in sys.argv
+    quiet = '--quiet' in sys.argv
+    sys.argv = [arg for arg in sys.argv if arg not in ('--timing', '--profile', '--quiet')]
+    workers = pop_option(sys.argv, '--workers')
+    workers = None if workers is None else int(workers)
+    processes = pop_option(sys.argv, '--processes')
+    processes = None if processes is None else int(processes)
+    sink_paths = [path for path in (pop_option(sys.argv, flag) for flag in ('--jsonl', '--csv', '--trace')) if path]
+    cache_path = pop_option(sys.argv, '--cache')
+    time_limit = pop_option(sys.argv, '--time-limit')
+    depth = pop_option(sys.argv, '--depth')
+
+    if len(sys.argv) not in (4, 5):
+        print(USAGE)
+        sys.exit(1)
     algo_name = sys.argv[1]
     num_runs = int(sys.argv[2])
     to_reach = int(sys.argv[3])
+    seed = int(sys.argv[4]) if len(sys.argv) == 5 else None
 
-    algorithms = {
-        'a_star_search': a_star_search,
-        'monte_carlo_tree_search': monte_carlo_tree_search,
-        'minimax_search': minimax_search,
-        'dijkstra_search': dijkstra_search,
-    }
-
-    if algo_name in algorithms:
-        main(algorithms[algo_name], to_reach, generate_new_board())
+    if algo_name in ALGORITHMS:
+        if workers is not None and algo_name not in WORKER_ALGORITHMS:
+            print(f"Algorithm '{algo_name}' does not take --workers.")
+            sys.exit(1)
+        if time_limit is not None and algo_name not in TIME_LIMIT_ALGORITHMS:
+            print(f"Algorithm '{algo_name}' does not take --time-limit.")
+            sys.exit(1)
+        if depth is not None and algo_name not in DEPTH_ALGORITHMS:
+            print(f"Algorithm '{algo_name}' does not take --depth.")
+            sys.exit(1)
+        options = {}
+        if time_limit is not None:
+            options['time_limit'] = float(time_limit)
+        if depth is not None:
+            options['search_depth'] = int(depth)
+        if algo_name == 'a_star_search' and workers is not None and workers > 1 and cache_path is not None:
+            print("a_star_search can't use --cache with more than one worker.")
+            sys.exit(1)
+        if num_runs > 1 and (timing or profile):
+            print("--timing and --profile only work on a single run.")
+            sys.exit(1)
+        if cache_path is not None:
+            if algo_name not in POSITION_CACHE_ALGORITHMS:
+                print(f"Algorithm '{algo_name}' does not take --cache.")
+                sys.exit(1)
+            # Made (if new) before any pool process maps it, and entries from earlier runs become older
+            cache = open_cache(cache_path)
+            start_generation(cache)
+            close_cache(cache)
+        sinks = [open_sink(path) for path in sink_paths]
+        try:
+            if num_runs > 1:
+                batch(algo_name, to_reach, num_runs, seed, processes, workers, quiet, sinks, cache_path, options)
+            else:
+                rng = make_rng(seed)
+                main(ALGORITHMS[algo_name], to_reach, generate_new_board(rng), rng, workers, timing, profile, quiet,
+                     sinks, cache_path, options)
+        finally:
+            for sink in sinks:
+                sink_close(sink)
     else:
         print(f"Algorithm '{algo_name}' not found.")
         sys.exit(1)
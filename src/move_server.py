@@ -0,0 +1,384 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from utils import BIT_DICT
+from game_2048 import compress_board, slide_packed, make_rng, as_rng, spawn_rngs
+from bitboard import canonical, transform_direction, untransform_direction
+from algorithms import expectimax_search, minimax_search, monte_carlo_tree_search
+
+# Author: Caleb L'Italien
+# Last edited: 10/18/2026
+
+# A long-running service that suggests moves. Clients connect over a local TCP or Unix socket and send one
+# JSON request per line:
+#   {"id": 1, "board": <packed board, or a 4x4 list of tiles>, "deadline_ms": 50, "goal": 2048, "backend": "expectimax"}
+# and get one JSON reply per line, in the order their searches finish:
+#   {"id": 1, "move": "left", "cached": false, "timed_out": false, "latency_ms": 12.3}
+# ("move" is null if the board has no moves). {"stats": true} returns the latency histogram instead.
+# Requests that arrive together are searched as one batch, split across the warm worker processes of a
+# pool (see suggest_moves). Finished moves are kept in an LRU cache, so repeated positions are answered
+# without searching; with canonical set, the cache of a symmetric backend (SYMMETRIC_BACKENDS) is keyed
+# by the board's symmetry class (see bitboard.canonical), so rotations and reflections of a board share its
+# move. minimax's heuristic is not symmetric, so its boards are always cached as they are. A request
+# whose deadline passes before its batch finishes gets a one-move lookahead instead.
+# The server's state is a dict (see new_server).
+
+DEFAULT_BACKEND = 'expectimax'
+DEFAULT_GOAL = 2048
+DEFAULT_DEADLINE_MS = 100.0
+CACHE_SIZE = 1 << 16
+BATCH_WINDOW = 0.002  # Seconds to wait for more requests after the first of a batch
+MAX_BATCH = 256
+DEADLINE_MARGIN = 0.8  # Fraction of the time left given to a batch's searches, the rest covers the round trip
+HISTOGRAM_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+EXPECTIMAX_GROWTH = 8.0  # About how much longer each expectimax depth takes than the one before
+MAX_EXPECTIMAX_DEPTH = 6
+
+
+# Backends. Each is called as backend(state, goal_rank, time_limit, rng) in a worker process and returns
+# a direction, or None if the board has no moves. Add to BACKENDS (before the pool starts) to plug in more.
+
+_WORKER_CACHE = {}  # In a worker, expectimax's cache, kept between batches
+_WORKER_SEARCH = None  # In a worker, minimax's search tables
+
+
+def expectimax_move(state, goal_rank, time_limit, rng):
+    '''
+    Searches one level deeper at a time while the next depth is likely to finish in the time left.
+    '''
+    deadline = time.perf_counter() + time_limit
+    best_move = None
+    for depth in range(1, MAX_EXPECTIMAX_DEPTH + 1):
+        started = time.perf_counter()
+        _, move = expectimax_search.max_node(state, depth, 1.0, goal_rank, _WORKER_CACHE, True)
+        if move is None:
+            return best_move
+        best_move = move
+        elapsed = time.perf_counter() - started
+        if started + elapsed * (1 + EXPECTIMAX_GROWTH) > deadline:
+            break
+    return best_move
+
+
+def minimax_move(state, goal_rank, time_limit, rng):
+    '''
+    Iterative deepening minimax (see minimax_search.iterative_deepening).
+    '''
+    global _WORKER_SEARCH
+    if _WORKER_SEARCH is None:
+        _WORKER_SEARCH = minimax_search.new_search()
+    return minimax_search.iterative_deepening(state, 1 << goal_rank, time_limit, rng=rng, search=_WORKER_SEARCH)
+
+
+def monte_carlo_move(state, goal_rank, time_limit, rng):
+    '''
+    UCT from a fresh tree until the time runs out.
+    '''
+    tree = monte_carlo_tree_search.new_tree(state)
+    return monte_carlo_tree_search.find_best_move(tree, goal_rank, rng, max_iters=1 << 30, time_limit=time_limit)
+
+
+BACKENDS = {
+    'expectimax': expectimax_move,
+    'minimax': minimax_move,
+    'monte_carlo_tree_search': monte_carlo_move,
+}
+SYMMETRIC_BACKENDS = {'expectimax', 'monte_carlo_tree_search'}  # Backends whose moves turn with the board
+
+
+def suggest_moves(searches, deadline, seed):
+    '''
+    Runs in a worker: finds a move for each (backend, goal rank, board) in turn, sharing the time left
+    before deadline (a time.time() value, since the clock has to agree between processes) between them.
+    Stops once the deadline has passed, so the moves returned may be for only the first few searches.
+    '''
+    rng = as_rng(seed)
+    moves = []
+    for i, (backend, goal_rank, state) in enumerate(searches):
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break  # Those requests get a quick_move when their own deadlines pass
+        moves.append(BACKENDS[backend](state, goal_rank, remaining / (len(searches) - i), rng))
+    return moves
+
+
+def quick_move(state):
+    '''
+    Picks a move by one move of lookahead with expectimax's heuristic, for requests out of time.
+    '''
+    best_move, best_value = None, None
+    for direction in ['up', 'down', 'left', 'right']:
+        afterstate, moved = slide_packed(state, direction)
+        if moved:
+            value = expectimax_search.heuristic(afterstate)
+            if best_value is None or value > best_value:
+                best_move, best_value = direction, value
+    return best_move
+
+
+def _warm_worker():
+    '''
+    Builds the move and heuristic tables once, when a worker starts, so the first batch is not slowed by it.
+    '''
+    expectimax_move(0x1100000000000000, BIT_DICT[DEFAULT_GOAL], 0.0, make_rng(0))
+
+
+def new_server(processes=None, cache_size=CACHE_SIZE, canonical=False):
+    '''
+    Makes the state of a server: its warm worker pool, result cache, request queue and latency histogram.
+    '''
+    processes = processes or os.cpu_count()
+    return {
+        'pool': ProcessPoolExecutor(max_workers=processes, initializer=_warm_worker),
+        'processes': processes,  # Worker processes in the pool
+        'cache': OrderedDict(),  # (backend, goal rank, board) -> move, the board and move turned if canonical
+        'cache_size': cache_size,
+        'canonical': canonical,
+        'finishing': set(),  # Batches still being searched
+        'queue': None,  # Made by serve, in its event loop
+        'histogram': [0] * (len(HISTOGRAM_BUCKETS_MS) + 1),
+        'requests': 0,
+        'cache_hits': 0,
+        'timed_out': 0,
+        'rng': make_rng(),
+    }
+
+
+def _cache_key(server, backend, state):
+    '''
+    Returns the board a cache entry is stored under and the symmetry turning the board into it.
+    '''
+    return canonical(state) if server['canonical'] and backend in SYMMETRIC_BACKENDS else (state, 0)
+
+
+def cache_get(server, backend, goal_rank, state):
+    '''
+    Returns the cached move for a board, turned to match it, or None.
+    '''
+    key, t = _cache_key(server, backend, state)
+    move = server['cache'].get((backend, goal_rank, key))
+    if move is None:
+        return None
+    server['cache'].move_to_end((backend, goal_rank, key))
+    return untransform_direction(move, t)
+
+
+def cache_put(server, backend, goal_rank, state, move):
+    '''
+    Caches the move found for a board, dropping the least recently used entry when the cache is full.
+    '''
+    key, t = _cache_key(server, backend, state)
+    server['cache'][(backend, goal_rank, key)] = transform_direction(move, t)
+    server['cache'].move_to_end((backend, goal_rank, key))
+    if len(server['cache']) > server['cache_size']:
+        server['cache'].popitem(last=False)
+
+
+def record_latency(server, latency_ms):
+    '''
+    Adds a request's latency to the histogram.
+    '''
+    bucket = int(np.searchsorted(HISTOGRAM_BUCKETS_MS, latency_ms))
+    server['histogram'][bucket] += 1
+
+
+def latency_report(server):
+    '''
+    Returns the histogram as {"<=1ms": count, ..., ">5000ms": count} along with the request counts.
+    '''
+    labels = [f"<={bucket}ms" for bucket in HISTOGRAM_BUCKETS_MS] + [f">{HISTOGRAM_BUCKETS_MS[-1]}ms"]
+    return {'requests': server['requests'], 'cache_hits': server['cache_hits'], 'timed_out': server['timed_out'],
+            'latency': dict(zip(labels, server['histogram']))}
+
+
+def parse_request(request):
+    '''
+    Checks a request and returns its (backend, goal rank, packed board, deadline in seconds from now).
+    '''
+    backend = request.get('backend', DEFAULT_BACKEND)
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown backend {backend!r}")
+    goal = request.get('goal', DEFAULT_GOAL)
+    if goal not in BIT_DICT or goal == 0:
+        raise ValueError(f"goal {goal!r} is not a tile")
+    board = request['board']
+    state = compress_board(np.array(board)) if isinstance(board, list) else int(board)
+    if not 0 <= state < 1 << 64:
+        raise ValueError("board is not a packed 64 bit board")
+    return backend, BIT_DICT[goal], state, float(request.get('deadline_ms', DEFAULT_DEADLINE_MS)) / 1000
+
+
+async def suggest(server, request):
+    '''
+    Answers one move request: from the cache, or by queueing it for the next batch.
+    '''
+    received = time.perf_counter()
+    backend, goal_rank, state, time_limit = parse_request(request)
+    deadline = received + time_limit
+    reply = {'id': request.get('id'), 'cached': False, 'timed_out': False}
+
+    move = cache_get(server, backend, goal_rank, state)
+    if move is not None:
+        reply['cached'] = True
+        server['cache_hits'] += 1
+    elif quick_move(state) is None:
+        move = None  # Nothing to search: the game is lost
+    else:
+        future = asyncio.get_running_loop().create_future()
+        await server['queue'].put((backend, goal_rank, state, deadline, future))
+        try:
+            move = await asyncio.wait_for(asyncio.shield(future), max(0.0, deadline - time.perf_counter()))
+        except asyncio.TimeoutError:
+            move = quick_move(state)
+            reply['timed_out'] = True
+            server['timed_out'] += 1
+
+    reply['move'] = move
+    reply['latency_ms'] = (time.perf_counter() - received) * 1000
+    server['requests'] += 1
+    record_latency(server, reply['latency_ms'])
+    return reply
+
+
+async def run_batches(server):
+    '''
+    Takes queued requests a batch at a time, splits their boards across the pool's workers, and caches and
+    hands back the moves found.
+    '''
+    loop = asyncio.get_running_loop()
+    pool = server['pool']
+    while True:
+        batch = [await server['queue'].get()]
+        window_end = loop.time() + BATCH_WINDOW
+        while len(batch) < MAX_BATCH:
+            try:
+                batch.append(await asyncio.wait_for(server['queue'].get(), max(0.0, window_end - loop.time())))
+            except asyncio.TimeoutError:
+                break
+
+        # Requests for the same board, backend and goal share one search. Requests already out of time are
+        # left to time out in suggest.
+        now = time.perf_counter()
+        requests = {}
+        for backend, goal_rank, state, deadline, future in batch:
+            if deadline > now and not future.done():
+                requests.setdefault((backend, goal_rank, state), []).append((deadline, future))
+        if not requests:
+            continue
+        searches = list(requests)
+        chunks = []
+        chunk_rngs = iter(spawn_rngs(server['rng'], min(len(searches), server['processes'])))
+        for chunk in np.array_split(np.arange(len(searches)), min(len(searches), server['processes'])):
+            chunk = [searches[i] for i in chunk]
+            # A chunk shares the time left before its earliest deadline, as a wall clock time the worker
+            # checks itself, so a chunk that waits for a worker does not start its time over
+            deadline = min(deadline for search in chunk for deadline, _ in requests[search])
+            wall_deadline = time.time() + max(0.0, deadline - time.perf_counter()) * DEADLINE_MARGIN
+            chunks.append((chunk, loop.run_in_executor(pool, suggest_moves, chunk, wall_deadline, next(chunk_rngs))))
+        finishing = asyncio.ensure_future(_finish_batch(server, requests, chunks))
+        server['finishing'].add(finishing)
+        finishing.add_done_callback(server['finishing'].discard)
+
+
+async def _finish_batch(server, requests, chunks):
+    '''
+    Waits for a batch's searches, caching each move and answering every request for that board.
+    Searches a worker ran out of time for are left unanswered, to time out.
+    '''
+    for chunk, moves in chunks:
+        try:
+            moves = await moves
+        except Exception as e:
+            for search in chunk:
+                for _, future in requests[search]:
+                    if not future.done():
+                        future.set_exception(e)
+            continue
+        for (backend, goal_rank, state), move in zip(chunk, moves):
+            if move is not None:
+                cache_put(server, backend, goal_rank, state, move)
+            for _, future in requests[(backend, goal_rank, state)]:
+                if not future.done():
+                    future.set_result(move)
+
+
+async def handle_client(server, reader, writer):
+    '''
+    Reads a client's requests, one JSON object per line, answering each as soon as it is ready.
+    '''
+    lock = asyncio.Lock()
+
+    async def answer(line):
+        request = None
+        try:
+            request = json.loads(line)
+            reply = latency_report(server) if request.get('stats') else await suggest(server, request)
+        except Exception as e:
+            reply = {'id': request.get('id') if isinstance(request, dict) else None, 'error': str(e)}
+        async with lock:
+            writer.write((json.dumps(reply) + '\n').encode())
+            await writer.drain()
+
+    tasks = set()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip():
+                task = asyncio.ensure_future(answer(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        writer.close()
+
+
+async def serve(server, port=None, unix_path=None, host='127.0.0.1'):
+    '''
+    Runs the server until cancelled, on a Unix socket if unix_path is given, otherwise on a local TCP port.
+    '''
+    server['queue'] = asyncio.Queue()
+    # Start every worker now (each warms itself, see _warm_worker) rather than on the first requests
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*[loop.run_in_executor(server['pool'], time.sleep, 0.05)
+                           for _ in range(server['processes'])])
+    batches = asyncio.ensure_future(run_batches(server))
+
+    def connected(reader, writer):
+        return handle_client(server, reader, writer)
+
+    if unix_path is not None:
+        listener = await asyncio.start_unix_server(connected, path=unix_path)
+    else:
+        listener = await asyncio.start_server(connected, host, port)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        batches.cancel()
+        server['pool'].shutdown(cancel_futures=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve move suggestions over a local socket.")
+    parser.add_argument('--port', type=int, default=2048)
+    parser.add_argument('--unix', default=None, help="listen on this Unix socket instead of a TCP port")
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE)
+    parser.add_argument('--canonical', action='store_true', help="share cached moves between symmetric boards")
+    args = parser.parse_args()
+
+    server = new_server(args.processes, args.cache_size, args.canonical)
+    try:
+        asyncio.run(serve(server, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(latency_report(server)))
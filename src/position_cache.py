@@ -0,0 +1,241 @@
+import os
+import struct
+import sys
+import numpy as np
+from bitboard import canonical, transform_direction, untransform_direction, DIRECTIONS, DIRECTION_INDEX
+
+# Author: Caleb L'Italien
+# Last edited: 10/18/2026
+
+# A position cache kept on disk, so searches in other processes, and later runs, start from what earlier
+# ones worked out. The file is a header (see HEADER) followed by a fixed-size open-addressing table,
+# mapped into memory (see open_cache). Boards hash to a bucket of BUCKET_SLOTS slots; a slot is two
+# little-endian 64 bit words:
+#   check: the key (the packed board, or its canonical key) XORed with data
+#   data:  bits 0-31:  the value, as a 32 bit float
+#          bits 32-39: the depth (or effort) the value was found at
+#          bits 40-42: the best move, as 1 + an index into bitboard.DIRECTIONS (0 for none)
+#          bits 43-44: the bound (EXACT, LOWER or UPPER, as in minimax_search)
+#          bits 48-55: the tag: the kind of entry (A_STAR_HEURISTIC ...) << 4 | the goal's rank
+#          bits 56-63: the generation the entry was written in
+# Slots are written without locks. A reader only accepts a slot whose check XOR data gives back its key,
+# so a slot half written by another process reads as a miss, never as a wrong entry. Writers racing on
+# the same bucket can lose an entry, which only costs a search.
+# A full bucket makes room by replacing its least valuable entry: the shallowest, counting each generation
+# of age (see start_generation) as AGE_WEIGHT levels less deep. The same board is only replaced by a
+# result at least as deep.
+# A canonical cache keys boards by their symmetry class (see bitboard.canonical), for the kinds of entry
+# whose values are the same on every rotation and reflection of a board (SYMMETRIC_KINDS). Their moves
+# are stored turned to match the canonical board and turned back when read.
+
+CACHE_MAGIC = b'2048POSC'
+CACHE_VERSION = 1
+HEADER = np.dtype([('magic', 'S8'), ('version', '<u2'), ('canonical', '<u2'), ('bucket_bits', '<u4'),
+                   ('generation', '<u4'), ('reserved', '<u4', (3,))])
+BUCKET_SLOTS = 4
+SLOT_BYTES = 16
+DEFAULT_BUCKET_BITS = 20  # 2 ** 20 buckets of 4 slots, a 64 MB file (written to as it fills)
+DEFAULT_PATH = os.path.join("..", "cache", "positions.cache")
+
+# Kinds of entry (at most 15), so algorithms with different heuristics never read each other's values
+A_STAR_HEURISTIC, MINIMAX_MAX, MINIMAX_MIN, EXPECTIMAX, MONTE_CARLO = 1, 2, 3, 4, 5
+SYMMETRIC_KINDS = {EXPECTIMAX, MONTE_CARLO}
+EXACT, LOWER, UPPER = 0, 1, 2
+
+VALUE_MASK = 0xFFFFFFFF
+DEPTH_SHIFT = 32
+MOVE_SHIFT = 40
+BOUND_SHIFT = 43
+TAG_SHIFT = 48
+GENERATION_SHIFT = 56
+MAX_DEPTH = 0xFF
+AGE_WEIGHT = 4
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+WORD_MASK = (1 << 64) - 1
+FLOAT = struct.Struct('<f')
+
+_OPEN_CACHES = {}  # Path -> the cache opened for it by as_cache, kept open for the life of the process
+
+
+def open_cache(path=DEFAULT_PATH, bucket_bits=DEFAULT_BUCKET_BITS, canonical=None, readonly=False):
+    '''
+    Maps a position cache file into memory, making it (with 2 ** bucket_bits buckets) if it doesn't exist.
+    An existing file keeps its size. canonical is only needed to make a canonical cache; if given for an
+    existing file, it has to match how the file was made.
+    '''
+    if not os.path.exists(path):
+        _create_cache(path, bucket_bits, bool(canonical))
+    header = _read_header(path)
+    if canonical is not None and bool(header['canonical']) != canonical:
+        raise ValueError(f"{path} is {'' if header['canonical'] else 'not '}a canonical cache")
+    bucket_bits = int(header['bucket_bits'])
+    slots = BUCKET_SLOTS << bucket_bits
+    if os.path.getsize(path) != HEADER.itemsize + slots * SLOT_BYTES:
+        raise ValueError(f"{path} is not the size its header gives")
+    words = np.memmap(path, dtype='<u8', mode='r' if readonly else 'r+', offset=HEADER.itemsize,
+                      shape=(2 * slots,))
+    return {
+        'path': path,
+        'words': words,
+        # A memoryview reads and writes Python ints several times faster than indexing the array
+        'view': memoryview(words).cast('B').cast('Q') if sys.byteorder == 'little' else words,
+        'shift': 64 - bucket_bits,
+        'canonical': bool(header['canonical']),
+        'readonly': readonly,
+        'generation': int(header['generation']) & 0xFF,
+    }
+
+
+def _create_cache(path, bucket_bits, canonical):
+    '''
+    Writes an empty cache file. It is made under a temporary name and linked into place, so processes
+    opening the same new cache at once all map one complete file.
+    '''
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    header = np.zeros(1, dtype=HEADER)
+    header['magic'], header['version'] = CACHE_MAGIC, CACHE_VERSION
+    header['canonical'], header['bucket_bits'] = canonical, bucket_bits
+    with open(temporary, 'wb') as file:
+        header.tofile(file)
+        file.truncate(HEADER.itemsize + (BUCKET_SLOTS << bucket_bits) * SLOT_BYTES)  # Zeroed: every slot empty
+    try:
+        os.link(temporary, path)
+    except FileExistsError:
+        pass  # Another process made it first
+    finally:
+        os.remove(temporary)
+
+
+def _read_header(path):
+    '''
+    Reads and checks the header of a cache file.
+    '''
+    header = np.fromfile(path, dtype=HEADER, count=1)
+    if header.size == 0 or header['magic'][0] != CACHE_MAGIC:
+        raise ValueError(f"{path} is not a position cache")
+    if header['version'][0] != CACHE_VERSION:
+        raise ValueError(f"{path} is cache version {header['version'][0]}, not {CACHE_VERSION}")
+    return header[0]
+
+
+def as_cache(position_cache):
+    '''
+    Returns an open cache for a cache or the path of one (opened once per process, so every search in a
+    pool worker shares the mapping), or None for None.
+    '''
+    if position_cache is None or isinstance(position_cache, dict):
+        return position_cache
+    cache = _OPEN_CACHES.get(position_cache)
+    if cache is None:
+        cache = _OPEN_CACHES[position_cache] = open_cache(position_cache)
+    return cache
+
+
+def start_generation(cache):
+    '''
+    Starts a new generation of entries, so entries from earlier runs are the first replaced.
+    Call it once per run (not per worker).
+    '''
+    header = np.memmap(cache['path'], dtype=HEADER, mode='r+', shape=(1,))
+    header['generation'] += 1
+    cache['generation'] = int(header['generation'][0]) & 0xFF
+    header.flush()
+    del header
+
+
+def close_cache(cache):
+    '''
+    Flushes a cache's entries to its file and unmaps it.
+    '''
+    if isinstance(cache['view'], memoryview):
+        cache['view'].release()
+    if not cache['readonly']:
+        cache['words'].flush()
+    cache['view'] = cache['words'] = None
+    if _OPEN_CACHES.get(cache['path']) is cache:
+        del _OPEN_CACHES[cache['path']]
+
+
+def _key(cache, kind, state):
+    '''
+    Returns the key a board is stored under and the symmetry turning the board into it.
+    '''
+    if cache['canonical'] and kind in SYMMETRIC_KINDS:
+        return canonical(int(state))
+    return int(state), 0
+
+
+def _first_word(cache, key, tag):
+    '''
+    Returns the index of the first word of a key's bucket. The tag is mixed in, so a board's entries of
+    different kinds and goals fall in different buckets.
+    '''
+    return ((((key ^ (tag << TAG_SHIFT)) * HASH_MULTIPLIER) & WORD_MASK) >> cache['shift']) * (2 * BUCKET_SLOTS)
+
+
+def cache_lookup(cache, kind, goal_rank, state):
+    '''
+    Returns the entry for a board as (value, depth, best move, bound), or None if there isn't one.
+    goal_rank is 0 for kinds whose values do not depend on the goal.
+    '''
+    key, t = _key(cache, kind, state)
+    tag = kind << 4 | goal_rank
+    view = cache['view']
+    # The bucket (see _first_word), worked out here since lookups are the hot path
+    first = ((((key ^ (tag << TAG_SHIFT)) * HASH_MULTIPLIER) & WORD_MASK) >> cache['shift']) * (2 * BUCKET_SLOTS)
+    for word in range(first, first + 2 * BUCKET_SLOTS, 2):
+        data = view[word + 1]
+        if data == 0:
+            return None  # Buckets fill in order and slots are never emptied, so the board isn't further on
+        if (data >> TAG_SHIFT) & 0xFF == tag and view[word] ^ data == key:
+            move = (data >> MOVE_SHIFT) & 0x7
+            return (FLOAT.unpack((data & VALUE_MASK).to_bytes(4, 'little'))[0], (data >> DEPTH_SHIFT) & MAX_DEPTH,
+                    untransform_direction(DIRECTIONS[move - 1], t) if move else None, (data >> BOUND_SHIFT) & 0x3)
+    return None
+
+
+def cache_store(cache, kind, goal_rank, state, value, depth=0, move=None, bound=EXACT):
+    '''
+    Stores the value (and best move) found for a board at some depth, unless the board is already stored
+    at a greater depth. Does nothing for a cache opened read only.
+    '''
+    if cache['readonly']:
+        return
+    key, t = _key(cache, kind, state)
+    tag = kind << 4 | goal_rank
+    depth = min(depth, MAX_DEPTH)
+    generation = cache['generation']
+    data = int.from_bytes(FLOAT.pack(value), 'little') | depth << DEPTH_SHIFT | bound << BOUND_SHIFT | \
+        tag << TAG_SHIFT | generation << GENERATION_SHIFT
+    if move is not None:
+        data |= (DIRECTION_INDEX[transform_direction(move, t)] + 1) << MOVE_SHIFT
+
+    view = cache['view']
+    first = _first_word(cache, key, tag)
+    victim, victim_worth = None, None
+    for word in range(first, first + 2 * BUCKET_SLOTS, 2):
+        old = view[word + 1]
+        if old == 0:
+            victim = word
+            break
+        if (old >> TAG_SHIFT) & 0xFF == tag and view[word] ^ old == key:
+            if depth < (old >> DEPTH_SHIFT) & MAX_DEPTH:
+                return
+            victim = word
+            break
+        worth = ((old >> DEPTH_SHIFT) & MAX_DEPTH) - AGE_WEIGHT * ((generation - (old >> GENERATION_SHIFT)) & 0xFF)
+        if victim is None or worth < victim_worth:
+            victim, victim_worth = word, worth
+    view[victim] = key ^ data
+    view[victim + 1] = data
+
+
+def cache_usage(cache):
+    '''
+    Returns the fraction of the cache's slots in use.
+    '''
+    data = cache['words'][1::2]
+    return np.count_nonzero(data) / data.size
@@ -0,0 +1,64 @@
+import csv
+import json
+import os
+from game_2048 import path_states
+from game_trace import open_trace, trace_append, trace_close
+
+# Author: Caleb L'Italien
+# Last edited: 10/18/2026
+
+# Places to stream run results to, picked by file extension:
+#   .jsonl: one JSON object per run, with its path as [state, direction] pairs of compressed boards
+#   .csv:   one row per run, without the path (the columns are taken from the first run written)
+#   .trc:   the game itself, as a binary trace (see game_trace.py)
+# Runs are appended, so results from many runs (or many invocations) collect in one file. Files are written
+# through a large buffer and nothing is formatted for reading, so writing a run costs little.
+# A sink is a dict (see open_sink), used through sink_write and sink_close.
+
+SINK_BUFFER = 1 << 16
+SINK_FORMATS = {'.jsonl': 'jsonl', '.csv': 'csv', '.trc': 'trace'}
+
+
+def open_sink(path):
+    '''
+    Opens a file to append run results to, in the format its extension names.
+    '''
+    sink_format = SINK_FORMATS.get(os.path.splitext(path)[1])
+    if sink_format is None:
+        raise ValueError(f"{path} is not a {', '.join(SINK_FORMATS)} file")
+    if sink_format == 'trace':
+        return {'format': sink_format, 'trace': open_trace(path)}
+    write_header = sink_format == 'csv' and (not os.path.exists(path) or os.path.getsize(path) == 0)
+    file = open(path, 'a', newline='' if sink_format == 'csv' else None, buffering=SINK_BUFFER)
+    return {'format': sink_format, 'file': file, 'writer': None, 'write_header': write_header}
+
+
+def sink_write(sink, record, path=None):
+    '''
+    Appends a run to a sink. record is a dict of plain values (its 'start' is the compressed starting board),
+    and path the run's path (in the form of game_2048.reconstruct_path), if there is one.
+    '''
+    if sink['format'] == 'trace':
+        if path is not None:
+            states = path_states(record['start'], path)
+            trace_append(sink['trace'], states, [direction for _, direction in path])
+    elif sink['format'] == 'jsonl':
+        row = dict(record)
+        row['path'] = None if path is None else [[int(state), direction] for state, direction in path]
+        sink['file'].write(json.dumps(row) + '\n')
+    else:
+        if sink['writer'] is None:
+            sink['writer'] = csv.DictWriter(sink['file'], fieldnames=list(record), extrasaction='ignore')
+            if sink['write_header']:
+                sink['writer'].writeheader()
+        sink['writer'].writerow(record)
+
+
+def sink_close(sink):
+    '''
+    Flushes and closes a sink.
+    '''
+    if sink['format'] == 'trace':
+        trace_close(sink['trace'])
+    else:
+        sink['file'].close()
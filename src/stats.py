@@ -0,0 +1,143 @@
+import cProfile
+import io
+import pstats
+import time
+from contextlib import contextmanager
+
+# Author: Caleb L'Italien
+# Last edited: 10/18/2026
+
+# Per-search instrumentation. A stats dict (see new_stats) is made by the caller and passed down through
+# a search, so runs in the same process (or in worker processes, see export_stats and merge_stats) never
+# share counts. It holds:
+#   counters: boards made, nodes expanded and generated, heuristic evaluations, cache and table hits, and
+#             hits in the on-disk position cache (see position_cache.py)
+#   peak_frontier: the largest open list, layer or tree the search held
+#   times: seconds spent moving boards, in the heuristic, and in everything else (bookkeeping)
+#   hooks: optional callbacks, called as hook(stats, *args) when a search fires that event ('expand')
+# Timing each call costs a little, so it is off unless asked for.
+
+COUNTERS = ['boards', 'expanded', 'generated', 'heuristic_evals', 'cache_hits', 'table_hits', 'position_hits']
+TIMES = ['move', 'heuristic', 'bookkeeping', 'total']
+
+
+def new_stats(timing=False, hooks=None):
+    '''
+    Makes an empty stats dict. With timing set, move and heuristic calls made through timed are timed.
+    hooks maps event names to callbacks.
+    '''
+    stats = {name: 0 for name in COUNTERS}
+    stats['peak_frontier'] = 0
+    stats['times'] = {name: 0.0 for name in TIMES}
+    stats['timing'] = timing
+    stats['hooks'] = hooks or {}
+    stats['profile'] = None
+    return stats
+
+
+def timed(stats, name, function, *args):
+    '''
+    Calls function(*args), adding the time it took to stats['times'][name] if timing is on.
+    '''
+    if not stats['timing']:
+        return function(*args)
+    started = time.perf_counter()
+    result = function(*args)
+    stats['times'][name] += time.perf_counter() - started
+    return result
+
+
+def note_frontier(stats, size):
+    '''
+    Records the size of a search's frontier, keeping the largest seen.
+    '''
+    if size > stats['peak_frontier']:
+        stats['peak_frontier'] = size
+
+
+def fire(stats, event, *args):
+    '''
+    Calls the hook for an event, if there is one.
+    '''
+    hook = stats['hooks'].get(event)
+    if hook is not None:
+        hook(stats, *args)
+
+
+@contextmanager
+def section(stats, name='total'):
+    '''
+    Times a block of code into stats['times'][name]. Timing a whole search as 'total' also credits
+    the time not spent moving boards or in the heuristic to bookkeeping.
+    '''
+    times = stats['times']
+    started = time.perf_counter()
+    before = times['move'] + times['heuristic']
+    try:
+        yield stats
+    finally:
+        elapsed = time.perf_counter() - started
+        times[name] += elapsed
+        if name == 'total' and stats['timing']:
+            # Worker times are merged in too, and can add up to more than the time that passed here
+            times['bookkeeping'] += max(0.0, elapsed - (times['move'] + times['heuristic'] - before))
+
+
+@contextmanager
+def profiled(stats, limit=25):
+    '''
+    Runs a block of code under cProfile, saving the top limit functions by cumulative time as text
+    in stats['profile'].
+    '''
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield stats
+    finally:
+        profiler.disable()
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(limit)
+        stats['profile'] = output.getvalue()
+
+
+def export_stats(stats):
+    '''
+    Returns the counts and times of a stats dict without its hooks, so a worker process can send it back.
+    '''
+    exported = {name: stats[name] for name in COUNTERS}
+    exported['peak_frontier'] = stats['peak_frontier']
+    exported['times'] = dict(stats['times'])
+    return exported
+
+
+def merge_stats(stats, other):
+    '''
+    Adds the counts and times of other (a stats dict or an exported one) into stats. Peak frontiers
+    are summed, since worker frontiers are held at the same time.
+    '''
+    for name in COUNTERS:
+        stats[name] += other[name]
+    stats['peak_frontier'] += other['peak_frontier']
+    for name in TIMES:
+        stats['times'][name] += other['times'][name]
+    return stats
+
+
+def format_stats(stats):
+    '''
+    Returns the stats as printable lines.
+    '''
+    lines = [f"Number of boards made: {stats['boards']}",
+             f"Nodes expanded: {stats['expanded']}",
+             f"Nodes generated: {stats['generated']}",
+             f"Heuristic evaluations: {stats['heuristic_evals']}",
+             f"Cache hits: {stats['cache_hits']}",
+             f"Transposition table hits: {stats['table_hits']}",
+             f"Position cache hits: {stats['position_hits']}",
+             f"Peak frontier size: {stats['peak_frontier']}"]
+    times = stats['times']
+    if stats.get('timing'):
+        lines.append(f"Time moving boards: {times['move']:.2f} seconds")
+        lines.append(f"Time in heuristic: {times['heuristic']:.2f} seconds")
+        lines.append(f"Time in bookkeeping: {times['bookkeeping']:.2f} seconds")
+    return lines
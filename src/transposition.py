@@ -0,0 +1,188 @@
+import numpy as np
+from bitboard import canonical_key
+
+# Author: Caleb L'Italien
+# Last edited: 10/18/2026
+
+# Compact state bookkeeping for searches that need a parent pointer and a cost for every board.
+# A table is a dict of NumPy arrays instead of three Python containers keyed by Python ints:
+#   keys:  packed board of each entry, in insertion order
+#   costs: moves taken to reach the entry
+#   links: parent entry << 2 | direction index (NO_PARENT for the start board)
+#   index: open-addressing hash index (linear probing) holding entry numbers, -1 when empty
+# Entries never move, so parent links stay valid when the index is rebuilt to grow.
+# That is 20 bytes per entry plus 4 bytes per index slot (kept at most half full).
+# A canonical table keys boards by their symmetry class (see bitboard.canonical), so the 8 rotations and
+# reflections of a board share one entry. It also keeps the actual board of each entry in states, so
+# paths are made of the boards that were really played (8 more bytes per entry).
+
+DIRECTIONS = ['up', 'down', 'left', 'right']
+NO_PARENT = (1 << 62) - 1
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15  # Fibonacci hashing spreads nearby boards across the index
+MAX_LOAD = 0.5
+BYTES_PER_ENTRY = 8 + 4 + 8
+BYTES_PER_SLOT = 4
+
+
+def new_table(capacity=1 << 16, max_bytes=None, canonical=False):
+    '''
+    Makes an empty table with room for capacity entries before it has to grow.
+    If max_bytes is set, inserting past that much memory raises MemoryError instead of growing.
+    If canonical is set, symmetric copies of a board are treated as the same board.
+    '''
+    capacity = max(capacity, 16)
+    index_bits = max(4, int(np.ceil(np.log2(capacity / MAX_LOAD))))
+    table = {
+        'keys': np.zeros(capacity, dtype=np.uint64),
+        'costs': np.zeros(capacity, dtype=np.uint32),
+        'links': np.zeros(capacity, dtype=np.uint64),
+        'index': np.full(1 << index_bits, -1, dtype=np.int32),
+        'index_bits': index_bits,
+        'count': 0,
+        'max_bytes': max_bytes,
+        'canonical': canonical,
+    }
+    if canonical:
+        table['states'] = np.zeros(capacity, dtype=np.uint64)
+    _check_memory(table, capacity, 1 << index_bits)
+    return table
+
+
+def table_bytes(table):
+    '''
+    Returns the memory used by the table's arrays.
+    '''
+    return sum(table[name].nbytes for name in _entry_arrays(table)) + table['index'].nbytes
+
+
+def _entry_arrays(table):
+    '''
+    Returns the names of the arrays that hold one value per entry.
+    '''
+    return ['keys', 'costs', 'links', 'states'] if table['canonical'] else ['keys', 'costs', 'links']
+
+
+def _check_memory(table, capacity, slots):
+    '''
+    Raises MemoryError if a table of this size would go over its memory cap.
+    '''
+    entry_bytes = BYTES_PER_ENTRY + 8 if table['canonical'] else BYTES_PER_ENTRY
+    if table['max_bytes'] is not None and capacity * entry_bytes + slots * BYTES_PER_SLOT > table['max_bytes']:
+        raise MemoryError(f"Transposition table would exceed {table['max_bytes']} bytes")
+
+
+def _slot(key, index_bits):
+    '''
+    Returns the home slot of a key in an index of 2 ** index_bits slots.
+    '''
+    return ((key * HASH_MULTIPLIER) & 0xFFFFFFFFFFFFFFFF) >> (64 - index_bits)
+
+
+def table_find(table, key):
+    '''
+    Returns the entry number of a board, or -1 if it isn't in the table.
+    '''
+    if table['canonical']:
+        key = canonical_key(key)
+    index, keys = table['index'], table['keys']
+    mask = index.shape[0] - 1
+    slot = _slot(key, table['index_bits'])
+    while True:
+        entry = index[slot]
+        if entry < 0:
+            return -1
+        if keys[entry] == key:
+            return int(entry)
+        slot = (slot + 1) & mask
+
+
+def table_insert(table, key, cost, parent=None, direction=None):
+    '''
+    Adds a board that isn't in the table yet, reached from the parent entry by moving in direction.
+    Returns its entry number.
+    '''
+    count = table['count']
+    if count == table['keys'].shape[0]:
+        _grow_entries(table)
+    if count + 1 > MAX_LOAD * table['index'].shape[0]:
+        _grow_index(table)
+
+    if table['canonical']:
+        table['states'][count] = key
+        key = canonical_key(key)
+    table['keys'][count] = key
+    table['costs'][count] = cost
+    table['links'][count] = NO_PARENT << 2 if parent is None else (parent << 2) | DIRECTIONS.index(direction)
+    table['count'] = count + 1
+
+    index = table['index']
+    mask = index.shape[0] - 1
+    slot = _slot(key, table['index_bits'])
+    while index[slot] >= 0:
+        slot = (slot + 1) & mask
+    index[slot] = count
+    return count
+
+
+def table_update(table, entry, cost, parent, direction):
+    '''
+    Records a cheaper way of reaching an entry.
+    '''
+    table['costs'][entry] = cost
+    table['links'][entry] = (parent << 2) | DIRECTIONS.index(direction)
+
+
+def table_cost(table, entry):
+    '''
+    Returns the cost of reaching an entry.
+    '''
+    return int(table['costs'][entry])
+
+
+def table_key(table, entry):
+    '''
+    Returns the packed board stored in an entry.
+    '''
+    if table['canonical']:
+        return int(table['states'][entry])
+    return int(table['keys'][entry])
+
+
+def table_parent(table, entry):
+    '''
+    Returns the parent entry and the direction moved from it, or (None, None) for the start board.
+    '''
+    link = int(table['links'][entry])
+    parent = link >> 2
+    if parent == NO_PARENT:
+        return None, None
+    return parent, DIRECTIONS[link & 3]
+
+
+def _grow_entries(table):
+    '''
+    Doubles the entry arrays.
+    '''
+    capacity = table['keys'].shape[0] * 2
+    _check_memory(table, capacity, table['index'].shape[0])
+    for name in _entry_arrays(table):
+        grown = np.zeros(capacity, dtype=table[name].dtype)
+        grown[:table['count']] = table[name][:table['count']]
+        table[name] = grown
+
+
+def _grow_index(table):
+    '''
+    Doubles the hash index and reinserts every entry into it.
+    '''
+    index_bits = table['index_bits'] + 1
+    _check_memory(table, table['keys'].shape[0], 1 << index_bits)
+    index = np.full(1 << index_bits, -1, dtype=np.int32)
+    mask = index.shape[0] - 1
+    for entry, key in enumerate(table['keys'][:table['count']].tolist()):
+        slot = _slot(key, index_bits)
+        while index[slot] >= 0:
+            slot = (slot + 1) & mask
+        index[slot] = entry
+    table['index'] = index
+    table['index_bits'] = index_bits